@@ -0,0 +1,174 @@
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+
+import config
+from models import DEFAULT_PRODUCT_ID, DailyFetcher, Exporter
+from models.adaptive_sampler import AdaptiveSampler
+from models.analysis import Analysis
+from models.batch_runner import BatchJob, run_batch
+from models.daily_runner import fetch_daily_series
+from models.daily_store import DailySeriesStore
+from models.export_pipeline import atomic_output
+from models.fetcher_session import create_fetcher, fetcher_class
+from models.model_fit import ModelFit
+from models.snapshot import save_snapshot
+from models.tracing import tracer
+
+
+def create_exporter(export_format: str) -> Exporter:
+    if export_format == "parquet":
+        from models.exporters import ParquetExporter
+        return ParquetExporter()
+    if export_format in ("csv.gz", "csv.zst"):
+        from models.exporters import CompressedCsvExporter
+        return CompressedCsvExporter(compression="gzip" if export_format == "csv.gz" else "zstd")
+    from models.exporters import CsvExporter
+    return CsvExporter()
+
+
+def write_fit_table(fit: ModelFit, path: str) -> str:
+    with atomic_output(path) as temp_path:
+        with open(temp_path, 'w', encoding='utf-8', newline='') as fit_file:
+            writer = csv.writer(fit_file, delimiter="\t")
+            writer.writerow(["Город", "Показатель", "Направление", "Год", "Месяц", "Точек", "Θ1", "Θ2", "RMSE",
+                             "Θ1 нижн.", "Θ1 верхн.", "Θ2 нижн.", "Θ2 верхн."])
+            for index, (city_id, bearing, year, month, product) in enumerate(fit.keys):
+                intervals = [] if fit.theta1_ci is None else [*fit.theta1_ci[index], *fit.theta2_ci[index]]
+                writer.writerow([city_id, product, config.BEARINGS.get(bearing, bearing), year, month,
+                                 int(fit.points[index]), fit.theta1[index], fit.theta2[index], fit.rmse[index],
+                                 *intervals])
+    return path
+
+
+def write_daily_table(store: DailySeriesStore, city_ids: list[str], path: str, column: str) -> tuple[str, int]:
+    rows = 0
+    with atomic_output(path) as temp_path:
+        with open(temp_path, 'w', encoding='utf-8', newline='') as daily_file:
+            writer = csv.writer(daily_file, delimiter="\t")
+            writer.writerow(["Город", "Направление", "Расстояние", "Дата", column])
+            # Written point by point, so memory stays bounded by one series
+            for city_id in city_ids:
+                for (_, bearing, distance), days, values in store.iter_series(city_id):
+                    writer.writerows(zip([city_id] * len(days), [config.BEARINGS.get(bearing, bearing)] * len(days),
+                                         [distance] * len(days), days.astype(str).tolist(), values.tolist()))
+                    rows += len(days)
+    return path, rows
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Пакетный анализ NO2 и других продуктов Sentinel-5P "
+                                                 "без графического интерфейса.")
+    parser.add_argument("--cities", nargs="+", choices=list(config.CITIES), default=list(config.CITIES),
+                        help="Идентификаторы городов (по умолчанию все).")
+    parser.add_argument("--months", nargs="+", type=int, choices=list(config.MONTHS),
+                        default=[config.MONTH_TO_ANALYZE], help="Номера месяцев.")
+    parser.add_argument("--all-months", action="store_true",
+                        help="Все месяцы каждого города одним запросом (вместо --months).")
+    parser.add_argument("--years", nargs="+", type=int, default=config.YEARS_TO_ANALYZE,
+                        help="Годы анализа (по умолчанию из config.YEARS_TO_ANALYZE).")
+    parser.add_argument("--bearings", nargs="+", type=int, choices=list(config.BEARINGS),
+                        default=list(config.BEARINGS), help="Направления в градусах (по умолчанию все).")
+    parser.add_argument("--products", nargs="+", choices=list(config.PRODUCTS), default=[DEFAULT_PRODUCT_ID],
+                        help="Показатели; все выбранные запрашиваются вместе, одним запросом на пакет "
+                             f"(по умолчанию {DEFAULT_PRODUCT_ID}).")
+    parser.add_argument("--daily", action="store_true",
+                        help="Ежедневные ряды (среднее по орбитам за день) вместо месячных средних; "
+                             f"данные дописываются в хранилище {config.DAILY_STORE_FOLDER}.")
+    parser.add_argument("--step", type=int, default=10, help="Шаг по расстоянию, км.")
+    parser.add_argument("--max-distance", type=int, default=200, help="Максимальное расстояние, км.")
+    parser.add_argument("--adaptive", action="store_true",
+                        help=f"Адаптивный шаг: начать с --step и дробить его до {config.ADAPTIVE_MIN_STEP_KM} км "
+                             "там, где профиль меняется быстро.")
+    parser.add_argument("--fetcher", choices=["gee", "local", "synthetic"], default="gee", help="Источник данных.")
+    parser.add_argument("--no-cache", action="store_true", help="Не использовать кэш выборок.")
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию по числу ядер).")
+    parser.add_argument("--no-export", action="store_true", help="Не экспортировать результаты.")
+    parser.add_argument("--fit", action="store_true", help="Подобрать модель Θ1/r + Θ2 для всех маршрутов.")
+    parser.add_argument("--export-format", choices=["csv", "csv.gz", "csv.zst", "parquet"], default="csv",
+                        help="Формат экспорта.")
+    parser.add_argument("--log-level", default=config.BATCH_LOG_LEVEL,
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="Уровень журналирования.")
+    parser.add_argument("--snapshot", metavar="PATH",
+                        help="Сохранить снимок сессии (открывается в графическом интерфейсе без повторной загрузки).")
+    parser.add_argument("--trace", metavar="PATH", help="Записать трассировку в формате Chrome trace (JSON).")
+    parser.add_argument("--metrics", metavar="PATH", help="Записать гистограммы задержек и счётчики (JSON).")
+    args = parser.parse_args(argv)
+    if args.daily and not issubclass(fetcher_class(args.fetcher), DailyFetcher):
+        parser.error(f"источник «{args.fetcher}» не поддерживает ежедневные ряды (--daily); "
+                     "используйте gee или synthetic.")
+    return args
+
+
+def write_trace_outputs(args: argparse.Namespace):
+    tracer.log_summary()
+    if args.trace:
+        tracer.write_chrome_trace(args.trace)
+    if args.metrics:
+        tracer.write_json(args.metrics)
+
+
+def run_daily(args: argparse.Namespace, distances: list[int]) -> int:
+    fetcher = create_fetcher(args.fetcher, use_cache=not args.no_cache)
+    for product in args.products:
+        store = DailySeriesStore(os.path.join(config.DAILY_STORE_FOLDER, product))
+        for city_id in args.cities:
+            report = fetch_daily_series(store, config.CITIES[city_id], args.bearings, distances, args.years, fetcher,
+                                        product=product)
+            print(f"Daily {product} series for {city_id} finished: {report.summary()}")
+
+        if not args.no_export:
+            export_started_at = time.perf_counter()
+            path, rows = write_daily_table(store, args.cities,
+                                           os.path.join(config.EXPORTS_FOLDER, f"daily_{product}.csv"),
+                                           config.PRODUCTS[product].column)
+            print(f"Daily table of {rows} rows written to {path} in {time.perf_counter() - export_started_at:.1f} s.")
+
+    write_trace_outputs(args)
+    return 0
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    tracer.recording = bool(args.trace)
+    distances = list(range(args.step, args.max_distance + 1, args.step))
+    months = [None] if args.all_months else args.months
+    sampler = AdaptiveSampler(initial_step_km=args.step) if args.adaptive else None
+    jobs = [BatchJob(city_id=city_id, month=month, bearings=args.bearings, distances=distances, sampler=sampler,
+                     years=args.years, products=args.products)
+            for city_id in args.cities for month in months]
+
+    if args.daily:
+        return run_daily(args, distances)
+
+    analysis = Analysis()
+    report = run_batch(analysis, jobs, fetcher_name=args.fetcher, use_cache=not args.no_cache,
+                       max_workers=args.workers)
+    print(f"Analysis finished: {report.summary()}")
+
+    if not args.no_export:
+        os.makedirs(config.EXPORTS_FOLDER, exist_ok=True)
+        export_started_at = time.perf_counter()
+        analysis.export_all_loaded_data(create_exporter(args.export_format))
+        print(f"Export finished in {time.perf_counter() - export_started_at:.1f} s.")
+
+    if args.fit:
+        fit_started_at = time.perf_counter()
+        fit = analysis.fit_loaded_routes()
+        path = write_fit_table(fit, os.path.join(config.EXPORTS_FOLDER, "theta_fit.csv"))
+        print(f"Model fit for {len(fit.keys)} routes written to {path} in {time.perf_counter() - fit_started_at:.1f} s.")
+
+    if args.snapshot:
+        info = save_snapshot(analysis, args.snapshot)
+        print(f"Session snapshot of {info.routes} routes written to {info.path}.")
+
+    write_trace_outputs(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
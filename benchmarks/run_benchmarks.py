@@ -0,0 +1,265 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Iterator
+
+import numpy as np
+
+import config
+from models import City
+from models.analysis import Analysis
+from models.export_pipeline import atomic_output
+from models.fetchers import SyntheticFetcher
+from models.routes import MonthlyDataRoute
+from models.tracing import tracer
+
+BASE_SCENARIO = {'cities': 1, 'bearings': 8, 'distances': 20, 'years': 6}
+SWEEPS = {
+    'cities': [1, 4, 16],
+    'bearings': [1, 4, 8],
+    'distances': [20, 50, 100],
+    'years': [6, 12, 24]
+}
+QUICK_SWEEPS = {
+    'cities': [1, 4],
+    'bearings': [1, 8],
+    'distances': [20, 50],
+    'years': [6, 12]
+}
+MAX_DISTANCE_KM = 200
+
+
+@dataclass(frozen=True)
+class Scenario:
+    cities: int
+    bearings: int
+    distances: int
+    years: int
+
+    @property
+    def routes(self) -> int:
+        return self.cities * self.bearings * self.years
+
+    @property
+    def samples(self) -> int:
+        return self.routes * self.distances
+
+
+@dataclass
+class BenchmarkResult:
+    benchmark: str
+    scenario: Scenario
+    best_s: float
+    median_s: float
+    repeats: int
+
+    def key(self) -> str:
+        scenario = self.scenario
+        return (f"{self.benchmark}[cities={scenario.cities},bearings={scenario.bearings},"
+                f"distances={scenario.distances},years={scenario.years}]")
+
+
+def scenarios(sweeps: dict[str, list[int]]) -> list[Scenario]:
+    unique = {}
+    for dimension, values in sweeps.items():
+        for value in values:
+            scenario = Scenario(**{**BASE_SCENARIO, dimension: value})
+            unique[scenario] = None
+    return list(unique)
+
+
+@contextmanager
+def analyzed_years(years: int) -> Iterator[None]:
+    original = config.YEARS_TO_ANALYZE
+    config.YEARS_TO_ANALYZE = list(range(original[0], original[0] + years))
+    try:
+        yield
+    finally:
+        config.YEARS_TO_ANALYZE = original
+
+
+def measure(function: Callable[[], Any], repeats: int, setup: Callable[[], Any] | None = None) -> list[float]:
+    timings = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        started_at = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started_at)
+    return timings
+
+
+def run_analysis(scenario: Scenario, fetcher: SyntheticFetcher) -> Analysis:
+    analysis = Analysis()
+    bearings = list(config.BEARINGS)[:scenario.bearings]
+    distances = np.linspace(MAX_DISTANCE_KM / scenario.distances, MAX_DISTANCE_KM, scenario.distances)
+    distances = sorted({max(1, round(distance)) for distance in distances.tolist()})
+    for template in list(config.CITIES.values())[:scenario.cities]:
+        city = City(id=template.id, name=template.name, coordinates=template.coordinates, routes=[])
+        analysis.run(city, bearings, config.MONTH_TO_ANALYZE, distances, fetcher, None)
+    return analysis
+
+
+def city_records(city: City) -> list[dict[str, Any]]:
+    records = []
+    for route in city.routes:
+        if not isinstance(route, MonthlyDataRoute):
+            continue
+        distances, densities = route.densities.valid_arrays()
+        records.extend({
+            'city_id': city.id,
+            'city_name': city.name,
+            'year': route.year,
+            'month': route.month,
+            'bearing': route.bearing,
+            'distance': distance,
+            'product': route.product,
+            'value': density
+        } for distance, density in zip(distances.tolist(), densities.tolist()))
+    return records
+
+
+def load_main_window() -> tuple[Any, Any]:
+    try:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PySide6.QtWidgets import QApplication
+        from views.main_window import MainWindow
+    except ImportError:
+        logging.warning("PySide6 is not available, update_data_tree is not measured.")
+        return None, None
+    return QApplication.instance() or QApplication([]), MainWindow
+
+
+def run_scenario(scenario: Scenario, fetcher: SyntheticFetcher, repeats: int, main_window_class) \
+        -> list[BenchmarkResult]:
+    results = []
+
+    def record(benchmark: str, timings: list[float]):
+        results.append(BenchmarkResult(benchmark=benchmark, scenario=scenario, best_s=min(timings),
+                                       median_s=statistics.median(timings), repeats=len(timings)))
+
+    with analyzed_years(scenario.years):
+        analyses: list[Analysis] = []
+        record("Analysis.run", measure(lambda: analyses.append(run_analysis(scenario, fetcher)), repeats))
+        analysis = analyses[-1]
+
+        with tempfile.TemporaryDirectory() as folder:
+            from models.exporters import CsvExporter
+
+            exporter = CsvExporter(folder=folder)
+            record("Analysis.export_all_loaded_data",
+                   measure(lambda: analysis.export_all_loaded_data(exporter, max_workers=1), repeats))
+
+            city = next(iter(analysis.cities.values()))
+            records = city_records(city)
+            record("CsvExporter.export", measure(lambda: exporter.export(city, records), repeats))
+
+        if main_window_class is not None:
+            windows = []
+            record("MainWindow.update_data_tree",
+                   measure(lambda: windows[-1].update_data_tree(analysis.cities), repeats,
+                           setup=lambda: windows.append(main_window_class())))
+            for window in windows:
+                window.deleteLater()
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(results: list[BenchmarkResult], path: str, settings: dict[str, Any]) -> str:
+    document = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': git_revision(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__
+        },
+        'settings': settings,
+        'results': [{'key': result.key(), **asdict(result)} for result in results],
+        'spans': tracer.summary()
+    }
+    with atomic_output(path) as temp_path:
+        with open(temp_path, 'w', encoding='utf-8') as output:
+            json.dump(document, output, ensure_ascii=False, indent=2)
+    return path
+
+
+def compare(results: list[BenchmarkResult], baseline_path: str, threshold: float) -> list[str]:
+    with open(baseline_path, encoding='utf-8') as baseline_file:
+        baseline = {entry['key']: entry for entry in json.load(baseline_file)['results']}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result.key())
+        if previous is None or previous['best_s'] <= 0:
+            continue
+        ratio = result.best_s / previous['best_s']
+        marker = ""
+        if ratio > threshold:
+            marker = "  <-- регрессия"
+            regressions.append(result.key())
+        print(f"{result.key():<90} {previous['best_s'] * 1000:9.2f} -> {result.best_s * 1000:9.2f} ms "
+              f"(x{ratio:.2f}){marker}")
+    return regressions
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Замеры производительности на синтетических данных NO2.")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results.json"),
+                        help="Файл для записи результатов (JSON).")
+    parser.add_argument("--baseline", help="Файл базовых результатов для сравнения.")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Допустимое замедление относительно базовых результатов.")
+    parser.add_argument("--repeats", type=int, default=3, help="Число повторов каждого замера.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Имитируемая задержка запроса, с.")
+    parser.add_argument("--quick", action="store_true", help="Сокращённый набор сценариев.")
+    parser.add_argument("--no-ui", action="store_true", help="Не замерять обновление дерева данных.")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=config.BATCH_LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    fetcher = SyntheticFetcher(latency_s=args.latency)
+    # The QApplication must stay referenced for as long as windows are created
+    application, main_window_class = (None, None) if args.no_ui else load_main_window()
+
+    results = []
+    for scenario in scenarios(QUICK_SWEEPS if args.quick else SWEEPS):
+        scenario_results = run_scenario(scenario, fetcher, args.repeats, main_window_class)
+        for result in scenario_results:
+            print(f"{result.key():<90} best {result.best_s * 1000:9.2f} ms, median {result.median_s * 1000:9.2f} ms "
+                  f"({scenario.routes} routes, {scenario.samples} samples)")
+        results.extend(scenario_results)
+
+    settings = {'repeats': args.repeats, 'latency_s': args.latency, 'quick': args.quick,
+                'base_scenario': BASE_SCENARIO, 'sweeps': QUICK_SWEEPS if args.quick else SWEEPS}
+    print(f"Results written to {write_results(results, args.output, settings)}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmarks slower than x{args.threshold} of the baseline.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Any
+
+FIRST_PAINT_BUDGET_MS = 1000
+IMPORT_BUDGET_MS = 800
+# Loaded after the window is shown: on background threads (Earth Engine, pandas) or right after the first paint
+DEFERRED_MODULES = ('ee', 'pandas', 'pyarrow', 'matplotlib', 'models.exporters.csv_exporter',
+                    'models.fetchers.gee_fetcher')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_PROBE = f"""
+import json, sys, time
+started_at = time.perf_counter()
+import main
+imported_at = time.perf_counter()
+app, view, presenter = main.create_application([])
+painted_at = time.perf_counter()
+loaded = [name for name in {DEFERRED_MODULES!r} if name in sys.modules]
+view.init_plot()
+plot_ready_at = time.perf_counter()
+print(json.dumps({{
+    'imports_ms': (imported_at - started_at) * 1000,
+    'first_paint_ms': (painted_at - started_at) * 1000,
+    'plot_ms': (plot_ready_at - painted_at) * 1000,
+    'loaded_before_paint': loaded
+}}))
+"""
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def run_python(arguments: list[str]) -> subprocess.CompletedProcess:
+    environment = {**os.environ, 'QT_QPA_PLATFORM': os.environ.get('QT_QPA_PLATFORM', 'offscreen')}
+    return subprocess.run([sys.executable, *arguments], capture_output=True, text=True, check=True, cwd=ROOT,
+                          env=environment)
+
+
+def measure_startup() -> dict[str, Any]:
+    return json.loads(run_python(["-c", STARTUP_PROBE]).stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(limit: int) -> list[tuple[str, float]]:
+    # Self time of every module imported by `import main`, from the interpreter's own -X importtime report
+    self_times = []
+    for line in run_python(["-X", "importtime", "-c", "import main"]).stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_times.append((match.group(4), int(match.group(1)) / 1000))
+    return sorted(self_times, key=lambda item: item[1], reverse=True)[:limit]
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Замер времени запуска GUI и бюджета импортов.")
+    parser.add_argument("--runs", type=int, default=5, help="Число запусков (берётся медиана).")
+    parser.add_argument("--first-paint-budget", type=float, default=FIRST_PAINT_BUDGET_MS,
+                        help="Бюджет времени до первой отрисовки окна, мс.")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET_MS, help="Бюджет импортов main, мс.")
+    parser.add_argument("--top", type=int, default=15, help="Сколько самых медленных модулей показать.")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    samples = [measure_startup() for _ in range(args.runs)]
+    imports_ms = statistics.median(sample['imports_ms'] for sample in samples)
+    first_paint_ms = statistics.median(sample['first_paint_ms'] for sample in samples)
+    plot_ms = statistics.median(sample['plot_ms'] for sample in samples)
+    loaded = sorted({name for sample in samples for name in sample['loaded_before_paint']})
+
+    print(f"imports      {imports_ms:8.1f} ms (budget {args.import_budget:.0f} ms)")
+    print(f"first paint  {first_paint_ms:8.1f} ms (budget {args.first_paint_budget:.0f} ms)")
+    print(f"plot ready   {plot_ms:8.1f} ms after the first paint")
+    print("slowest imports (self time):")
+    for name, milliseconds in slowest_imports(args.top):
+        print(f"  {milliseconds:8.1f} ms  {name}")
+
+    failures = []
+    if imports_ms > args.import_budget:
+        failures.append(f"imports take {imports_ms:.0f} ms")
+    if first_paint_ms > args.first_paint_budget:
+        failures.append(f"first paint takes {first_paint_ms:.0f} ms")
+    if loaded:
+        failures.append(f"loaded before the first paint: {', '.join(loaded)}")
+    for failure in failures:
+        print(f"Over budget: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,4 +1,4 @@
-from models import City
+from models import City, Product
 
 G_PROJECT_ID = 'silicon-clock-463914-i2'
 DISTANCES_KM = [10, 20, 30, 50, 100, 150, 200]
@@ -13,13 +13,80 @@ BEARINGS = {
     270: "Запад",
     315: "Северо-Запад"
 }
+# Default angular step of the all-bearings rose; 45° gives the named BEARINGS
+ROSE_BEARING_STEP_DEG = 45
 YEARS_TO_ANALYZE = [2019, 2020, 2021, 2022, 2023, 2024]
+# The Sentinel-5P OFFL L3 NO2 collection starts in mid-2018
+FIRST_AVAILABLE_YEAR = 2018
 MONTH_TO_ANALYZE = 2
 EARTH_RADIUS_KM = 6371
-GEE_NO2_COLLECTION = "COPERNICUS/S5P/OFFL/L3_NO2"
+COORDINATE_GRID_CACHE_SIZE = 4096
+# Every product is sampled along the same routes, all of a request's products in one combined image
+PRODUCTS = {
+    "no2": Product(id="no2", name="NO2", label="Плотность NO2", collection="COPERNICUS/S5P/OFFL/L3_NO2",
+                   band="NO2_column_number_density", scale=10 ** 6, unit="мкмоль/м²", column="no2_umol_m2"),
+    "co": Product(id="co", name="CO", label="Плотность CO", collection="COPERNICUS/S5P/OFFL/L3_CO",
+                  band="CO_column_number_density", scale=10 ** 3, unit="ммоль/м²", column="co_mmol_m2"),
+    "so2": Product(id="so2", name="SO2", label="Плотность SO2", collection="COPERNICUS/S5P/OFFL/L3_SO2",
+                   band="SO2_column_number_density", scale=10 ** 6, unit="мкмоль/м²", column="so2_umol_m2"),
+    "hcho": Product(id="hcho", name="HCHO", label="Плотность HCHO", collection="COPERNICUS/S5P/OFFL/L3_HCHO",
+                    band="tropospheric_HCHO_column_number_density", scale=10 ** 6, unit="мкмоль/м²",
+                    column="hcho_umol_m2"),
+    "cloud": Product(id="cloud", name="Облачность", label="Доля облачности", collection="COPERNICUS/S5P/OFFL/L3_CLOUD",
+                     band="cloud_fraction", scale=1, unit="доля", column="cloud_fraction"),
+}
 GEE_COLLECTION_SCALE = 1113.2
-MOL_PER_M2_TO_UMOL_PER_M2 = 10 ** 6
+MODEL_FIT_BOOTSTRAP_SAMPLES = 200
+MODEL_FIT_BOOTSTRAP_CHUNK_VALUES = 8_000_000
+# Adaptive distance sampling starts on a coarse grid and halves intervals where the profile bends or departs
+# from the Θ1/r + Θ2 fit by more than the tolerance (a fraction of the profile amplitude)
+ADAPTIVE_INITIAL_STEP_KM = 20
+ADAPTIVE_MIN_STEP_KM = 1
+ADAPTIVE_TOLERANCE = 0.02
+ADAPTIVE_BACKGROUND_TOLERANCE = 0.05
+ADAPTIVE_MAX_ROUNDS = 8
 EXPORTS_FOLDER = "exports"
+SNAPSHOTS_FOLDER = "snapshots"
+# Keep persistent plot artists and blit model overlays instead of rebuilding the figure on every click
+PLOT_REUSE_ARTISTS = True
+# Model curves are clipped this fraction above the highest sample, whatever the product's unit
+MODEL_CLIP_HEADROOM = 0.3
+EXPORT_BATCH_ROUTES = 4096
+EXPORT_MAX_WORKERS: int | None = None
+# Values are held as float32, so text exports keep only the digits that survive the round trip
+EXPORT_FLOAT_FORMAT = "%.6g"
+FETCH_MAX_CONCURRENCY = 6
+FETCH_REQUEST_TIMEOUT_S: float | None = 300
+# Routes per GEE request; None sends every route of a run in one request
+FETCH_BATCH_SIZE: int | None = None
+# getInfo returns at most 5000 features, so the points of a request are sampled in chunks of this size
+FETCH_MAX_POINTS_PER_REQUEST = 4000
+LOCAL_RASTER_FOLDER = "rasters"
+LOCAL_RASTER_FILE_PATTERN = "{product}_{year}_{month:02d}"
+LOCAL_RASTER_INTERPOLATION = "bilinear"
+# Points are collapsed onto this grid before sampling; the S5P L3 products are gridded at 0.01°
+PIXEL_KEY_DEGREES = 0.01
+# Daily series are fetched in calendar-month chunks, each request holding at most this many points
+DAILY_STORE_FOLDER = "cache/daily"
+DAILY_MAX_POINTS_PER_REQUEST = 512
+# OFFL products arrive with a delay, so a month is only treated as final this many days after it ends
+DAILY_SETTLE_DAYS = 14
+SAMPLE_CACHE_PATH = "cache/samples.sqlite"
+SAMPLE_CACHE_COORD_DIGITS = 5
+SAMPLE_CACHE_TTL_SECONDS: float | None = None
+SAMPLE_CACHE_MAX_ENTRIES = 2_000_000
+# Eviction trims this share below the limit, so a full cache is not recounted on every write
+SAMPLE_CACHE_EVICT_HEADROOM = 0.1
+# Expired rows are never read back, so they are purged only after this many writes
+SAMPLE_CACHE_EVICT_INTERVAL = 50_000
+# Batch runs and the GUI may share the cache file; writers wait this long for the lock instead of failing
+SAMPLE_CACHE_BUSY_TIMEOUT_SECONDS = 30.0
+LOG_LEVEL = "INFO"
+BATCH_LOG_LEVEL = "WARNING"
+# Buffer every span for Chrome-trace export; latency histograms and counters are kept regardless
+TRACE_RECORD_EVENTS = False
+TRACE_MAX_EVENTS = 200_000
+TRACES_FOLDER = "traces"
 CITIES = {
     "moscow": City(id="moscow", name="Москва", coordinates=(52.033635, 113.501049), routes=[]),
     "saint_petersburg": City(id="saint_petersburg", name="Санкт-Петербург", coordinates=(59.9343, 30.3351), routes=[]),
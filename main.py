@@ -1,19 +1,42 @@
+import logging
+import os
 import sys
+import time
 
 from PySide6.QtWidgets import QApplication
 
+import config
 from models.analysis import Analysis
+from models.tracing import tracer
 from presenters.main_presenter import MainPresenter
 from views.main_window import MainWindow
 
+logger = logging.getLogger(__name__)
 
-def main():
-    app = QApplication(sys.argv)
+
+def create_application(argv: list[str]) -> tuple[QApplication, MainWindow, MainPresenter]:
+    app = QApplication(argv)
     model = Analysis()
     view = MainWindow()
     presenter = MainPresenter(view, model)
     view.show()
-    sys.exit(app.exec())
+    # Paint the window before anything else competes for the interpreter
+    app.processEvents()
+    return app, view, presenter
+
+
+def main():
+    logging.basicConfig(level=config.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    started_at = time.perf_counter()
+    app, view, presenter = create_application(sys.argv)
+    logger.info("Window shown in %.0f ms.", (time.perf_counter() - started_at) * 1000)
+    presenter.warm_up()
+    view.init_plot()
+    logger.info("Plot ready in %.0f ms.", (time.perf_counter() - started_at) * 1000)
+    exit_code = app.exec()
+    if tracer.recording:
+        tracer.write_chrome_trace(os.path.join(config.TRACES_FOLDER, "zephyrus.trace.json"))
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
-from .exporter import Exporter
-from .fetcher import Fetcher
+from .exporter import Exporter, ExportResult, RecordBatch, StreamingExporter
+from .fetcher import DailyFetcher, DailySamples, Fetcher
+from .product import DEFAULT_PRODUCT_ID, Product
 from .route import Route
 from .сity import City
@@ -0,0 +1,59 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+import config
+from models.model_fit import coverage_weights, fit_inverse_distance
+
+
+@dataclass
+class AdaptiveSampler:
+    initial_step_km: int = config.ADAPTIVE_INITIAL_STEP_KM
+    min_step_km: int = config.ADAPTIVE_MIN_STEP_KM
+    tolerance: float = config.ADAPTIVE_TOLERANCE
+    background_tolerance: float = config.ADAPTIVE_BACKGROUND_TOLERANCE
+    max_rounds: int = config.ADAPTIVE_MAX_ROUNDS
+
+    def initial_distances(self, max_distance_km: int) -> list[int]:
+        distances = set(range(self.initial_step_km, max_distance_km + 1, self.initial_step_km))
+        distances.update((self.min_step_km, max_distance_km))
+        return sorted(distance for distance in distances if 0 < distance <= max_distance_km)
+
+    def background_distance(self, distances: np.ndarray, densities: np.ndarray, amplitude: float) -> float:
+        # The profile has reached the background once every farther sample stays near the tail level
+        tail_level = np.median(densities[-3:])
+        outside = np.nonzero(np.abs(densities - tail_level) > self.background_tolerance * amplitude)[0]
+        if not len(outside):
+            return float(distances[0])
+        return float(distances[min(outside[-1] + 1, len(distances) - 1)])
+
+    def refine(self, distances: np.ndarray, densities: np.ndarray) -> list[int]:
+        if len(distances) < 3:
+            return []
+        amplitude = float(densities.max() - densities.min())
+        if not np.isfinite(amplitude) or amplitude == 0:
+            return []
+        tolerance = self.tolerance * amplitude
+        flagged = np.zeros(len(distances) - 1, dtype=bool)
+
+        # Where the Θ1/r + Θ2 fit bends away from the straight line between two samples, the interval hides detail
+        fit = fit_inverse_distance(distances, densities, weights=coverage_weights(distances, densities))
+        theta1, theta2 = fit.theta1[0], fit.theta2[0]
+        if np.isfinite(theta1) and np.isfinite(theta2):
+            midpoints = (distances[:-1] + distances[1:]) / 2
+            modelled = theta1 / distances + theta2
+            chord = (modelled[:-1] + modelled[1:]) / 2
+            flagged |= np.abs(theta1 / midpoints + theta2 - chord) > tolerance
+
+        # Curvature: how far the middle sample is from the chord through its neighbours, in density units
+        slopes = np.diff(densities) / np.diff(distances)
+        bending = np.abs(np.diff(slopes)) * (distances[2:] - distances[:-2]) / 2 > tolerance
+        flagged[:-1] |= bending
+        flagged[1:] |= bending
+
+        splittable = np.diff(distances) >= 2 * self.min_step_km
+        before_background = distances[:-1] < self.background_distance(distances, densities, amplitude)
+        refined = flagged & splittable & before_background
+
+        midpoints = np.rint((distances[:-1] + distances[1:]) / 2)[refined].astype(int)
+        return sorted(set(midpoints.tolist()) - set(distances.astype(int).tolist()))
@@ -1,10 +1,25 @@
+import logging
 import math
-import traceback
-from typing import Any, Optional
+import time
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Iterator, Mapping, Optional, Sequence
+
+import numpy as np
 
 import config
-from models import City, Fetcher, Exporter
+from models import DEFAULT_PRODUCT_ID, City, Fetcher, Exporter, ExportResult, RecordBatch, StreamingExporter
+from models.adaptive_sampler import AdaptiveSampler
+from models.export_pipeline import ExportPipeline
+from models.data_cube import DataCube, RouteKey
+from models.fetch_scheduler import FetchScheduler
+from models.model_fit import ModelFit, coverage_weights, fit_inverse_distance
+from models.periods import is_settled
+from models.rose_grid import RoseGrid, build_rose_grid
 from models.routes import MonthlyDataRoute
+from models.tracing import tracer
+
+logger = logging.getLogger(__name__)
 
 
 def calculate_new_coordinates(lat: float, lon: float, distance_km: float, bearing_deg: float) \
@@ -25,6 +40,51 @@ def calculate_new_coordinates(lat: float, lon: float, distance_km: float, bearin
     return math.degrees(new_lat_rad), math.degrees(new_lon_rad)
 
 
+@lru_cache(maxsize=config.COORDINATE_GRID_CACHE_SIZE)
+def _coordinate_grid(lat: float, lon: float, distances_km: tuple[float, ...], bearings_deg: tuple[float, ...]) \
+        -> tuple[np.ndarray, np.ndarray]:
+    lat_rad = math.radians(lat)
+    lon_rad = math.radians(lon)
+    bearing_rad = np.radians(np.asarray(bearings_deg, dtype=np.float64))[:, np.newaxis]
+    delta = np.asarray(distances_km, dtype=np.float64)[np.newaxis, :] / config.EARTH_RADIUS_KM
+
+    new_lat_rad = np.arcsin(
+        math.sin(lat_rad) * np.cos(delta) +
+        math.cos(lat_rad) * np.sin(delta) * np.cos(bearing_rad)
+    )
+    new_lon_rad = lon_rad + np.arctan2(
+        np.sin(bearing_rad) * np.sin(delta) * math.cos(lat_rad),
+        np.cos(delta) - math.sin(lat_rad) * np.sin(new_lat_rad)
+    )
+
+    lat_grid = np.degrees(new_lat_rad)
+    lon_grid = np.degrees(new_lon_rad)
+    lat_grid.flags.writeable = False
+    lon_grid.flags.writeable = False
+    return lat_grid, lon_grid
+
+
+def calculate_coordinate_grid(lat: float, lon: float, distances_km: Sequence[float], bearings_deg: Sequence[float]) \
+        -> tuple[np.ndarray, np.ndarray]:
+    return _coordinate_grid(lat, lon, tuple(distances_km), tuple(bearings_deg))
+
+
+@lru_cache(maxsize=config.COORDINATE_GRID_CACHE_SIZE)
+def _route_points(lat: float, lon: float, distances_km: tuple[int, ...], bearings_deg: tuple[int, ...]) \
+        -> dict[int, Mapping[int, tuple[float, float]]]:
+    lat_grid, lon_grid = _coordinate_grid(lat, lon, distances_km, bearings_deg)
+    return {
+        bearing: MappingProxyType(dict(zip(distances_km, zip(lat_grid[row].tolist(), lon_grid[row].tolist()))))
+        for row, bearing in enumerate(bearings_deg)
+    }
+
+
+def calculate_route_points(city: City, distances_km: Sequence[int], bearings_deg: Sequence[int]) \
+        -> dict[int, Mapping[int, tuple[float, float]]]:
+    origin_lat, origin_lon = city.coordinates
+    return _route_points(origin_lat, origin_lon, tuple(distances_km), tuple(bearings_deg))
+
+
 class Analysis:
     def __init__(self):
         self.cities: dict[str, City] = {}
@@ -32,108 +92,304 @@ class Analysis:
         self.current_month: int | None = None
         self.data_fetcher: Optional[Fetcher] = None
         self.exporter: Optional[Exporter] = None
-        print("Analysis model initialized.")
+        self.data_cube = DataCube()
+        self.fetch_scheduler = FetchScheduler()
+        self._route_positions: dict[RouteKey, int] = {}
+        logger.debug("Analysis model initialized.")
 
-    def export_all_loaded_data(self, exporter: Exporter):
-        print("Analysis.export_all_loaded_data started.")
-        if not self.cities:
-            print("No cities data loaded for export.")
-            raise ValueError("Нет загруженных данных для экспорта.")
+    def loaded_route(self, key: RouteKey) -> MonthlyDataRoute | None:
+        city = self.cities.get(key[0])
+        position = self._route_positions.get(key)
+        return city.routes[position] if city is not None and position is not None else None
+
+    def replace_loaded(self, cities: dict[str, City], data_cube: DataCube):
+        self.cities = cities
+        self.data_cube = data_cube
+        self._route_positions = {route.key: position for city in cities.values()
+                                 for position, route in enumerate(city.routes)}
+
+    def upsert_route(self, city: City, route: MonthlyDataRoute) -> MonthlyDataRoute:
+        stored = self.loaded_route(route.key)
+        if stored is route:
+            return stored
+        if stored is not None:
+            # New cells are merged into the loaded route, which keeps its cube row and its place in the tree
+            stored.distances = sorted(set(stored.distances).union(route.distances))
+            stored.points = {**stored.points, **route.points}
+            for distance, density in route.densities.items():
+                stored.densities[distance] = density
+            return stored
+
+        row = self.data_cube.row(route.key)
+        if route.densities.cube is not self.data_cube:
+            self.data_cube.clear_row(row)
+        route.densities.bind(self.data_cube, row)
+        self._route_positions[route.key] = len(city.routes)
+        city.routes.append(route)
+        return route
+
+    def iter_record_batches(self, batch_routes: int = config.EXPORT_BATCH_ROUTES) -> Iterator[RecordBatch]:
+        rows_by_partition: dict[tuple[str, int, str], list[int]] = {}
+        for row, (city_id, _, _, month, product) in enumerate(self.data_cube.keys()):
+            if city_id in self.cities:
+                rows_by_partition.setdefault((city_id, month, product), []).append(row)
+
+        distances = self.data_cube.distances
+        for (city_id, month, product), rows in rows_by_partition.items():
+            for start in range(0, len(rows), batch_routes):
+                chunk = rows[start:start + batch_routes]
+                values = self.data_cube.rows_values(np.asarray(chunk))
+                valid = ~np.isnan(values)
+                if not valid.any():
+                    continue
+                route_index, column_index = np.nonzero(valid)
+                keys = np.array([self.data_cube.key(row)[1:3] for row in chunk], dtype=np.int32)
+                yield RecordBatch(
+                    city_id=city_id,
+                    city_name=self.cities[city_id].name,
+                    month=month,
+                    product=product,
+                    year=keys[route_index, 1],
+                    bearing=keys[route_index, 0],
+                    distance=distances[column_index].astype(np.int32),
+                    values=values[valid]
+                )
 
+    def fit_loaded_routes(self, n_bootstrap: int = config.MODEL_FIT_BOOTSTRAP_SAMPLES, confidence: float = 0.95,
+                          seed: int | None = None) -> ModelFit:
+        with tracer.span("analysis.fit", routes=len(self.data_cube)):
+            distances, matrix = self.data_cube.distances, self.data_cube.matrix()
+            fit = fit_inverse_distance(distances, matrix, weights=coverage_weights(distances, matrix),
+                                       n_bootstrap=n_bootstrap, confidence=confidence, seed=seed)
+        fit.keys = self.data_cube.keys()
+        logger.info("Fitted Q = Θ1/r + Θ2 for %d routes.", len(fit.keys))
+        return fit
+
+    def rose_grid(self, city_id: str, month: int, product: str = DEFAULT_PRODUCT_ID) -> RoseGrid | None:
+        with tracer.span("analysis.rose_grid"):
+            return build_rose_grid(self.data_cube, city_id, month, product)
+
+    def _iter_export_records(self) -> Iterator[tuple[City, list[dict[str, Any]]]]:
         for city_id, city_obj in self.cities.items():
-            data_by_month: dict[int, list[dict[str, Any]]] = {}
+            data_by_partition: dict[tuple[int, str], list[dict[str, Any]]] = {}
 
             for route in city_obj.routes:
-                if isinstance(route, MonthlyDataRoute) and route.densities:
-                    for dist, density in route.densities.items():
-                        if not math.isnan(density):
-                            if route.month not in data_by_month:
-                                data_by_month[route.month] = []
-                            data_by_month[route.month].append({
-                                'city_id': city_obj.id,
-                                'city_name': city_obj.name,
-                                'year': route.year,
-                                'month': route.month,
-                                'bearing': route.bearing,
-                                'distance': dist,
-                                'no2_umol_m2': density
-                            })
-
-            for month_num, month_data in data_by_month.items():
-                print(f"  Exporting data for {city_obj.name}, Month: {config.MONTHS.get(month_num, str(month_num))}")
-                exporter.export(city_obj, month_data)
-
-        print("Analysis.export_all_loaded_data finished.")
-
-    def run(self, city: City, bearings: list[int], month: int, distances: list[int], fetcher: Fetcher,
-            exporter: Exporter) -> list[dict[str, Any]]:
-        print("Analysis.run method started.")
-        try:
-            self.current_city = city
-            self.data_fetcher = fetcher
-            self.exporter = exporter
+                if not isinstance(route, MonthlyDataRoute):
+                    continue
+                distances, densities = route.densities.valid_arrays()
+                if not len(distances):
+                    continue
+                month_data = data_by_partition.setdefault((route.month, route.product), [])
+                for dist, density in zip(distances.tolist(), densities.tolist()):
+                    month_data.append({
+                        'city_id': city_obj.id,
+                        'city_name': city_obj.name,
+                        'year': route.year,
+                        'month': route.month,
+                        'bearing': route.bearing,
+                        'distance': dist,
+                        'product': route.product,
+                        'value': density
+                    })
+
+            for (month_num, product), month_data in data_by_partition.items():
+                logger.debug("Exporting %s data for %s, month: %s", product, city_obj.name,
+                             config.MONTHS.get(month_num, str(month_num)))
+                yield city_obj, month_data
+
+    def export_all_loaded_data(self, exporter: Exporter, max_workers: int | None = config.EXPORT_MAX_WORKERS) \
+            -> list[ExportResult]:
+        logger.debug("Analysis.export_all_loaded_data started.")
+        if not self.cities:
+            logger.warning("No cities data loaded for export.")
+            raise ValueError("Нет загруженных данных для экспорта.")
+
+        with tracer.span("export.total", exporter=type(exporter).__name__):
+            pipeline = ExportPipeline(max_workers)
+            if isinstance(exporter, StreamingExporter):
+                results = pipeline.run_streaming(exporter, self.iter_record_batches())
+            else:
+                results = pipeline.run(exporter, self._iter_export_records())
+            pipeline.write_manifest(results, getattr(exporter, 'folder', config.EXPORTS_FOLDER))
+
+        logger.debug("Analysis.export_all_loaded_data finished.")
+        return results
+
+    def _refine_routes(self, city: City, routes: list[MonthlyDataRoute], sampler: AdaptiveSampler,
+                       fetcher: Fetcher):
+        for round_number in range(1, sampler.max_rounds + 1):
+            pending: list[tuple[MonthlyDataRoute, list[int]]] = []
+            for route in routes:
+                distances, densities = route.densities.valid_arrays()
+                sampled = set(route.distances)
+                added = [distance for distance in sampler.refine(distances, densities) if distance not in sampled]
+                if added:
+                    pending.append((route, added))
+            if not pending:
+                break
 
-            if not self.cities.get(city.id):
-                self.cities[city.id] = city
-                print(f"Added {city.name} to cities cache.")
+            new_distances = sorted({distance for _, added in pending for distance in added})
+            points_by_bearing = calculate_route_points(city, new_distances, sorted({r.bearing for r, _ in pending}))
+            refinements = [MonthlyDataRoute(
+                city_id=route.city_id,
+                bearing=route.bearing,
+                year=route.year,
+                month=route.month,
+                product=route.product,
+                distances=added,
+                points={distance: points_by_bearing[route.bearing][distance] for distance in added}
+            ) for route, added in pending]
 
-            self.current_month = month
+            points = sum(len(added) for _, added in pending)
+            batches = FetchScheduler.split(refinements, config.FETCH_BATCH_SIZE)
+            with tracer.span("analysis.refine", round=round_number, routes=len(pending), points=points):
+                self.fetch_scheduler.run(fetcher, batches)
+            tracer.count("analysis.refined_points", points)
+            logger.debug("Refinement round %d: %d points on %d routes in %d requests.", round_number, points,
+                         len(pending), len(batches))
 
+            for (route, added), refinement in zip(pending, refinements):
+                route.distances = sorted(route.distances + added)
+                route.points = {**route.points, **refinement.points}
+                for distance, density in refinement.densities.items():
+                    route.densities[distance] = density
+
+    def upsert_routes(self, city: City, routes: list[MonthlyDataRoute]) -> list[MonthlyDataRoute]:
+        if not self.cities.get(city.id):
+            self.cities[city.id] = city
+            logger.debug("Added %s to cities cache.", city.name)
+        # A restored session holds its own city objects, new routes must join those
+        city = self.cities[city.id]
+        with tracer.span("analysis.upsert", routes=len(routes)):
+            stored = [self.upsert_route(city, route) for route in routes]
+        tracer.count("analysis.routes_upserted", len(routes))
+        logger.debug("Stored %d routes. City routes size: %d", len(routes), len(city.routes))
+        return stored
+
+    def _plan_route(self, route: MonthlyDataRoute) -> MonthlyDataRoute | None:
+        # Returns the route holding only the cells that still have to be fetched, or None if all are loaded.
+        # A loaded route's values are copied into the requested one, so refinement sees the whole profile.
+        loaded = self.loaded_route(route.key)
+        if loaded is None:
+            return route
+
+        loaded_distances = set(loaded.distances)
+        # Months inside the settle window may still change or be published later, so their cells are fetched again
+        settled = is_settled(route.year, route.month)
+        missing = [distance for distance in route.distances if not settled or distance not in loaded_distances]
+        if not missing:
+            return None
+        request = MonthlyDataRoute(
+            city_id=route.city_id,
+            bearing=route.bearing,
+            year=route.year,
+            month=route.month,
+            product=route.product,
+            distances=missing,
+            points={distance: route.points[distance] for distance in missing}
+        )
+        route.distances = sorted(loaded_distances.union(route.distances))
+        route.points = {**loaded.points, **route.points}
+        for distance, density in loaded.densities.items():
+            route.densities[distance] = density
+        return request
+
+    def iter_fetch(self, city: City, bearings: list[int], month: int | None, distances: list[int], fetcher: Fetcher,
+                   sampler: AdaptiveSampler | None = None, years: list[int] | None = None, stream: bool = True,
+                   products: list[str] | None = None) -> Iterator[tuple[list[MonthlyDataRoute], int, int]]:
+        # Yields (routes, completed batches, total batches) without touching the data cube, so the caller decides
+        # which thread stores them; streaming sends one request per year, holding every bearing and product of
+        # that year's rose
+        self.current_city = city
+        self.data_fetcher = fetcher
+        self.current_month = month
+        # month=None analyzes every month; all year-months of a batch still go to the fetcher as one request
+        months = list(config.MONTHS) if month is None else [month]
+        years = list(config.YEARS_TO_ANALYZE) if years is None else years
+        products = [DEFAULT_PRODUCT_ID] if not products else products
+        if sampler is not None:
+            distances = sampler.initial_distances(max(distances))
+
+        routes_to_fetch: list[MonthlyDataRoute] = []
+        requests: list[MonthlyDataRoute] = []
+        points_by_bearing = calculate_route_points(city, distances, bearings)
+        logger.debug("Generated points for %d bearings x %d distances.", len(bearings), len(distances))
+        for product in products:
             for bearing in bearings:
-                print(f"  Processing bearing: {bearing}")
-                origin_lat, origin_lon = city.coordinates
-
-                points_for_current_bearing = {}
-                for distance in distances:
-                    new_lat, new_lon = calculate_new_coordinates(origin_lat, origin_lon, distance, bearing)
-                    points_for_current_bearing[distance] = new_lat, new_lon
-                print(f"    Generated points for all distances for bearing {bearing}.")
-
-                for year in config.YEARS_TO_ANALYZE:
-                    print(f"    Fetching data for year: {year}, bearing: {bearing}, month: {month}")
-
-                    temp_monthly_data_route = MonthlyDataRoute(
-                        city_id=city.id,
-                        bearing=bearing,
-                        year=year,
-                        month=month,
-                        distances=list(distances),
-                        points=points_for_current_bearing.copy()
-                    )
-
-                    routes_for_fetch = {bearing: temp_monthly_data_route}
-                    monthly_data = fetcher.fetch(routes_for_fetch, year, month)
-
-                    for record in monthly_data:
-                        dist = record['distance']
-                        no2_val = record['no2_umol_m2']
-                        temp_monthly_data_route.densities[dist] = no2_val
-
-                    found_existing_route = False
-                    for i, existing_route in enumerate(city.routes):
-                        if (isinstance(existing_route, MonthlyDataRoute) and
-                                existing_route.city_id == temp_monthly_data_route.city_id and
-                                existing_route.bearing == temp_monthly_data_route.bearing and
-                                existing_route.year == temp_monthly_data_route.year and
-                                existing_route.month == temp_monthly_data_route.month):
-                            city.routes[i] = temp_monthly_data_route
-                            found_existing_route = True
-                            print(
-                                f"    Overwrote existing MonthlyDataRoute for year {year}, bearing {bearing}, month {month}.")
-                            break
-
-                    if not found_existing_route:
-                        city.routes.append(temp_monthly_data_route)
-                        print(f"    Added new MonthlyDataRoute for year {year}, bearing {bearing}, month {month}.")
-
-                    print(
-                        f"    Finished processing for year {year}, bearing {bearing}, month {month}. City routes size: {len(city.routes)}")
-
-            print("Finished processing all bearings and years in Analysis.run.")
+                for year in years:
+                    for route_month in months:
+                        route = MonthlyDataRoute(
+                            city_id=city.id,
+                            bearing=bearing,
+                            year=year,
+                            month=route_month,
+                            product=product,
+                            distances=list(distances),
+                            points=points_by_bearing[bearing]
+                        )
+                        request = self._plan_route(route)
+                        if request is not None:
+                            routes_to_fetch.append(route)
+                            requests.append(request)
+
+        requested_cells = len(products) * len(bearings) * len(years) * len(months) * len(distances)
+        missing_cells = sum(len(request.distances) for request in requests)
+        logger.info("Plan: %d of %d cells missing, %d already loaded.", missing_cells, requested_cells,
+                    requested_cells - missing_cells)
+        tracer.count("analysis.planned_cells", missing_cells)
 
+        if stream:
+            indices_by_group: dict[int, list[int]] = {}
+            for index, route in enumerate(routes_to_fetch):
+                indices_by_group.setdefault(route.year, []).append(index)
+            groups = list(indices_by_group.values())
+        else:
+            groups = FetchScheduler.split(list(range(len(routes_to_fetch))), config.FETCH_BATCH_SIZE)
+        batches = [[requests[index] for index in group] for group in groups]
+        logger.info("Fetching data for %d routes in %d requests, months: %s, years: %s, products: %s",
+                    len(routes_to_fetch), len(batches), months, years, products)
+
+        started_at = time.perf_counter()
+        # Without streaming, batches are held back until every earlier one is done, so they come out in submission
+        # order and the cube, the tree and exports are filled in the same order on every run
+        ready: dict[int, list[MonthlyDataRoute]] = {}
+        next_index = 0
+        for completed, (batch_index, _) in enumerate(self.fetch_scheduler.iter_run(fetcher, batches), start=1):
+            batch = [routes_to_fetch[index] for index in groups[batch_index]]
+            for route, request in zip(batch, batches[batch_index]):
+                if request is not route:
+                    for distance, density in request.densities.items():
+                        route.densities[distance] = density
+            if sampler is not None:
+                self._refine_routes(city, batch, sampler, fetcher)
+            if completed == 1:
+                logger.info("First of %d batches ready after %.2f s.", len(batches), time.perf_counter() - started_at)
+            if stream:
+                yield batch, completed, len(batches)
+                continue
+            ready[batch_index] = batch
+            while next_index in ready:
+                yield ready.pop(next_index), completed, len(batches)
+                next_index += 1
+
+        if sampler is not None:
+            logger.info("Adaptive sampling: %d points instead of %d at %d km steps.",
+                        sum(len(route.distances) for route in routes_to_fetch),
+                        len(routes_to_fetch) * (max(distances) // sampler.min_step_km), sampler.min_step_km)
+
+    @tracer.span("analysis.run")
+    def run(self, city: City, bearings: list[int], month: int | None, distances: list[int], fetcher: Fetcher,
+            exporter: Exporter, sampler: AdaptiveSampler | None = None, years: list[int] | None = None,
+            products: list[str] | None = None) -> list[dict[str, Any]]:
+        logger.debug("Analysis.run method started.")
+        try:
+            self.exporter = exporter
+            with tracer.span("analysis.fetch"):
+                batches = list(self.iter_fetch(city, bearings, month, distances, fetcher, sampler, years,
+                                               stream=False, products=products))
+            for routes, _, _ in batches:
+                self.upsert_routes(city, routes)
             return []
-        except Exception as e:
-            error_message = f"Error in Analysis.run: {e}"
-            print(error_message)
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Error in Analysis.run")
             raise
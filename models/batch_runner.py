@@ -0,0 +1,102 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+import numpy as np
+
+import config
+from models import City
+from models.adaptive_sampler import AdaptiveSampler
+from models.analysis import Analysis, calculate_route_points
+from models.data_cube import RouteKey
+from models.fetcher_session import create_fetcher
+from models.routes import MonthlyDataRoute
+from models.tracing import TraceSnapshot, tracer
+
+logger = logging.getLogger(__name__)
+
+RouteResult = tuple[RouteKey, np.ndarray, np.ndarray]
+
+
+@dataclass
+class BatchJob:
+    city_id: str
+    month: int | None
+    bearings: list[int]
+    distances: list[int]
+    sampler: AdaptiveSampler | None = None
+    years: list[int] | None = None
+    products: list[str] | None = None
+
+
+@dataclass
+class BatchReport:
+    jobs: int
+    routes: int
+    samples: int
+    elapsed_s: float
+
+    def summary(self) -> str:
+        elapsed_s = max(self.elapsed_s, 1e-9)
+        return (f"{self.jobs} jobs, {self.routes} routes, {self.samples} samples in {self.elapsed_s:.1f} s "
+                f"({self.jobs / elapsed_s:.2f} jobs/s, {self.samples / elapsed_s:.1f} samples/s)")
+
+
+def _run_job(job: BatchJob, fetcher_name: str, use_cache: bool, record_events: bool) \
+        -> tuple[list[RouteResult], TraceSnapshot]:
+    # Forked workers inherit the parent's histograms, so each job starts from an empty tracer
+    tracer.reset()
+    tracer.recording = record_events
+    template = config.CITIES[job.city_id]
+    city = City(id=template.id, name=template.name, coordinates=template.coordinates, routes=[])
+    Analysis().run(city, job.bearings, job.month, job.distances, create_fetcher(fetcher_name, use_cache), None,
+                   sampler=job.sampler, years=job.years, products=job.products)
+    return [(route.key, *route.densities.valid_arrays()) for route in city.routes], tracer.drain()
+
+
+def _merge_job(analysis: Analysis, job: BatchJob, route_results: list[RouteResult]) -> int:
+    city = analysis.cities.setdefault(job.city_id, config.CITIES[job.city_id])
+    # Adaptive jobs come back with per-route distances, so points cover everything any route sampled
+    all_distances = set(job.distances).union(*(distances.tolist() for _, distances, _ in route_results))
+    points_by_bearing = calculate_route_points(city, sorted(all_distances), job.bearings)
+    samples = 0
+    for (city_id, bearing, year, month, product), distances, densities in route_results:
+        route = MonthlyDataRoute(
+            city_id=city_id,
+            bearing=bearing,
+            year=year,
+            month=month,
+            product=product,
+            distances=list(job.distances) if job.sampler is None else distances.tolist(),
+            points=points_by_bearing[bearing]
+        )
+        for distance, density in zip(distances.tolist(), densities.tolist()):
+            route.densities[distance] = density
+        analysis.upsert_route(city, route)
+        samples += len(distances)
+    return samples
+
+
+def run_batch(analysis: Analysis, jobs: list[BatchJob], fetcher_name: str = "gee", use_cache: bool = True,
+              max_workers: int | None = None) -> BatchReport:
+    started_at = time.perf_counter()
+    routes = 0
+    samples = 0
+    max_workers = max(1, min(max_workers or os.cpu_count() or 1, len(jobs) or 1))
+    logger.info("Batch run: %d jobs on %d processes.", len(jobs), max_workers)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_run_job, job, fetcher_name, use_cache, tracer.recording): job for job in jobs}
+        for completed, future in enumerate(as_completed(futures), start=1):
+            job = futures[future]
+            route_results, snapshot = future.result()
+            tracer.merge(snapshot)
+            routes += len(route_results)
+            with tracer.span("batch.merge", routes=len(route_results)):
+                samples += _merge_job(analysis, job, route_results)
+            logger.info("[%d/%d] %s, month %s: %d routes.", completed, len(jobs), job.city_id, job.month,
+                        len(route_results))
+
+    return BatchReport(jobs=len(jobs), routes=routes, samples=samples, elapsed_s=time.perf_counter() - started_at)
@@ -0,0 +1,87 @@
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date
+
+import config
+from models import DEFAULT_PRODUCT_ID, City, DailyFetcher, DailySamples, Fetcher
+from models.analysis import calculate_route_points
+from models.daily_store import DailySeriesStore
+from models.fetch_scheduler import FetchScheduler
+from models.periods import is_settled, month_end
+from models.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DailyRequest:
+    start: date
+    end: date
+    complete: bool
+    point_ids: list[int]
+    coordinates: list[tuple[float, float]]
+
+
+@dataclass
+class DailyReport:
+    requests: int
+    points: int
+    samples: int
+    elapsed_s: float
+
+    def summary(self) -> str:
+        elapsed_s = max(self.elapsed_s, 1e-9)
+        return (f"{self.requests} requests, {self.points} points, {self.samples} daily samples in "
+                f"{self.elapsed_s:.1f} s ({self.samples / elapsed_s:.1f} samples/s)")
+
+
+def month_chunks(years: list[int], today: date) -> list[tuple[date, date, bool]]:
+    # (start, end, complete) per calendar month; the current month is cut at today and stays incomplete
+    chunks = []
+    for year in sorted(set(years)):
+        for month in range(1, 13):
+            start = date(year, month, 1)
+            if start >= today:
+                break
+            chunks.append((start, min(month_end(year, month), today), is_settled(year, month, today)))
+    return chunks
+
+
+def fetch_daily_series(store: DailySeriesStore, city: City, bearings: list[int], distances: list[int],
+                       years: list[int], fetcher: Fetcher, scheduler: FetchScheduler | None = None,
+                       today: date | None = None, product: str = DEFAULT_PRODUCT_ID) -> DailyReport:
+    # The store holds a single product, so each product keeps its own store
+    if not isinstance(fetcher, DailyFetcher):
+        raise ValueError(f"{type(fetcher).__name__} does not provide daily samples.")
+    started_at = time.perf_counter()
+    points_by_bearing = calculate_route_points(city, distances, bearings)
+    keys = [(city.id, bearing, distance) for bearing in bearings for distance in distances]
+    point_ids = store.point_ids(keys)
+    coordinates = {point_id: points_by_bearing[bearing][distance]
+                   for point_id, (_, bearing, distance) in zip(point_ids, keys)}
+
+    requests = []
+    chunks = month_chunks(years, today or date.today())
+    for start, end, complete in chunks:
+        for batch in FetchScheduler.split(store.missing(point_ids, start), config.DAILY_MAX_POINTS_PER_REQUEST):
+            requests.append(DailyRequest(start=start, end=end, complete=complete, point_ids=batch,
+                                         coordinates=[coordinates[point_id] for point_id in batch]))
+    missing = sum(len(request.point_ids) for request in requests)
+    logger.info("Daily %s plan for %s: %d of %d point-months missing, %d requests.", product, city.name, missing,
+                len(point_ids) * len(chunks), len(requests))
+    tracer.count("daily.planned_point_months", missing)
+
+    def fetch(request: DailyRequest) -> DailySamples:
+        with tracer.span("fetch.daily_request", points=len(request.point_ids)):
+            return fetcher.fetch_daily(request.coordinates, request.start, request.end, product)
+
+    # Each chunk goes to disk as soon as it arrives, so memory holds only the requests in flight
+    samples = 0
+    with tracer.span("daily.fetch", requests=len(requests)):
+        for index, daily in (scheduler or FetchScheduler()).iter_map(fetch, requests):
+            request = requests[index]
+            samples += store.append(request.point_ids, daily, request.start, request.complete)
+    tracer.count("daily.samples", samples)
+    return DailyReport(requests=len(requests), points=len(point_ids), samples=samples,
+                       elapsed_s=time.perf_counter() - started_at)
@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import threading
+from datetime import date
+from typing import Iterator
+
+import numpy as np
+
+import config
+from models import DailySamples
+
+logger = logging.getLogger(__name__)
+
+PointKey = tuple[str, int, int]
+# One record per valid (day, point) sample; days are counted from 1970-01-01 like datetime64[D]
+RECORD_DTYPE = np.dtype([('day', '<i4'), ('point', '<i4'), ('value', '<f4')])
+POINTS_FILE = "points.jsonl"
+CHUNKS_FILE = "chunks.jsonl"
+RECORDS_FILE = "records.bin"
+
+
+class DailySeriesStore:
+    # Append-only: points, records and completed chunks are only ever appended, and records are read memory-mapped.
+    # A chunk is logged after its records are written, so an interrupted chunk is fetched again and the
+    # duplicate days are resolved on read in favour of the latest record.
+    def __init__(self, folder: str = config.DAILY_STORE_FOLDER):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._points: list[PointKey] = []
+        self._point_ids: dict[PointKey, int] = {}
+        self._covered: set[tuple[int, int]] = set()
+        self._index: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+
+        records_path = self._path(RECORDS_FILE)
+        if os.path.exists(records_path) and os.path.getsize(records_path) % RECORD_DTYPE.itemsize:
+            # A record cut short by a crash would shift every record appended after it
+            logger.warning("Trimming a partial record at the end of %s.", records_path)
+            with open(records_path, 'r+b') as file:
+                file.truncate(os.path.getsize(records_path) // RECORD_DTYPE.itemsize * RECORD_DTYPE.itemsize)
+        for city_id, bearing, distance in self._read_json_lines(POINTS_FILE):
+            self._point_ids[(city_id, bearing, distance)] = len(self._points)
+            self._points.append((city_id, bearing, distance))
+        for chunk in self._read_json_lines(CHUNKS_FILE):
+            start = date.fromisoformat(chunk['start']).toordinal()
+            self._covered.update((point_id, start) for point_id in chunk['points'])
+        logger.debug("Daily store %s: %d points, %d covered point-chunks.", folder, len(self._points),
+                     len(self._covered))
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.folder, name)
+
+    def _read_json_lines(self, name: str) -> list:
+        if not os.path.exists(self._path(name)):
+            return []
+        items = []
+        with open(self._path(name), encoding='utf-8') as file:
+            for line in file:
+                try:
+                    items.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A line cut short by a crash is dropped together with whatever it described
+                    logger.warning("Skipping a damaged line of %s.", self._path(name))
+        return items
+
+    def _append_lines(self, name: str, items: list):
+        with open(self._path(name), 'a', encoding='utf-8') as file:
+            file.write(''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in items))
+
+    @property
+    def points(self) -> list[PointKey]:
+        return list(self._points)
+
+    def point_ids(self, keys: list[PointKey]) -> list[int]:
+        with self._lock:
+            new_keys = [key for key in dict.fromkeys(keys) if key not in self._point_ids]
+            for key in new_keys:
+                self._point_ids[key] = len(self._points)
+                self._points.append(key)
+            if new_keys:
+                self._append_lines(POINTS_FILE, [list(key) for key in new_keys])
+            return [self._point_ids[key] for key in keys]
+
+    def missing(self, point_ids: list[int], chunk_start: date) -> list[int]:
+        start = chunk_start.toordinal()
+        return [point_id for point_id in point_ids if (point_id, start) not in self._covered]
+
+    def append(self, point_ids: list[int], samples: DailySamples, chunk_start: date, complete: bool = True) -> int:
+        valid = ~np.isnan(samples.values)
+        day_rows, columns = np.nonzero(valid)
+        records = np.empty(len(day_rows), dtype=RECORD_DTYPE)
+        records['day'] = samples.days.astype(np.int64)[day_rows]
+        records['point'] = np.asarray(point_ids, dtype=np.int32)[columns]
+        records['value'] = samples.values[valid]
+
+        with self._lock:
+            with open(self._path(RECORDS_FILE), 'ab') as file:
+                file.write(records.tobytes())
+            # Chunks that end in the future are stored but not logged, so later runs complete them
+            if complete:
+                self._append_lines(CHUNKS_FILE, [{'start': chunk_start.isoformat(), 'points': point_ids}])
+                start = chunk_start.toordinal()
+                self._covered.update((point_id, start) for point_id in point_ids)
+            self._index = None
+        return len(records)
+
+    def _records(self) -> np.ndarray:
+        path = self._path(RECORDS_FILE)
+        count = os.path.getsize(path) // RECORD_DTYPE.itemsize if os.path.exists(path) else 0
+        if not count:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+
+    def _sorted_index(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # (records, row order by point and day, point of each ordered row), rebuilt after appends
+        with self._lock:
+            if self._index is None:
+                records = self._records()
+                points, days = records['point'], records['day']
+                order = np.lexsort((np.arange(len(records)), days, points))
+                ordered_points, ordered_days = points[order], days[order]
+                last_of_day = np.ones(len(order), dtype=bool)
+                last_of_day[:-1] = ((ordered_points[1:] != ordered_points[:-1]) |
+                                    (ordered_days[1:] != ordered_days[:-1]))
+                self._index = records, order[last_of_day], ordered_points[last_of_day]
+            return self._index
+
+    def __len__(self) -> int:
+        return len(self._sorted_index()[1])
+
+    def series(self, key: PointKey) -> tuple[np.ndarray, np.ndarray]:
+        # (days as datetime64[D], values) of one point, in date order
+        point_id = self._point_ids.get(key)
+        records, order, ordered_points = self._sorted_index()
+        if point_id is None:
+            return np.empty(0, dtype='datetime64[D]'), np.empty(0, dtype=np.float32)
+        first, last = np.searchsorted(ordered_points, [point_id, point_id + 1])
+        rows = order[first:last]
+        return records['day'][rows].astype('datetime64[D]'), np.asarray(records['value'][rows])
+
+    def iter_series(self, city_id: str | None = None) -> Iterator[tuple[PointKey, np.ndarray, np.ndarray]]:
+        for key in self.points:
+            if city_id is None or key[0] == city_id:
+                days, values = self.series(key)
+                if len(days):
+                    yield key, days, values
@@ -0,0 +1,215 @@
+from dataclasses import dataclass
+from typing import Iterator, MutableMapping
+
+import numpy as np
+
+# (city id, bearing, year, month, product id)
+RouteKey = tuple[str, int, int, int, str]
+
+
+@dataclass(frozen=True)
+class RouteStats:
+    count: int
+    minimum: float
+    maximum: float
+    mean: float
+
+
+class DataCube:
+    def __init__(self, route_capacity: int = 64, distance_capacity: int = 32):
+        self._values = np.full((route_capacity, distance_capacity), np.nan, dtype=np.float32)
+        self._row_count = np.zeros(route_capacity, dtype=np.int64)
+        self._row_sum = np.zeros(route_capacity, dtype=np.float64)
+        self._row_min = np.full(route_capacity, np.inf, dtype=np.float64)
+        self._row_max = np.full(route_capacity, -np.inf, dtype=np.float64)
+        self._row_stats_dirty = np.zeros(route_capacity, dtype=bool)
+        self._route_rows: dict[RouteKey, int] = {}
+        self._route_keys: list[RouteKey] = []
+        self._distance_columns: dict[int, int] = {}
+        self._distances: list[int] = []
+        self._column_order: np.ndarray | None = None
+
+    @classmethod
+    def from_arrays(cls, keys: list[RouteKey], distances: list[int], values: np.ndarray) -> 'DataCube':
+        # Adopts the matrix as storage without copying it, so a memory-mapped array stays mapped until the cube grows
+        cube = cls(route_capacity=0, distance_capacity=0)
+        route_capacity = values.shape[0]
+        cube._values = values
+        cube._row_count = np.zeros(route_capacity, dtype=np.int64)
+        cube._row_sum = np.zeros(route_capacity, dtype=np.float64)
+        cube._row_min = np.full(route_capacity, np.inf, dtype=np.float64)
+        cube._row_max = np.full(route_capacity, -np.inf, dtype=np.float64)
+        cube._row_stats_dirty = np.ones(route_capacity, dtype=bool)
+        cube._route_keys = list(keys)
+        cube._route_rows = {key: row for row, key in enumerate(cube._route_keys)}
+        cube._distances = list(distances)
+        cube._distance_columns = {distance: column for column, distance in enumerate(cube._distances)}
+        return cube
+
+    def __len__(self) -> int:
+        return len(self._route_keys)
+
+    def keys(self) -> list[RouteKey]:
+        return list(self._route_keys)
+
+    def key(self, row: int) -> RouteKey:
+        return self._route_keys[row]
+
+    def find_row(self, key: RouteKey) -> int | None:
+        return self._route_rows.get(key)
+
+    def row(self, key: RouteKey) -> int:
+        row = self._route_rows.get(key)
+        if row is None:
+            row = len(self._route_keys)
+            if row == self._values.shape[0]:
+                self._grow(routes=row * 2)
+            self._route_rows[key] = row
+            self._route_keys.append(key)
+        return row
+
+    def column(self, distance: int) -> int:
+        column = self._distance_columns.get(distance)
+        if column is None:
+            column = len(self._distances)
+            if column == self._values.shape[1]:
+                self._grow(distances=column * 2)
+            self._distance_columns[distance] = column
+            self._distances.append(distance)
+            self._column_order = None
+        return column
+
+    def _grow(self, routes: int | None = None, distances: int | None = None):
+        old_routes, old_distances = self._values.shape
+        values = np.full((routes or old_routes, distances or old_distances), np.nan, dtype=np.float32)
+        values[:old_routes, :old_distances] = self._values
+        self._values = values
+
+        if routes and routes > old_routes:
+            extra = routes - old_routes
+            self._row_count = np.concatenate([self._row_count, np.zeros(extra, dtype=np.int64)])
+            self._row_sum = np.concatenate([self._row_sum, np.zeros(extra, dtype=np.float64)])
+            self._row_min = np.concatenate([self._row_min, np.full(extra, np.inf, dtype=np.float64)])
+            self._row_max = np.concatenate([self._row_max, np.full(extra, -np.inf, dtype=np.float64)])
+            self._row_stats_dirty = np.concatenate([self._row_stats_dirty, np.zeros(extra, dtype=bool)])
+
+    def get(self, row: int, distance: int) -> float:
+        column = self._distance_columns.get(distance)
+        if column is None:
+            return float('nan')
+        return float(self._values[row, column])
+
+    def set(self, row: int, distance: int, value: float | None):
+        column = self.column(distance)
+        previous = self._values[row, column]
+        self._values[row, column] = np.nan if value is None else value
+
+        if not np.isnan(previous):
+            self._row_stats_dirty[row] = True
+        elif value is not None and not np.isnan(value) and not self._row_stats_dirty[row]:
+            stored = float(self._values[row, column])
+            self._row_count[row] += 1
+            self._row_sum[row] += stored
+            self._row_min[row] = min(self._row_min[row], stored)
+            self._row_max[row] = max(self._row_max[row], stored)
+
+    def clear_row(self, row: int):
+        self._values[row, :] = np.nan
+        self._row_count[row] = 0
+        self._row_sum[row] = 0.0
+        self._row_min[row] = np.inf
+        self._row_max[row] = -np.inf
+        self._row_stats_dirty[row] = False
+
+    def row_stats(self, row: int) -> RouteStats:
+        if self._row_stats_dirty[row]:
+            values = self._values[row][~np.isnan(self._values[row])].astype(np.float64)
+            self._row_count[row] = len(values)
+            self._row_sum[row] = values.sum()
+            self._row_min[row] = values.min() if len(values) else np.inf
+            self._row_max[row] = values.max() if len(values) else -np.inf
+            self._row_stats_dirty[row] = False
+
+        count = int(self._row_count[row])
+        if not count:
+            return RouteStats(count=0, minimum=np.nan, maximum=np.nan, mean=np.nan)
+        return RouteStats(count=count, minimum=float(self._row_min[row]), maximum=float(self._row_max[row]),
+                          mean=float(self._row_sum[row] / count))
+
+    @property
+    def distances(self) -> np.ndarray:
+        return np.asarray(self._distances, dtype=np.int64)[self._sorted_columns()]
+
+    def _sorted_columns(self) -> np.ndarray:
+        if self._column_order is None:
+            self._column_order = np.argsort(np.asarray(self._distances, dtype=np.int64), kind='stable')
+        return self._column_order
+
+    def row_values(self, row: int) -> np.ndarray:
+        return self._values[row, self._sorted_columns()]
+
+    def rows_values(self, rows: np.ndarray) -> np.ndarray:
+        return self._values[rows][:, self._sorted_columns()]
+
+    def row_slice(self, row: int) -> tuple[np.ndarray, np.ndarray]:
+        values = self.row_values(row)
+        valid = ~np.isnan(values)
+        return self.distances[valid], values[valid]
+
+    def matrix(self) -> np.ndarray:
+        return self._values[:len(self._route_keys)][:, self._sorted_columns()]
+
+
+class RouteDensities(MutableMapping[int, float]):
+    def __init__(self, cube: DataCube | None = None, row: int | None = None):
+        if cube is None:
+            cube = DataCube(route_capacity=1, distance_capacity=8)
+            row = cube.row(('', 0, 0, 0, ''))
+        self._cube = cube
+        self._row = row
+
+    @property
+    def cube(self) -> DataCube:
+        return self._cube
+
+    @property
+    def row(self) -> int:
+        return self._row
+
+    def bind(self, cube: DataCube, row: int):
+        if cube is self._cube and row == self._row:
+            return
+        distances, values = self.valid_arrays()
+        for distance, value in zip(distances.tolist(), values.tolist()):
+            cube.set(row, distance, value)
+        self._cube = cube
+        self._row = row
+
+    def valid_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        return self._cube.row_slice(self._row)
+
+    def stats(self) -> RouteStats:
+        return self._cube.row_stats(self._row)
+
+    def __getitem__(self, distance: int) -> float:
+        value = self._cube.get(self._row, distance)
+        if np.isnan(value):
+            raise KeyError(distance)
+        return value
+
+    def __setitem__(self, distance: int, value: float | None):
+        self._cube.set(self._row, distance, value)
+
+    def __delitem__(self, distance: int):
+        if distance not in self:
+            raise KeyError(distance)
+        self._cube.set(self._row, distance, None)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.valid_arrays()[0].tolist())
+
+    def __len__(self) -> int:
+        return self.stats().count
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
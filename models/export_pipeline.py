@@ -0,0 +1,122 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from itertools import chain, groupby, islice
+from typing import Any, Iterable, Iterator
+
+import config
+from models import City, Exporter, ExportResult, RecordBatch, StreamingExporter
+from models.tracing import TraceSnapshot, tracer
+
+logger = logging.getLogger(__name__)
+
+# The umask can only be read by setting it, so it is read once at import rather than on every export
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+@contextmanager
+def atomic_output(path: str) -> Iterator[str]:
+    folder = os.path.dirname(path) or '.'
+    os.makedirs(folder, exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(dir=folder, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    os.close(descriptor)
+    try:
+        yield temp_path
+        # mkstemp creates the file as 0600; outputs get the umask-derived mode a plain open() would give them
+        os.chmod(temp_path, 0o666 & ~_UMASK)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _export_records(exporter: Exporter, city_id: str, city_name: str, data: list[dict[str, Any]]) \
+        -> list[ExportResult]:
+    # Jobs carry plain values only: cities and routes hold read-only point mappings, which do not pickle
+    return exporter.export(City(id=city_id, name=city_name, coordinates=(0.0, 0.0), routes=[]), data)
+
+
+def _export_batches(exporter: StreamingExporter, batches: list[RecordBatch]) -> list[ExportResult]:
+    return exporter.export_batches(batches)
+
+
+def _traced_job(record_events: bool, function, *args) -> tuple[list[ExportResult], TraceSnapshot]:
+    # Runs in a worker process; its spans are shipped back and merged into the parent tracer
+    tracer.recording = record_events
+    return function(*args), tracer.drain()
+
+
+class ExportPipeline:
+    def __init__(self, max_workers: int | None = config.EXPORT_MAX_WORKERS):
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    def run(self, exporter: Exporter, jobs: Iterable[tuple[City, list[dict[str, Any]]]]) -> list[ExportResult]:
+        return self._run(((_export_records, exporter, city.id, city.name, data) for city, data in jobs))
+
+    def run_streaming(self, exporter: StreamingExporter, batches: Iterable[RecordBatch]) -> list[ExportResult]:
+        partitions = groupby(batches, key=lambda batch: (batch.city_id, batch.month, batch.product))
+        return self._run(((_export_batches, exporter, list(partition)) for _, partition in partitions))
+
+    def _run(self, jobs: Iterable[tuple]) -> list[ExportResult]:
+        results: list[ExportResult] = []
+        jobs = iter(jobs)
+        # A single job is not worth starting a process pool for
+        first_jobs = list(islice(jobs, 2))
+        if self.max_workers <= 1 or len(first_jobs) < 2:
+            for function, *args in chain(first_jobs, jobs):
+                results.extend(function(*args))
+            return results
+        jobs = chain(first_jobs, jobs)
+
+        # spawn keeps worker processes independent of the Qt threads of the GUI process
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context) as executor:
+            pending: set[Future] = set()
+            for function, *args in jobs:
+                if len(pending) >= self.max_workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results.extend(self._collect(future))
+                pending.add(executor.submit(_traced_job, tracer.recording, function, *args))
+            for future in pending:
+                results.extend(self._collect(future))
+        return results
+
+    @staticmethod
+    def _collect(future: Future) -> list[ExportResult]:
+        results, snapshot = future.result()
+        tracer.merge(snapshot)
+        return results
+
+    @staticmethod
+    def write_manifest(results: list[ExportResult], folder: str) -> str:
+        path = os.path.join(folder, "manifest.json")
+        manifest = {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'total_rows': sum(result.rows for result in results),
+            'files': [
+                {'path': os.path.relpath(result.path, folder), 'rows': result.rows, 'sha256': result.sha256}
+                for result in sorted(results, key=lambda result: result.path)
+            ]
+        }
+        with atomic_output(path) as temp_path:
+            with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+                json.dump(manifest, manifest_file, ensure_ascii=False, indent=2)
+        logger.info("Export manifest written to %s (%d files, %d rows).", path, len(results), manifest['total_rows'])
+        return path
@@ -1,10 +1,57 @@
 from abc import ABC, abstractmethod
-from typing import Any
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+import numpy as np
 
 from .сity import City
 
 
+@dataclass
+class ExportResult:
+    path: str
+    rows: int
+    sha256: str
+
+
+@dataclass
+class RecordBatch:
+    city_id: str
+    city_name: str
+    month: int
+    product: str
+    year: np.ndarray
+    bearing: np.ndarray
+    distance: np.ndarray
+    values: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.distance)
+
+
 class Exporter(ABC):
     @abstractmethod
-    def export(self, city: City, data: list[dict[str, Any]]):
+    def export(self, city: City, data: list[dict[str, Any]]) -> list[ExportResult]:
         pass
+
+
+class StreamingExporter(Exporter):
+    @abstractmethod
+    def export_batches(self, batches: Iterable[RecordBatch]) -> list[ExportResult]:
+        pass
+
+    def export(self, city: City, data: list[dict[str, Any]]) -> list[ExportResult]:
+        batches = []
+        for month, product in sorted({(record['month'], record['product']) for record in data}):
+            records = [record for record in data if record['month'] == month and record['product'] == product]
+            batches.append(RecordBatch(
+                city_id=city.id,
+                city_name=city.name,
+                month=month,
+                product=product,
+                year=np.array([record['year'] for record in records], dtype=np.int32),
+                bearing=np.array([record['bearing'] for record in records], dtype=np.int32),
+                distance=np.array([record['distance'] for record in records], dtype=np.int32),
+                values=np.array([record['value'] for record in records], dtype=np.float32)
+            ))
+        return self.export_batches(batches)
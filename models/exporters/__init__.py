@@ -1 +1,16 @@
-from .csv_exporter import CsvExporter
+from importlib import import_module
+
+# Exporters are imported on first access so that the GUI does not load pandas or pyarrow before the window is shown
+_EXPORTER_MODULES = {
+    'CsvExporter': '.csv_exporter',
+    'CompressedCsvExporter': '.compressed_csv_exporter',
+    'ParquetExporter': '.parquet_exporter',
+}
+
+__all__ = list(_EXPORTER_MODULES)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTER_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_EXPORTER_MODULES[name], __name__), name)
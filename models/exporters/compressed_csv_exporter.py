@@ -0,0 +1,65 @@
+import gzip
+import io
+import logging
+import os
+from itertools import groupby
+from typing import IO, Iterable
+
+import numpy as np
+
+import config
+from models import DEFAULT_PRODUCT_ID, ExportResult, RecordBatch, StreamingExporter
+from models.export_pipeline import atomic_output, file_sha256
+from models.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+class CompressedCsvExporter(StreamingExporter):
+    def __init__(self, folder: str = config.EXPORTS_FOLDER, compression: str = "gzip"):
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.folder = folder
+        self.compression = compression
+
+    def partition_path(self, city_name: str, month: int, product: str = DEFAULT_PRODUCT_ID) -> str:
+        month_name = config.MONTHS.get(month, f"month_{month}")
+        return os.path.join(self.folder,
+                            f"{product}_{month_name}_{city_name}.csv{COMPRESSION_EXTENSIONS[self.compression]}")
+
+    def _open(self, path: str) -> IO[str]:
+        if self.compression == "gzip":
+            return gzip.open(path, 'wt', encoding='utf-8', newline='')
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError("Для сжатия zstd необходим пакет zstandard.") from e
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(path, 'wb')), encoding='utf-8',
+                                newline='')
+
+    def export_batches(self, batches: Iterable[RecordBatch]) -> list[ExportResult]:
+        results = []
+        partitions = groupby(batches, key=lambda batch: (batch.city_name, batch.month, batch.product))
+        for (city_name, month, product), partition_batches in partitions:
+            spec = config.PRODUCTS[product]
+            path = self.partition_path(city_name, month, product)
+            rows = 0
+            with tracer.span("export.write", path=path), atomic_output(path) as temp_path:
+                with self._open(temp_path) as output:
+                    output.write(f"Год\tНаправление\tРасстояние\t{spec.name} ({spec.unit})\n")
+                    for batch in partition_batches:
+                        bearings = [config.BEARINGS.get(bearing, f"{bearing}°") for bearing in batch.bearing.tolist()]
+                        densities = np.char.replace(np.char.mod(config.EXPORT_FLOAT_FORMAT, batch.values), '.', ',')
+                        output.writelines(
+                            f"{year}\t{bearing}\t{distance}\t{density}\n"
+                            for year, bearing, distance, density in zip(batch.year.tolist(), bearings,
+                                                                        batch.distance.tolist(), densities.tolist())
+                        )
+                        rows += len(batch)
+                checksum = file_sha256(temp_path)
+            results.append(ExportResult(path=path, rows=rows, sha256=checksum))
+            tracer.count("export.rows", rows)
+            logger.info("Exported %d records to %s", rows, path)
+        return results
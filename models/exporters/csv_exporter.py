@@ -1,45 +1,57 @@
+import logging
+import os
 from typing import Any
 
 import pandas as pd
 
 import config
-from models import City, Exporter
+from models import City, Exporter, ExportResult
+from models.export_pipeline import atomic_output, file_sha256
+from models.tracing import tracer
+
+logger = logging.getLogger(__name__)
 
 
 class CsvExporter(Exporter):
-    def __init__(self):
-        pass
+    def __init__(self, folder: str = config.EXPORTS_FOLDER):
+        self.folder = folder
 
-    def export(self, city: City, data: list[dict[str, Any]]):
+    def export(self, city: City, data: list[dict[str, Any]]) -> list[ExportResult]:
         if not data:
-            print(f"No data to export for {city.name}.")
-            return
+            logger.warning("No data to export for %s.", city.name)
+            return []
 
         df = pd.DataFrame(data)
 
-        required_cols = ['year', 'bearing', 'distance', 'no2_umol_m2', 'month']
+        required_cols = ['year', 'bearing', 'distance', 'product', 'value', 'month']
         if not all(col in df.columns for col in required_cols):
-            print(
-                f"Missing required columns for export in {city.name}'s data. Required: {required_cols}, Present: {df.columns.tolist()}")
-            return
+            logger.error("Missing required columns for export in %s's data. Required: %s, Present: %s",
+                         city.name, required_cols, df.columns.tolist())
+            return []
 
         export_month_num = data[0]['month']
+        product = config.PRODUCTS[data[0]['product']]
         export_month_name = config.MONTHS.get(export_month_num, f"month_{export_month_num}")
 
         # Map bearing numbers to names BEFORE pivoting
-        df['bearing'] = df['bearing'].map(config.BEARINGS)
+        df['bearing'] = df['bearing'].map(lambda bearing: config.BEARINGS.get(bearing, f"{bearing}°"))
 
         df_pivot = df.pivot_table(
             index=['year', 'bearing'],
             columns='distance',
-            values='no2_umol_m2'
+            values='value'
         ).reset_index()
         df_pivot = df_pivot.rename_axis(columns=None)
 
         # Rename columns 'year' and 'bearing' to 'Год' and 'Направление'
         df_pivot = df_pivot.rename(columns={'year': 'Год', 'bearing': 'Направление'})
 
-        output_file_name = f"no2_{export_month_name}_{city.name}.csv"
+        output_file_name = f"{product.id}_{export_month_name}_{city.name}.csv"
+        output_path = os.path.join(self.folder, output_file_name)
 
-        df_pivot.to_csv(config.EXPORTS_FOLDER + '/' + output_file_name, index=False, decimal=",", sep="\t")
-        print(f"Exported {len(df_pivot)} records to {output_file_name}")
+        with tracer.span("export.write", path=output_path), atomic_output(output_path) as temp_path:
+            df_pivot.to_csv(temp_path, index=False, decimal=",", sep="\t", float_format=config.EXPORT_FLOAT_FORMAT)
+            checksum = file_sha256(temp_path)
+        tracer.count("export.rows", len(df_pivot))
+        logger.info("Exported %d records to %s", len(df_pivot), output_file_name)
+        return [ExportResult(path=output_path, rows=len(df_pivot), sha256=checksum)]
@@ -0,0 +1,56 @@
+import logging
+import os
+from itertools import groupby
+from typing import Iterable
+
+import config
+from models import DEFAULT_PRODUCT_ID, ExportResult, RecordBatch, StreamingExporter
+from models.export_pipeline import atomic_output, file_sha256
+from models.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class ParquetExporter(StreamingExporter):
+    def __init__(self, folder: str = config.EXPORTS_FOLDER, compression: str = "zstd"):
+        self.folder = folder
+        self.compression = compression
+
+    def partition_path(self, city_id: str, month: int, product: str = DEFAULT_PRODUCT_ID) -> str:
+        return os.path.join(self.folder, f"{product}_parquet", f"city_id={city_id}", f"month={month}",
+                            "part-0.parquet")
+
+    def export_batches(self, batches: Iterable[RecordBatch]) -> list[ExportResult]:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Для экспорта в Parquet необходим пакет pyarrow.") from e
+
+        results = []
+        partitions = groupby(batches, key=lambda batch: (batch.city_id, batch.month, batch.product))
+        for (city_id, month, product), partition_batches in partitions:
+            column = config.PRODUCTS[product].column
+            schema = pa.schema([
+                ('year', pa.int32()),
+                ('bearing', pa.int32()),
+                ('distance', pa.int32()),
+                (column, pa.float32())
+            ])
+            path = self.partition_path(city_id, month, product)
+            rows = 0
+            with tracer.span("export.write", path=path), atomic_output(path) as temp_path:
+                with pq.ParquetWriter(temp_path, schema, compression=self.compression) as writer:
+                    for batch in partition_batches:
+                        writer.write_table(pa.table({
+                            'year': batch.year,
+                            'bearing': batch.bearing,
+                            'distance': batch.distance,
+                            column: batch.values
+                        }, schema=schema))
+                        rows += len(batch)
+                checksum = file_sha256(temp_path)
+            results.append(ExportResult(path=path, rows=rows, sha256=checksum))
+            tracer.count("export.rows", rows)
+            logger.info("Exported %d records to %s", rows, path)
+        return results
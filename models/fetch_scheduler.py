@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterator, TypeVar
+
+import config
+from models import Fetcher
+from models.routes import MonthlyDataRoute
+from models.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class FetchScheduler:
+    def __init__(self, max_concurrency: int = config.FETCH_MAX_CONCURRENCY,
+                 request_timeout_s: float | None = config.FETCH_REQUEST_TIMEOUT_S):
+        self.max_concurrency = max_concurrency
+        self.request_timeout_s = request_timeout_s
+
+    @staticmethod
+    def split(items: list[T], batch_size: int | None) -> list[list[T]]:
+        if not batch_size:
+            return [items] if items else []
+        return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+    def run(self, fetcher: Fetcher, batches: list[list[MonthlyDataRoute]]) -> list[list[dict[str, Any]]]:
+        results: list[list[dict[str, Any]] | None] = [None] * len(batches)
+        for index, records in self.iter_run(fetcher, batches):
+            results[index] = records
+        return results
+
+    def iter_run(self, fetcher: Fetcher, batches: list[list[MonthlyDataRoute]]) \
+            -> Iterator[tuple[int, list[dict[str, Any]]]]:
+        # Yields (batch index, records) in completion order, as soon as each request has decoded
+        def fetch_batch(batch: list[MonthlyDataRoute]) -> list[dict[str, Any]]:
+            with tracer.span("fetch.request", routes=len(batch)):
+                return fetcher.fetch_batch(batch)
+
+        return self.iter_map(fetch_batch, batches)
+
+    def iter_map(self, request: Callable[[T], R], items: list[T]) -> Iterator[tuple[int, R]]:
+        # Runs one request per item under the concurrency limit and timeout, yielding in completion order
+        if not items:
+            return
+
+        started_at: dict[int, float] = {}
+        lock = threading.Lock()
+
+        def fetch_one(index: int, item: T) -> R:
+            with lock:
+                started_at[index] = time.monotonic()
+            return request(item)
+
+        max_workers = max(1, min(self.max_concurrency, len(items)))
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch")
+        futures: dict[Future, int] = {
+            executor.submit(fetch_one, index, item): index for index, item in enumerate(items)
+        }
+        logger.debug("FetchScheduler: %d requests submitted, concurrency %d.", len(items), max_workers)
+
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=self._next_deadline(futures, pending, started_at, lock),
+                                     return_when=FIRST_COMPLETED)
+                for future in done:
+                    # Yielded results are not kept, so only requests in flight hold memory
+                    yield futures.pop(future), future.result()
+                self._check_timeouts(futures, pending, started_at, lock)
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown(wait=True)
+
+    def _next_deadline(self, futures: dict[Future, int], pending: set[Future], started_at: dict[int, float],
+                       lock: threading.Lock) -> float | None:
+        if self.request_timeout_s is None:
+            return None
+        now = time.monotonic()
+        with lock:
+            remaining = [started_at[futures[future]] + self.request_timeout_s - now
+                         for future in pending if futures[future] in started_at]
+        return max(0.0, min(remaining)) if remaining else self.request_timeout_s
+
+    def _check_timeouts(self, futures: dict[Future, int], pending: set[Future], started_at: dict[int, float],
+                        lock: threading.Lock):
+        if self.request_timeout_s is None:
+            return
+        now = time.monotonic()
+        with lock:
+            for future in pending:
+                index = futures[future]
+                if index in started_at and now - started_at[index] >= self.request_timeout_s:
+                    raise TimeoutError(f"Fetch request {index} exceeded {self.request_timeout_s} s.")
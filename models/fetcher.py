@@ -1,10 +1,41 @@
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import date
 from typing import Any
 
+import numpy as np
+
+from .product import DEFAULT_PRODUCT_ID
 from .routes import MonthlyDataRoute
 
 
+@dataclass
+class DailySamples:
+    # days is datetime64[D]; values is (day, point) in the product's unit, NaN where the day has no valid pixel
+    days: np.ndarray
+    values: np.ndarray
+
+
 class Fetcher(ABC):
     @abstractmethod
     def fetch(self, routes_by_bearing: dict[int, MonthlyDataRoute], year: int, month: int) -> list[dict[str, Any]]:
         pass
+
+    def fetch_batch(self, routes: list[MonthlyDataRoute]) -> list[dict[str, Any]]:
+        routes_by_period: dict[tuple[int, int, str], dict[int, MonthlyDataRoute]] = {}
+        for route in routes:
+            routes_by_period.setdefault((route.year, route.month, route.product), {})[route.bearing] = route
+
+        results = []
+        for (year, month, product), routes_by_bearing in routes_by_period.items():
+            for record in self.fetch(routes_by_bearing, year, month):
+                results.append({**record, 'month': month, 'product': product})
+        return results
+
+
+class DailyFetcher(Fetcher):
+    @abstractmethod
+    def fetch_daily(self, points: list[tuple[float, float]], start: date, end: date,
+                    product: str = DEFAULT_PRODUCT_ID) -> DailySamples:
+        # Daily means of every point over [start, end)
+        pass
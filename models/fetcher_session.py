@@ -0,0 +1,65 @@
+import logging
+import threading
+from typing import Callable
+
+from models import DailyFetcher, Fetcher
+from models.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def fetcher_class(name: str) -> type[Fetcher]:
+    if name == "gee":
+        from models.fetchers import GeeFetcher
+        return GeeFetcher
+    if name == "local":
+        from models.fetchers import LocalRasterFetcher
+        return LocalRasterFetcher
+    if name == "synthetic":
+        from models.fetchers import SyntheticFetcher
+        return SyntheticFetcher
+    raise ValueError(f"Unknown fetcher: {name}")
+
+
+def create_fetcher(name: str, use_cache: bool = True) -> Fetcher:
+    fetcher = fetcher_class(name)()
+    # The wrappers keep daily support only when the fetcher they wrap has it
+    daily = isinstance(fetcher, DailyFetcher)
+
+    if use_cache:
+        from models.fetchers import CachedDailyFetcher, CachedFetcher
+        fetcher = (CachedDailyFetcher if daily else CachedFetcher)(fetcher)
+
+    if name == "local":
+        # Local rasters are interpolated at the exact coordinates, so points are not snapped to pixel keys
+        return fetcher
+    from models.fetchers import CoalescingDailyFetcher, CoalescingFetcher
+    return (CoalescingDailyFetcher if daily else CoalescingFetcher)(fetcher)
+
+
+class FetcherSession:
+    # One fetcher shared by every run and worker thread; the wrapped fetchers are thread-safe
+    def __init__(self, factory: Callable[[], Fetcher]):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._fetcher: Fetcher | None = None
+
+    def warm_up(self) -> threading.Thread:
+        thread = threading.Thread(target=self._warm_up, name="fetcher-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def _warm_up(self):
+        try:
+            self.get()
+        except Exception:
+            # A failed warm-up is retried, and reported, by the first run that needs the fetcher
+            logger.exception("Fetcher warm-up failed.")
+
+    def get(self) -> Fetcher:
+        with self._lock:
+            if self._fetcher is None:
+                with tracer.span("session.create"):
+                    self._fetcher = self._factory()
+                logger.info("Fetcher session ready: %s.", type(self._fetcher).__name__)
+            return self._fetcher
@@ -1 +1,20 @@
-from .gee_fetcher import GeeFetcher
+from importlib import import_module
+
+# Fetchers are imported on first access so that offline fetchers do not pull in the Earth Engine client
+_FETCHER_MODULES = {
+    'CachedDailyFetcher': '.cached_fetcher',
+    'CachedFetcher': '.cached_fetcher',
+    'CoalescingDailyFetcher': '.coalescing_fetcher',
+    'CoalescingFetcher': '.coalescing_fetcher',
+    'GeeFetcher': '.gee_fetcher',
+    'LocalRasterFetcher': '.local_raster_fetcher',
+    'SyntheticFetcher': '.synthetic_fetcher',
+}
+
+__all__ = list(_FETCHER_MODULES)
+
+
+def __getattr__(name: str):
+    if name not in _FETCHER_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_FETCHER_MODULES[name], __name__), name)
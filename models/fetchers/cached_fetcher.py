@@ -0,0 +1,209 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+from typing import Any, Iterable
+
+import config
+from models import DEFAULT_PRODUCT_ID, DailyFetcher, DailySamples, Fetcher
+from models.periods import is_settled
+from models.routes import MonthlyDataRoute
+from models.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+CacheKey = tuple[str, str, int, int, float, int, int]
+
+
+class CachedFetcher(Fetcher):
+    def __init__(self, fetcher: Fetcher, path: str = config.SAMPLE_CACHE_PATH,
+                 ttl_seconds: float | None = config.SAMPLE_CACHE_TTL_SECONDS,
+                 max_entries: int | None = config.SAMPLE_CACHE_MAX_ENTRIES,
+                 scale: float = config.GEE_COLLECTION_SCALE,
+                 coord_digits: int = config.SAMPLE_CACHE_COORD_DIGITS):
+        self.fetcher = fetcher
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.scale = scale
+        self.coord_digits = coord_digits
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=config.SAMPLE_CACHE_BUSY_TIMEOUT_SECONDS,
+                                           check_same_thread=False)
+        # WAL lets readers in other processes proceed while a write is in progress
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS samples (
+                collection TEXT NOT NULL,
+                band TEXT NOT NULL,
+                lat INTEGER NOT NULL,
+                lon INTEGER NOT NULL,
+                scale REAL NOT NULL,
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                value REAL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (collection, band, lat, lon, scale, year, month)
+            )
+        """)
+        self._connection.execute("CREATE INDEX IF NOT EXISTS samples_accessed_at ON samples (accessed_at)")
+        self._connection.commit()
+        # Upper bound on the row count: replaced rows are counted as new until the next eviction recounts
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+        self._stored_since_eviction = 0
+        logger.info("Sample cache opened at %s with %d entries.", path, self._entries)
+
+    def _key(self, product: str, point: tuple[float, float], year: int, month: int) -> CacheKey:
+        # Products are told apart by their collection and band, which the table has keyed from the start
+        factor = 10 ** self.coord_digits
+        lat, lon = point
+        spec = config.PRODUCTS[product]
+        return spec.collection, spec.band, round(lat * factor), round(lon * factor), self.scale, year, month
+
+    def _read_cached(self, routes: Iterable[MonthlyDataRoute], period: tuple[int, int] | None = None) \
+            -> tuple[list[dict[str, Any]], list[tuple[MonthlyDataRoute, MonthlyDataRoute]]]:
+        now = time.time()
+        oldest_valid = now - self.ttl_seconds if self.ttl_seconds is not None else None
+        records = []
+        missing_routes = []
+        accessed_keys = []
+
+        with self._lock:
+            for route in routes:
+                year, month = period or (route.year, route.month)
+                # Months that are still filling in or not yet published are always fetched afresh
+                settled = is_settled(year, month)
+                missing_distances = []
+                for distance in route.distances:
+                    if not settled:
+                        missing_distances.append(distance)
+                        continue
+                    key = self._key(route.product, route.points[distance], year, month)
+                    row = self._connection.execute(
+                        "SELECT value, fetched_at FROM samples WHERE collection = ? AND band = ? AND lat = ? "
+                        "AND lon = ? AND scale = ? AND year = ? AND month = ?", key
+                    ).fetchone()
+                    if row is None or (oldest_valid is not None and row[1] < oldest_valid):
+                        missing_distances.append(distance)
+                        continue
+
+                    accessed_keys.append((now, *key))
+                    value = row[0]
+                    if value is None:
+                        continue
+                    route.densities[distance] = value
+                    records.append({
+                        'year': year,
+                        'month': month,
+                        'bearing': route.bearing,
+                        'distance': distance,
+                        'product': route.product,
+                        'value': value
+                    })
+
+                if missing_distances:
+                    missing_routes.append((route, MonthlyDataRoute(
+                        city_id=route.city_id,
+                        bearing=route.bearing,
+                        year=year,
+                        month=month,
+                        product=route.product,
+                        distances=missing_distances,
+                        points={distance: route.points[distance] for distance in missing_distances}
+                    )))
+
+            self._connection.executemany(
+                "UPDATE samples SET accessed_at = ? WHERE collection = ? AND band = ? AND lat = ? AND lon = ? "
+                "AND scale = ? AND year = ? AND month = ?", accessed_keys
+            )
+            self._connection.commit()
+            misses = sum(len(missing_route.distances) for _, missing_route in missing_routes)
+            self.hits += len(accessed_keys)
+            self.misses += misses
+        tracer.count("cache.hits", len(accessed_keys))
+        tracer.count("cache.misses", misses)
+
+        return records, missing_routes
+
+    def _store(self, missing_routes: list[tuple[MonthlyDataRoute, MonthlyDataRoute]]):
+        now = time.time()
+        rows = []
+        for original_route, fetched_route in missing_routes:
+            settled = is_settled(fetched_route.year, fetched_route.month)
+            for distance in fetched_route.distances:
+                value = fetched_route.densities.get(distance)
+                if value is not None:
+                    original_route.densities[distance] = value
+                if not settled:
+                    continue
+                key = self._key(fetched_route.product, fetched_route.points[distance], fetched_route.year,
+                                fetched_route.month)
+                rows.append((*key, value, now, now))
+
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._connection.commit()
+            self._entries += len(rows)
+            self._stored_since_eviction += len(rows)
+            over_limit = self.max_entries is not None and self._entries > self.max_entries
+            purge_due = self.ttl_seconds is not None and \
+                self._stored_since_eviction >= config.SAMPLE_CACHE_EVICT_INTERVAL
+        if over_limit or purge_due:
+            self.evict()
+
+    def evict(self):
+        with self._lock:
+            if self.ttl_seconds is not None:
+                self._connection.execute("DELETE FROM samples WHERE fetched_at < ?", (time.time() - self.ttl_seconds,))
+            self._entries = self._connection.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+            if self.max_entries is not None and self._entries > self.max_entries:
+                excess = self._entries - int(self.max_entries * (1 - config.SAMPLE_CACHE_EVICT_HEADROOM))
+                self._connection.execute(
+                    "DELETE FROM samples WHERE rowid IN "
+                    "(SELECT rowid FROM samples ORDER BY accessed_at LIMIT ?)", (excess,)
+                )
+                self._entries -= excess
+                logger.debug("Evicted %d least recently used samples.", excess)
+            self._stored_since_eviction = 0
+            self._connection.commit()
+
+    def stats(self) -> dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def fetch(self, routes_by_bearing: dict[int, MonthlyDataRoute], year: int, month: int) -> list[dict[str, Any]]:
+        with tracer.span("cache.read"):
+            records, missing_routes = self._read_cached(routes_by_bearing.values(), (year, month))
+        logger.debug("CachedFetcher.fetch: %d hits, %d misses so far.", self.hits, self.misses)
+        if missing_routes:
+            fetched = self.fetcher.fetch({route.bearing: route for _, route in missing_routes}, year, month)
+            with tracer.span("cache.store"):
+                self._store(missing_routes)
+            records.extend({**record, 'month': month} for record in fetched)
+        return records
+
+    def fetch_batch(self, routes: list[MonthlyDataRoute]) -> list[dict[str, Any]]:
+        with tracer.span("cache.read"):
+            records, missing_routes = self._read_cached(routes)
+        logger.debug("CachedFetcher.fetch_batch: %d hits, %d misses so far.", self.hits, self.misses)
+        if missing_routes:
+            records.extend(self.fetcher.fetch_batch([route for _, route in missing_routes]))
+            with tracer.span("cache.store"):
+                self._store(missing_routes)
+        return records
+
+
+class CachedDailyFetcher(CachedFetcher, DailyFetcher):
+    fetcher: DailyFetcher
+
+    def fetch_daily(self, points: list[tuple[float, float]], start: date, end: date,
+                    product: str = DEFAULT_PRODUCT_ID) -> DailySamples:
+        # Daily series are persisted by the append-only daily store, so they bypass the monthly sample cache
+        return self.fetcher.fetch_daily(points, start, end, product)
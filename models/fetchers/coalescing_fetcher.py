@@ -0,0 +1,143 @@
+import logging
+import math
+import threading
+from concurrent.futures import Future
+from datetime import date
+from typing import Any
+
+import config
+from models import DEFAULT_PRODUCT_ID, DailyFetcher, DailySamples, Fetcher
+from models.fetch_scheduler import FetchScheduler
+from models.routes import MonthlyDataRoute
+from models.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# (lat cell, lon cell, year, month, product id)
+PixelKey = tuple[int, int, int, int, str]
+SampleRequest = tuple[MonthlyDataRoute, int, int, int]
+
+
+class CoalescingFetcher(Fetcher):
+    def __init__(self, fetcher: Fetcher, pixel_degrees: float = config.PIXEL_KEY_DEGREES):
+        self.fetcher = fetcher
+        self.pixel_degrees = pixel_degrees
+        self._lock = threading.Lock()
+        self._in_flight: dict[PixelKey, Future] = {}
+
+    def _pixel_key(self, point: tuple[float, float], year: int, month: int,
+                   product: str = DEFAULT_PRODUCT_ID) -> PixelKey:
+        lat, lon = point
+        return math.floor(lat / self.pixel_degrees), math.floor(lon / self.pixel_degrees), year, month, product
+
+    def _pixel_center(self, key: PixelKey) -> tuple[float, float]:
+        return (key[0] + 0.5) * self.pixel_degrees, (key[1] + 0.5) * self.pixel_degrees
+
+    def _fetch_pixels(self, keys: list[PixelKey]) -> dict[PixelKey, float | None]:
+        # Each pixel becomes one numbered point of a per-period route, so a pixel shared by periods and products
+        # is sampled once; pixels are chunked so that no request exceeds the point limit
+        keys_by_pixel: dict[tuple[int, int], list[PixelKey]] = {}
+        for key in keys:
+            keys_by_pixel.setdefault(key[:2], []).append(key)
+
+        values: dict[PixelKey, float | None] = dict.fromkeys(keys)
+        for pixels in FetchScheduler.split(list(keys_by_pixel), config.FETCH_MAX_POINTS_PER_REQUEST):
+            routes_by_period: dict[tuple[int, int, str], MonthlyDataRoute] = {}
+            for pixel_id, pixel in enumerate(pixels):
+                for key in keys_by_pixel[pixel]:
+                    route = routes_by_period.get(key[2:])
+                    if route is None:
+                        route = routes_by_period[key[2:]] = MonthlyDataRoute(
+                            city_id='', bearing=0, year=key[2], month=key[3], product=key[4], distances=[], points={}
+                        )
+                    route.distances.append(pixel_id)
+                    route.points[pixel_id] = self._pixel_center(key)
+
+            for record in self.fetcher.fetch_batch(list(routes_by_period.values())):
+                values[(*pixels[record['distance']], record['year'], record['month'], record['product'])] = \
+                    record['value']
+        return values
+
+    def _sample(self, requests: list[SampleRequest]) -> list[dict[str, Any]]:
+        request_keys = [self._pixel_key(route.points[distance], year, month, route.product)
+                        for route, distance, year, month in requests]
+        owned: dict[PixelKey, Future] = {}
+        shared: dict[PixelKey, Future] = {}
+        with self._lock:
+            for key in request_keys:
+                if key in owned or key in shared:
+                    continue
+                future = self._in_flight.get(key)
+                if future is None:
+                    owned[key] = self._in_flight[key] = Future()
+                else:
+                    shared[key] = future
+        tracer.count("coalesce.points", len(requests))
+        tracer.count("coalesce.pixels", len(owned))
+        tracer.count("coalesce.shared", len(shared))
+        logger.debug("CoalescingFetcher: %d points -> %d pixels to fetch, %d already in flight.", len(requests),
+                     len(owned), len(shared))
+
+        values: dict[PixelKey, float | None] = {}
+        if owned:
+            try:
+                with tracer.span("coalesce.fetch", pixels=len(owned)):
+                    values = self._fetch_pixels(list(owned))
+            except BaseException as error:
+                with self._lock:
+                    for key in owned:
+                        del self._in_flight[key]
+                for future in owned.values():
+                    future.set_exception(error)
+                raise
+            with self._lock:
+                for key in owned:
+                    del self._in_flight[key]
+            for key, future in owned.items():
+                future.set_result(values[key])
+
+        # Own pixels are fetched before waiting, so two requests sharing each other's pixels cannot deadlock
+        if shared:
+            with tracer.span("coalesce.wait", pixels=len(shared)):
+                for key, future in shared.items():
+                    values[key] = future.result()
+
+        processed_results = []
+        for (route, distance, year, month), key in zip(requests, request_keys):
+            value = values[key]
+            if value is None:
+                continue
+            route.densities[distance] = value
+            processed_results.append({
+                'year': year,
+                'month': month,
+                'bearing': route.bearing,
+                'distance': distance,
+                'product': route.product,
+                'value': value
+            })
+        return processed_results
+
+    def fetch(self, routes_by_bearing: dict[int, MonthlyDataRoute], year: int, month: int) -> list[dict[str, Any]]:
+        requests = [(route, distance, year, month) for route in routes_by_bearing.values()
+                    for distance in route.distances]
+        return [{key: value for key, value in record.items() if key != 'month'} for record in self._sample(requests)]
+
+    def fetch_batch(self, routes: list[MonthlyDataRoute]) -> list[dict[str, Any]]:
+        return self._sample([(route, distance, route.year, route.month) for route in routes
+                             for distance in route.distances])
+
+
+class CoalescingDailyFetcher(CoalescingFetcher, DailyFetcher):
+    fetcher: DailyFetcher
+
+    def fetch_daily(self, points: list[tuple[float, float]], start: date, end: date,
+                    product: str = DEFAULT_PRODUCT_ID) -> DailySamples:
+        # Points sharing a pixel are sampled once and the pixel's column is repeated for each of them
+        pixel_ids: dict[tuple[int, int], int] = {}
+        columns = [pixel_ids.setdefault(self._pixel_key(point, 0, 0)[:2], len(pixel_ids)) for point in points]
+        tracer.count("coalesce.daily_points", len(points))
+        tracer.count("coalesce.daily_pixels", len(pixel_ids))
+        samples = self.fetcher.fetch_daily([self._pixel_center((*pixel, 0, 0, product)) for pixel in pixel_ids], start,
+                                           end, product)
+        return DailySamples(days=samples.days, values=samples.values[:, columns])
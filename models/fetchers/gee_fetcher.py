@@ -1,78 +1,257 @@
-import traceback
+import logging
+import threading
+from datetime import date, timedelta
 from typing import Any, cast
 
 import ee
+import numpy as np
 
 import config
-from models import Fetcher
+from models import DEFAULT_PRODUCT_ID, DailyFetcher, DailySamples, Product
+from models.fetch_scheduler import FetchScheduler
 from models.routes import MonthlyDataRoute, PointsRoute
+from models.tracing import tracer
 
+logger = logging.getLogger(__name__)
 
-class GeeFetcher(Fetcher):
-    def __init__(self):
-        self._initialize_ee()
+# sampleRegions drops a point masked in any band, so the stacked image is unmasked with a sentinel
+# and masked periods are skipped per route, as the single-period fetch does
+MASKED_SENTINEL = -9999
+
+_session_lock = threading.Lock()
+_session_ready = False
+
+
+def _to_product_unit(value: float | None, product: Product) -> float | None:
+    if value is None or value == MASKED_SENTINEL:
+        return None
+    return value * product.scale
+
+
+def _period_band(product: Product, year: int, month: int) -> str:
+    return f"{product.id}_{year}_{month:02d}"
 
-    def _initialize_ee(self):
+
+def _day_band(product: Product, day: date) -> str:
+    return f"{product.id}_{day:%Y%m%d}"
+
+
+def initialize_session():
+    # ee.Initialize is process-wide, so it runs once however many fetchers and threads ask for it
+    global _session_ready
+    if _session_ready:
+        return
+    with _session_lock:
+        if _session_ready:
+            return
         try:
-            ee.Initialize(project=config.G_PROJECT_ID)
-            print("Earth Engine initialized successfully.")
-        except Exception as e:
+            with tracer.span("gee.initialize"):
+                ee.Initialize(project=config.G_PROJECT_ID)
+            logger.info("Earth Engine initialized successfully.")
+        except Exception:
+            logger.exception("Earth Engine initialization failed.")
             ee.Authenticate()
-            print(e)
             raise
+        _session_ready = True
 
-    def fetch(self, routes_by_bearing: dict[int, MonthlyDataRoute], year: int, month: int) -> list[dict[str, Any]]:
-        print(f"GeeFetcher.fetch called for year={year}, month={month}")
+
+class GeeFetcher(DailyFetcher):
+    def __init__(self):
+        initialize_session()
+
+    @staticmethod
+    def _monthly_mean_image(product: Product, year: int, month: int):
         start_date = ee.Date.fromYMD(year, month, 1)
         end_date = start_date.advance(1, 'month')
-        print(f"Fetching NO2 data for {start_date.getInfo()} to {end_date.getInfo()}")
-
-        monthly_mean_image = (
-            ee.ImageCollection(config.GEE_NO2_COLLECTION)
-            .select("NO2_column_number_density")
+        return (
+            ee.ImageCollection(product.collection)
+            .select(product.band)
             .filterDate(start_date, end_date)
             .mean()
         )
-        print("Image collection filtered and mean calculated.")
 
-        points = []
-        for route in routes_by_bearing.values():
-            for distance in route.distances:
-                lat, lon = cast(PointsRoute, route).points[distance]
-                point = ee.Geometry.Point(lon, lat)
-                feature = ee.Feature(point, {'bearing': route.bearing, 'distance': distance})
-                points.append(feature)
-        print(f"Generated {len(points)} points for sampling.")
-
-        sampled_features = monthly_mean_image.sampleRegions(
-            collection=ee.FeatureCollection(points),
-            scale=config.GEE_COLLECTION_SCALE,
-            geometries=True
-        )
+    @staticmethod
+    def _period_means_image(product: Product, periods: list[tuple[int, int]]):
+        # All period means come from one server-side map over an ee.List, so the graph does not grow with periods
+        collection = ee.ImageCollection(product.collection).select(product.band)
+        empty_mean = ee.Image.constant(MASKED_SENTINEL).rename(product.band)
+
+        def period_mean(period):
+            period = ee.List(period)
+            start_date = ee.Date.fromYMD(period.get(0), period.get(1), 1)
+            monthly = collection.filterDate(start_date, start_date.advance(1, 'month'))
+            return ee.Image(ee.Algorithms.If(monthly.size().gt(0), monthly.mean(), empty_mean)) \
+                .unmask(MASKED_SENTINEL)
+
+        means = ee.ImageCollection.fromImages(ee.List([[year, month] for year, month in periods]).map(period_mean))
+        return means.toBands().rename([_period_band(product, year, month) for year, month in periods])
+
+    @staticmethod
+    def _daily_means_image(product: Product, start: date, days: int):
+        # S5P L3 images are per orbit; the orbits of each day are averaged into one band of a single stacked image
+        collection = ee.ImageCollection(product.collection).select(product.band)
+        empty_mean = ee.Image.constant(MASKED_SENTINEL).rename(product.band)
+        start_date = ee.Date(start.isoformat())
+
+        def day_mean(offset):
+            day_start = start_date.advance(offset, 'day')
+            daily = collection.filterDate(day_start, day_start.advance(1, 'day'))
+            return ee.Image(ee.Algorithms.If(daily.size().gt(0), daily.mean(), empty_mean)) \
+                .unmask(MASKED_SENTINEL)
+
+        means = ee.ImageCollection.fromImages(ee.List.sequence(0, days - 1).map(day_mean))
+        return means.toBands().rename([_day_band(product, start + timedelta(days=offset)) for offset in range(days)])
+
+    @staticmethod
+    def _sample_chunk(image, features: list) -> list[dict[str, Any]]:
+        with tracer.span("gee.build_graph"):
+            sampled_features = image.sampleRegions(
+                collection=ee.FeatureCollection(features),
+                scale=config.GEE_COLLECTION_SCALE,
+                geometries=True
+            )
 
-        print("SampleRegions operation defined. About to call getInfo()...")
+        logger.debug("SampleRegions operation defined for %d points. About to call getInfo()...", len(features))
 
         try:
-            results_info = sampled_features.getInfo()['features']
-            print("getInfo() call completed successfully.")
-        except Exception as e:
-            print(e)
-            traceback.print_exc()
+            with tracer.span("gee.getInfo", points=len(features)):
+                results_info = sampled_features.getInfo()['features']
+        except Exception:
+            logger.exception("getInfo() call failed.")
             raise
+        tracer.count("gee.requests")
+        tracer.count("gee.points", len(features))
+        logger.debug("getInfo() call completed with %d features.", len(results_info))
+        return results_info
+
+    def _sample(self, image, features: list) -> list[dict[str, Any]]:
+        # The image graph is shared by every chunk; only the sampled points are split
+        results_info = []
+        for chunk in FetchScheduler.split(features, config.FETCH_MAX_POINTS_PER_REQUEST):
+            results_info.extend(self._sample_chunk(image, chunk))
+        return results_info
+
+    def fetch(self, routes_by_bearing: dict[int, MonthlyDataRoute], year: int, month: int) -> list[dict[str, Any]]:
+        product = config.PRODUCTS[next(iter(routes_by_bearing.values())).product]
+        logger.debug("GeeFetcher.fetch called for %s, year=%d, month=%d", product.id, year, month)
+
+        with tracer.span("gee.build_graph"):
+            monthly_mean_image = self._monthly_mean_image(product, year, month)
+
+            points = []
+            for route in routes_by_bearing.values():
+                for distance in route.distances:
+                    lat, lon = cast(PointsRoute, route).points[distance]
+                    point = ee.Geometry.Point(lon, lat)
+                    feature = ee.Feature(point, {'bearing': route.bearing, 'distance': distance})
+                    points.append(feature)
+        logger.debug("Generated %d points for sampling.", len(points))
+
+        results_info = self._sample(monthly_mean_image, points)
 
         processed_results = []
-        for feature in results_info:
-            props = feature['properties']
-            no2_value = props.get("NO2_column_number_density")
-            no2_umol_m2 = no2_value * config.MOL_PER_M2_TO_UMOL_PER_M2 if no2_value is not None else None
-            bearing = props['bearing']
-            distance = props['distance']
-            routes_by_bearing[bearing].densities[distance] = no2_umol_m2
-
-            processed_results.append({
-                'year': year,
-                'bearing': bearing,
-                'distance': distance,
-                'no2_umol_m2': no2_umol_m2
-            })
+        with tracer.span("gee.decode"):
+            for feature in results_info:
+                props = feature['properties']
+                value = _to_product_unit(props.get(product.band), product)
+                bearing = props['bearing']
+                distance = props['distance']
+                routes_by_bearing[bearing].densities[distance] = value
+
+                processed_results.append({
+                    'year': year,
+                    'bearing': bearing,
+                    'distance': distance,
+                    'product': product.id,
+                    'value': value
+                })
         return processed_results
+
+    def fetch_batch(self, routes: list[MonthlyDataRoute]) -> list[dict[str, Any]]:
+        periods_by_product: dict[str, set[tuple[int, int]]] = {}
+        for route in routes:
+            periods_by_product.setdefault(route.product, set()).add((route.year, route.month))
+        bands = [(config.PRODUCTS[product_id], year, month)
+                 for product_id, periods in sorted(periods_by_product.items()) for year, month in sorted(periods)]
+        logger.debug("GeeFetcher.fetch_batch called for %d routes over %d product periods", len(routes), len(bands))
+        if not bands:
+            return []
+
+        with tracer.span("gee.build_graph", periods=len(bands), products=len(periods_by_product)):
+            # Every product's period stack joins one image, so all products cost a single sampleRegions round trip
+            stacked_image = ee.Image.cat([
+                self._period_means_image(config.PRODUCTS[product_id], sorted(periods))
+                for product_id, periods in sorted(periods_by_product.items())
+            ])
+
+            routes_by_key: dict[tuple[int, int, int, str], MonthlyDataRoute] = {}
+            distances_by_key: dict[tuple[int, int, int, str], set[int]] = {}
+            points_by_key: dict[tuple[int, int], tuple[float, float]] = {}
+            for route in routes:
+                route_key = (route.bearing, route.year, route.month, route.product)
+                routes_by_key[route_key] = route
+                distances_by_key[route_key] = set(route.distances)
+                for distance in route.distances:
+                    points_by_key[(route.bearing, distance)] = cast(PointsRoute, route).points[distance]
+
+            points = []
+            for (bearing, distance), (lat, lon) in points_by_key.items():
+                point = ee.Geometry.Point(lon, lat)
+                points.append(ee.Feature(point, {'bearing': bearing, 'distance': distance}))
+        logger.debug("Generated %d unique points for sampling.", len(points))
+
+        results_info = self._sample(stacked_image, points)
+
+        processed_results = []
+        with tracer.span("gee.decode", features=len(results_info)):
+            for feature in results_info:
+                props = feature['properties']
+                bearing = props['bearing']
+                distance = props['distance']
+                for product, year, month in bands:
+                    route_key = (bearing, year, month, product.id)
+                    route = routes_by_key.get(route_key)
+                    if route is None or distance not in distances_by_key[route_key]:
+                        continue
+                    value = _to_product_unit(props.get(_period_band(product, year, month)), product)
+                    if value is None:
+                        continue
+                    route.densities[distance] = value
+
+                    processed_results.append({
+                        'year': year,
+                        'month': month,
+                        'bearing': bearing,
+                        'distance': distance,
+                        'product': product.id,
+                        'value': value
+                    })
+        return processed_results
+
+    def fetch_daily(self, points: list[tuple[float, float]], start: date, end: date,
+                    product: str = DEFAULT_PRODUCT_ID) -> DailySamples:
+        days = (end - start).days
+        logger.debug("GeeFetcher.fetch_daily called for %s, %d points over %d days from %s", product, len(points),
+                     days, start)
+        values = np.full((days, len(points)), np.nan, dtype=np.float32)
+        if days <= 0 or not points:
+            return DailySamples(days=np.arange(np.datetime64(start), np.datetime64(end)), values=values)
+
+        spec = config.PRODUCTS[product]
+        with tracer.span("gee.build_graph", days=days):
+            stacked_image = self._daily_means_image(spec, start, days)
+            features = [ee.Feature(ee.Geometry.Point(lon, lat), {'point': index})
+                        for index, (lat, lon) in enumerate(points)]
+        bands = [_day_band(spec, start + timedelta(days=offset)) for offset in range(days)]
+
+        results_info = self._sample(stacked_image, features)
+
+        with tracer.span("gee.decode", features=len(results_info)):
+            for feature in results_info:
+                props = feature['properties']
+                column = props['point']
+                for offset, band in enumerate(bands):
+                    value = _to_product_unit(props.get(band), spec)
+                    if value is not None:
+                        values[offset, column] = value
+        return DailySamples(days=np.arange(np.datetime64(start), np.datetime64(end)), values=values)
@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, cast
+
+import numpy as np
+
+import config
+from models import Fetcher
+from models.routes import MonthlyDataRoute, PointsRoute
+from models.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+RASTER_EXTENSIONS = ('.npy', '.tif', '.tiff', '.nc')
+
+
+@dataclass
+class LocalRaster:
+    values: np.ndarray
+    # GDAL-style geotransform of the pixel corner grid: (lon0, dlon, 0, lat0, 0, dlat)
+    transform: tuple[float, float, float, float, float, float]
+    nodata: float | None = None
+    scale: float = 1.0
+    # Conversion from the raster's mol/m² to the product unit
+    unit_scale: float = 1.0
+
+    def sample(self, lats: np.ndarray, lons: np.ndarray, interpolation: str = "bilinear") -> np.ndarray:
+        lon0, dlon, _, lat0, _, dlat = self.transform
+        columns = (lons - lon0) / dlon - 0.5
+        rows = (lats - lat0) / dlat - 0.5
+        height, width = self.values.shape
+
+        if interpolation == "nearest":
+            row_index = np.rint(rows).astype(np.int64)
+            column_index = np.rint(columns).astype(np.int64)
+            inside = (row_index >= 0) & (row_index < height) & (column_index >= 0) & (column_index < width)
+            result = np.full(lats.shape, np.nan, dtype=np.float64)
+            result[inside] = self._masked(self.values[row_index[inside], column_index[inside]])
+            return self._to_product_unit(result)
+
+        if interpolation != "bilinear":
+            raise ValueError(f"Unknown interpolation: {interpolation}")
+
+        row0 = np.floor(rows).astype(np.int64)
+        column0 = np.floor(columns).astype(np.int64)
+        row_weight = rows - row0
+        column_weight = columns - column0
+        inside = (row0 >= 0) & (row0 + 1 < height) & (column0 >= 0) & (column0 + 1 < width)
+
+        result = np.full(lats.shape, np.nan, dtype=np.float64)
+        r, c = row0[inside], column0[inside]
+        wr, wc = row_weight[inside], column_weight[inside]
+        top_left = self._masked(self.values[r, c])
+        top_right = self._masked(self.values[r, c + 1])
+        bottom_left = self._masked(self.values[r + 1, c])
+        bottom_right = self._masked(self.values[r + 1, c + 1])
+        result[inside] = ((top_left * (1 - wc) + top_right * wc) * (1 - wr) +
+                          (bottom_left * (1 - wc) + bottom_right * wc) * wr)
+        return self._to_product_unit(result)
+
+    def _masked(self, values: np.ndarray) -> np.ndarray:
+        values = values.astype(np.float64)
+        if self.nodata is not None:
+            values[values == self.nodata] = np.nan
+        return values
+
+    def _to_product_unit(self, values: np.ndarray) -> np.ndarray:
+        return values * self.scale * self.unit_scale
+
+
+def _read_sidecar(path: str) -> dict[str, Any]:
+    with open(os.path.splitext(path)[0] + '.json', encoding='utf-8') as metadata_file:
+        return json.load(metadata_file)
+
+
+def _write_npy_with_sidecar(path: str, values: np.ndarray, metadata: dict[str, Any]) -> str:
+    npy_path = os.path.splitext(path)[0] + '.npy'
+    np.save(npy_path, np.ascontiguousarray(values, dtype=np.float32))
+    with open(os.path.splitext(path)[0] + '.json', 'w', encoding='utf-8') as metadata_file:
+        json.dump(metadata, metadata_file)
+    return npy_path
+
+
+def _convert_geotiff(path: str) -> str:
+    try:
+        import rasterio
+    except ImportError as e:
+        raise ImportError("Для чтения GeoTIFF необходим пакет rasterio.") from e
+
+    with rasterio.open(path) as dataset:
+        values = dataset.read(1)
+        metadata = {'transform': list(dataset.transform.to_gdal()), 'nodata': dataset.nodata}
+    return _write_npy_with_sidecar(path, values, metadata)
+
+
+def _convert_netcdf(path: str, band: str) -> str:
+    try:
+        import xarray
+    except ImportError as e:
+        raise ImportError("Для чтения NetCDF необходим пакет xarray.") from e
+
+    with xarray.open_dataset(path) as dataset:
+        variable = dataset[band].squeeze()
+        lats = variable['lat'].values
+        lons = variable['lon'].values
+        values = variable.values
+    dlat = float(lats[1] - lats[0])
+    dlon = float(lons[1] - lons[0])
+    metadata = {
+        'transform': [float(lons[0]) - dlon / 2, dlon, 0.0, float(lats[0]) - dlat / 2, 0.0, dlat],
+        'nodata': None
+    }
+    return _write_npy_with_sidecar(path, values, metadata)
+
+
+class LocalRasterFetcher(Fetcher):
+    def __init__(self, folder: str = config.LOCAL_RASTER_FOLDER, interpolation: str = config.LOCAL_RASTER_INTERPOLATION):
+        self.folder = folder
+        self.interpolation = interpolation
+        self._rasters: dict[tuple[str, int, int], LocalRaster | None] = {}
+        self._lock = threading.Lock()
+
+    def _find_raster_path(self, product: str, year: int, month: int) -> str | None:
+        base_name = config.LOCAL_RASTER_FILE_PATTERN.format(product=product, year=year, month=month)
+        for extension in RASTER_EXTENSIONS:
+            path = os.path.join(self.folder, base_name + extension)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _load(self, product: str, year: int, month: int) -> LocalRaster | None:
+        with self._lock:
+            if (product, year, month) in self._rasters:
+                return self._rasters[(product, year, month)]
+
+            spec = config.PRODUCTS[product]
+            path = self._find_raster_path(product, year, month)
+            if path is None:
+                logger.warning("No local %s raster found for %d-%02d in %s.", product, year, month, self.folder)
+                raster = None
+            else:
+                if path.endswith(('.tif', '.tiff')):
+                    path = _convert_geotiff(path)
+                elif path.endswith('.nc'):
+                    path = _convert_netcdf(path, spec.band)
+                metadata = _read_sidecar(path)
+                raster = LocalRaster(
+                    values=np.load(path, mmap_mode='r'),
+                    transform=cast(tuple[float, float, float, float, float, float], tuple(metadata['transform'])),
+                    nodata=metadata.get('nodata'),
+                    scale=metadata.get('scale', 1.0),
+                    unit_scale=spec.scale
+                )
+                logger.info("Memory-mapped local raster %s %s.", path, raster.values.shape)
+            self._rasters[(product, year, month)] = raster
+            return raster
+
+    def fetch(self, routes_by_bearing: dict[int, MonthlyDataRoute], year: int, month: int) -> list[dict[str, Any]]:
+        product = next(iter(routes_by_bearing.values())).product
+        raster = self._load(product, year, month)
+        if raster is None:
+            return []
+
+        keys = []
+        coordinates = []
+        for route in routes_by_bearing.values():
+            for distance in route.distances:
+                keys.append((route.bearing, distance))
+                coordinates.append(cast(PointsRoute, route).points[distance])
+        if not coordinates:
+            return []
+
+        lats, lons = np.asarray(coordinates, dtype=np.float64).T
+        with tracer.span("raster.sample", points=len(coordinates)):
+            samples = raster.sample(lats, lons, self.interpolation)
+        tracer.count("raster.points", len(coordinates))
+
+        processed_results = []
+        for (bearing, distance), value in zip(keys, samples.tolist()):
+            if np.isnan(value):
+                continue
+            routes_by_bearing[bearing].densities[distance] = value
+            processed_results.append({
+                'year': year,
+                'bearing': bearing,
+                'distance': distance,
+                'product': product,
+                'value': value
+            })
+        return processed_results
@@ -0,0 +1,130 @@
+import math
+import time
+from datetime import date
+from typing import Any, Iterable, cast
+
+import numpy as np
+
+import config
+from models import DEFAULT_PRODUCT_ID, DailyFetcher, DailySamples
+from models.routes import MonthlyDataRoute, PointsRoute
+from models.tracing import tracer
+
+# Every product shares the NO2 plume shape, scaled to a plausible magnitude in its own unit
+PRODUCT_FACTORS = {'no2': 1.0, 'co': 0.3, 'so2': 0.2, 'hcho': 1.2, 'cloud': 0.002}
+
+
+class SyntheticFetcher(DailyFetcher):
+    def __init__(self, background_umol_m2: float = 60.0, plume_umol_m2: float = 140.0, plume_scale_km: float = 25.0,
+                 wind_from_deg: float = 225.0, noise: float = 0.03, latency_s: float = 0.0,
+                 latency_per_point_s: float = 0.0, cloudy_day_fraction: float = 0.3):
+        self.background_umol_m2 = background_umol_m2
+        self.plume_umol_m2 = plume_umol_m2
+        self.plume_scale_km = plume_scale_km
+        self.wind_from_deg = wind_from_deg
+        self.noise = noise
+        self.latency_s = latency_s
+        self.latency_per_point_s = latency_per_point_s
+        self.cloudy_day_fraction = cloudy_day_fraction
+        self._sources = np.radians(np.array([city.coordinates for city in config.CITIES.values()], dtype=np.float64))
+
+    def field(self, lats: np.ndarray, lons: np.ndarray, year: int, month: int,
+              product: str = DEFAULT_PRODUCT_ID) -> np.ndarray:
+        lat_rad = np.radians(lats)[:, np.newaxis]
+        lon_rad = np.radians(lons)[:, np.newaxis]
+        source_lat = self._sources[np.newaxis, :, 0]
+        source_lon = self._sources[np.newaxis, :, 1]
+
+        # Haversine distance and bearing from every city, which act as plume sources
+        d_lat = lat_rad - source_lat
+        d_lon = lon_rad - source_lon
+        a = np.sin(d_lat / 2) ** 2 + np.cos(source_lat) * np.cos(lat_rad) * np.sin(d_lon / 2) ** 2
+        distance_km = 2 * config.EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        azimuth = np.arctan2(np.sin(d_lon) * np.cos(lat_rad),
+                             np.cos(source_lat) * np.sin(lat_rad) - np.sin(source_lat) * np.cos(lat_rad) * np.cos(d_lon))
+
+        # The plume is stretched downwind and stronger in winter
+        downwind = 1 + 0.5 * np.cos(azimuth - math.radians(self.wind_from_deg + 180))
+        season = 1 + 0.3 * math.cos(2 * math.pi * (month - 1) / 12)
+        trend = 1 - 0.02 * (year - config.YEARS_TO_ANALYZE[0])
+        plume = self.plume_umol_m2 * season * trend * np.exp(-distance_km / (self.plume_scale_km * downwind))
+
+        # Deterministic per-pixel noise so that repeated fetches of a point agree
+        phase = np.sin(lats * 12.9898 + lons * 78.233 + year * 0.37 + month * 1.7) * 43758.5453
+        jitter = (phase - np.floor(phase)) * 2 - 1
+        return ((self.background_umol_m2 * season + plume.sum(axis=1)) * (1 + self.noise * jitter) *
+                PRODUCT_FACTORS.get(product, 1.0))
+
+    def _simulate_request(self, points: int):
+        latency = self.latency_s + self.latency_per_point_s * points
+        if latency > 0:
+            time.sleep(latency)
+
+    def _sample_routes(self, routes: Iterable[MonthlyDataRoute], year: int, month: int,
+                       product: str) -> list[dict[str, Any]]:
+        keys = []
+        coordinates = []
+        for route in routes:
+            for distance in route.distances:
+                keys.append((route, distance))
+                coordinates.append(cast(PointsRoute, route).points[distance])
+        if not coordinates:
+            return []
+
+        lats, lons = np.asarray(coordinates, dtype=np.float64).T
+        with tracer.span("synthetic.sample", points=len(coordinates)):
+            samples = self.field(lats, lons, year, month, product)
+
+        processed_results = []
+        for (route, distance), value in zip(keys, samples.tolist()):
+            route.densities[distance] = value
+            processed_results.append({
+                'year': year,
+                'month': month,
+                'bearing': route.bearing,
+                'distance': distance,
+                'product': product,
+                'value': value
+            })
+        return processed_results
+
+    def fetch(self, routes_by_bearing: dict[int, MonthlyDataRoute], year: int, month: int) -> list[dict[str, Any]]:
+        self._simulate_request(sum(len(route.distances) for route in routes_by_bearing.values()))
+        product = next(iter(routes_by_bearing.values())).product
+        return [{key: value for key, value in record.items() if key != 'month'}
+                for record in self._sample_routes(routes_by_bearing.values(), year, month, product)]
+
+    def fetch_batch(self, routes: list[MonthlyDataRoute]) -> list[dict[str, Any]]:
+        # One simulated round trip per batch, as the Earth Engine fetcher issues a single request
+        self._simulate_request(sum(len(route.distances) for route in routes))
+        routes_by_period: dict[tuple[int, int, str], list[MonthlyDataRoute]] = {}
+        for route in routes:
+            routes_by_period.setdefault((route.year, route.month, route.product), []).append(route)
+
+        results = []
+        for (year, month, product), period_routes in routes_by_period.items():
+            results.extend(self._sample_routes(period_routes, year, month, product))
+        return results
+
+    def fetch_daily(self, points: list[tuple[float, float]], start: date, end: date,
+                    product: str = DEFAULT_PRODUCT_ID) -> DailySamples:
+        days = np.arange(np.datetime64(start), np.datetime64(end))
+        self._simulate_request(len(points))
+        values = np.full((len(days), len(points)), np.nan, dtype=np.float32)
+        if not len(days) or not points:
+            return DailySamples(days=days, values=values)
+
+        lats, lons = np.asarray(points, dtype=np.float64).T
+        ordinals = days.astype(np.int64)
+        # Deterministic weather: a per-day factor around the monthly field, and cloudy days without a valid pixel
+        weather = np.sin(ordinals * 12.9898) * 43758.5453
+        weather -= np.floor(weather)
+        clouds = np.sin(ordinals * 78.233) * 43758.5453
+        clear = clouds - np.floor(clouds) >= self.cloudy_day_fraction
+        months = days.astype('datetime64[M]').astype(np.int64)
+        with tracer.span("synthetic.sample_daily", points=len(points), days=len(days)):
+            for month_index in np.unique(months):
+                rows = (months == month_index) & clear
+                monthly = self.field(lats, lons, 1970 + int(month_index) // 12, int(month_index) % 12 + 1, product)
+                values[rows] = monthly[np.newaxis, :] * (0.6 + 0.8 * weather[rows])[:, np.newaxis]
+        return DailySamples(days=days, values=values)
@@ -0,0 +1,107 @@
+import warnings
+from dataclasses import dataclass, field
+
+import numpy as np
+
+import config
+from models.data_cube import RouteKey
+
+
+@dataclass
+class ModelFit:
+    theta1: np.ndarray
+    theta2: np.ndarray
+    rmse: np.ndarray
+    points: np.ndarray
+    theta1_ci: np.ndarray | None = None
+    theta2_ci: np.ndarray | None = None
+    keys: list[RouteKey] = field(default_factory=list)
+
+
+def _solve(inverse_distances: np.ndarray, densities: np.ndarray, weights: np.ndarray) \
+        -> tuple[np.ndarray, np.ndarray]:
+    # Closed-form weighted least squares of Q = Θ1 * x + Θ2 with x = 1/r, along the last axis
+    s_w = weights.sum(axis=-1)
+    s_x = (weights * inverse_distances).sum(axis=-1)
+    s_y = (weights * densities).sum(axis=-1)
+    s_xx = (weights * inverse_distances * inverse_distances).sum(axis=-1)
+    s_xy = (weights * inverse_distances * densities).sum(axis=-1)
+    determinant = s_w * s_xx - s_x * s_x
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        solvable = np.abs(determinant) > 1e-12 * np.maximum(s_w * s_xx, 1e-300)
+        theta1 = np.where(solvable, (s_w * s_xy - s_x * s_y) / determinant, np.nan)
+        theta2 = np.where(solvable, (s_xx * s_y - s_x * s_xy) / determinant, np.nan)
+    return theta1, theta2
+
+
+def coverage_weights(distances: np.ndarray, densities: np.ndarray) -> np.ndarray:
+    # A sample stands for the gaps to its valid neighbours, so a profile refined near the city is not over-weighted
+    distances = np.asarray(distances, dtype=np.float64)
+    densities = np.atleast_2d(np.asarray(densities, dtype=np.float64))
+    valid = ~np.isnan(densities)
+    size = len(distances)
+    columns = np.broadcast_to(np.arange(size), densities.shape)
+
+    previous = np.maximum.accumulate(np.where(valid, columns, -1), axis=-1)
+    previous = np.concatenate([np.full((len(densities), 1), -1), previous[:, :-1]], axis=-1)
+    following = np.minimum.accumulate(np.where(valid, columns, size)[:, ::-1], axis=-1)[:, ::-1]
+    following = np.concatenate([following[:, 1:], np.full((len(densities), 1), size)], axis=-1)
+
+    left = np.where(previous >= 0, distances - distances[np.clip(previous, 0, size - 1)], np.nan)
+    right = np.where(following < size, distances[np.clip(following, 0, size - 1)] - distances, np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        widths = np.nanmean(np.stack([left, right]), axis=0)
+        widths = np.where(valid & np.isfinite(widths), widths, np.where(valid, 1.0, 0.0))
+        return widths * (valid.sum(axis=-1, keepdims=True) / widths.sum(axis=-1, keepdims=True))
+
+
+def fit_inverse_distance(distances: np.ndarray, densities: np.ndarray, weights: np.ndarray | None = None,
+                         n_bootstrap: int = 0, confidence: float = 0.95, seed: int | None = None) -> ModelFit:
+    distances = np.asarray(distances, dtype=np.float64)
+    densities = np.atleast_2d(np.asarray(densities, dtype=np.float64))
+    valid = ~np.isnan(densities) & (distances > 0)
+    if weights is None:
+        weights = np.ones_like(densities)
+    weights = np.where(valid, np.broadcast_to(np.asarray(weights, dtype=np.float64), densities.shape), 0.0)
+
+    with np.errstate(divide='ignore'):
+        inverse_distances = np.where(distances > 0, 1.0 / distances, 0.0)
+    inverse_distances = np.broadcast_to(inverse_distances, densities.shape)
+    observed = np.where(valid, densities, 0.0)
+
+    theta1, theta2 = _solve(inverse_distances, observed, weights)
+    residuals = np.where(valid, observed - (theta1[:, np.newaxis] * inverse_distances + theta2[:, np.newaxis]), 0.0)
+    points = valid.sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rmse = np.sqrt((residuals * residuals).sum(axis=-1) / points)
+
+    fit = ModelFit(theta1=theta1, theta2=theta2, rmse=rmse, points=points)
+    if n_bootstrap > 0:
+        fit.theta1_ci, fit.theta2_ci = _bootstrap_intervals(inverse_distances, observed, weights, n_bootstrap,
+                                                            confidence, seed)
+    return fit
+
+
+def _bootstrap_intervals(inverse_distances: np.ndarray, densities: np.ndarray, weights: np.ndarray,
+                         n_bootstrap: int, confidence: float, seed: int | None) -> tuple[np.ndarray, np.ndarray]:
+    # Poisson bootstrap: each observation is drawn Poisson(1) times, which resamples routes of any length at once
+    rng = np.random.default_rng(seed)
+    routes, distances = densities.shape
+    chunk = max(1, config.MODEL_FIT_BOOTSTRAP_CHUNK_VALUES // max(1, routes * distances))
+    theta1_samples = np.empty((n_bootstrap, routes))
+    theta2_samples = np.empty((n_bootstrap, routes))
+
+    for start in range(0, n_bootstrap, chunk):
+        stop = min(start + chunk, n_bootstrap)
+        counts = rng.poisson(1.0, size=(stop - start, routes, distances))
+        theta1_samples[start:stop], theta2_samples[start:stop] = _solve(inverse_distances, densities,
+                                                                        weights * counts)
+
+    tail = (1 - confidence) / 2 * 100
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        theta1_ci = np.nanpercentile(theta1_samples, [tail, 100 - tail], axis=0).T
+        theta2_ci = np.nanpercentile(theta2_samples, [tail, 100 - tail], axis=0).T
+    return theta1_ci, theta2_ci
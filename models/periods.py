@@ -0,0 +1,12 @@
+from datetime import date, timedelta
+
+import config
+
+
+def month_end(year: int, month: int) -> date:
+    return date(year + month // 12, month % 12 + 1, 1)
+
+
+def is_settled(year: int, month: int, today: date | None = None) -> bool:
+    # OFFL products arrive with a delay, so a month's values keep changing until DAILY_SETTLE_DAYS after it ends
+    return month_end(year, month) <= (today or date.today()) - timedelta(days=config.DAILY_SETTLE_DAYS)
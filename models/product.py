@@ -0,0 +1,20 @@
+from dataclasses import dataclass
+
+DEFAULT_PRODUCT_ID = "no2"
+
+
+@dataclass(frozen=True)
+class Product:
+    id: str
+    name: str
+    label: str
+    collection: str
+    band: str
+    # Multiplier from the collection's units (mol/m² for the S5P columns) to `unit`
+    scale: float
+    unit: str
+    column: str
+
+    @property
+    def axis_label(self) -> str:
+        return f"{self.label} ({self.unit})"
@@ -0,0 +1,60 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from models.data_cube import DataCube
+
+
+@dataclass
+class RoseGrid:
+    city_id: str
+    month: int
+    product: str
+    bearings: np.ndarray
+    distances: np.ndarray
+    years: list[int]
+    # (year, bearing, distance), NaN where nothing was fetched
+    values: np.ndarray
+
+    def year_index(self, year: int) -> int | None:
+        return self.years.index(year) if year in self.years else None
+
+    def value_range(self) -> tuple[float, float] | None:
+        if np.isnan(self.values).all():
+            return None
+        return float(np.nanmin(self.values)), float(np.nanmax(self.values))
+
+
+def _fill_row_gaps(distances: np.ndarray, row: np.ndarray) -> np.ndarray:
+    # Routes of one rose may be sampled at different distances (adaptive steps), so each bearing is interpolated
+    # onto the shared distances inside its own sampled range
+    valid = ~np.isnan(row)
+    if valid.sum() < 2:
+        return row
+    filled = np.interp(distances, distances[valid], row[valid])
+    inside = (distances >= distances[valid][0]) & (distances <= distances[valid][-1])
+    return np.where(inside, filled, np.nan)
+
+
+def build_rose_grid(cube: DataCube, city_id: str, month: int, product: str) -> RoseGrid | None:
+    rows_by_cell: dict[tuple[int, int], int] = {}
+    for row, (key_city_id, bearing, year, key_month, key_product) in enumerate(cube.keys()):
+        if key_city_id == city_id and key_month == month and key_product == product:
+            rows_by_cell[(year, bearing)] = row
+    if not rows_by_cell:
+        return None
+
+    years = sorted({year for year, _ in rows_by_cell})
+    bearings = np.array(sorted({bearing for _, bearing in rows_by_cell}), dtype=np.int64)
+    year_index = {year: index for index, year in enumerate(years)}
+    bearing_index = {bearing: index for index, bearing in enumerate(bearings.tolist())}
+
+    cells = list(rows_by_cell.items())
+    matrix = cube.rows_values(np.fromiter((row for _, row in cells), dtype=np.int64, count=len(cells)))
+    used_columns = ~np.isnan(matrix).all(axis=0)
+    distances = cube.distances[used_columns]
+    values = np.full((len(years), len(bearings), len(distances)), np.nan, dtype=np.float32)
+    for (year, bearing), row_values in zip((cell for cell, _ in cells), matrix[:, used_columns]):
+        values[year_index[year], bearing_index[bearing]] = _fill_row_gaps(distances, row_values)
+    return RoseGrid(city_id=city_id, month=month, product=product, bearings=bearings, distances=distances, years=years,
+                    values=values)
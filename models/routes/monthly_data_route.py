@@ -1,10 +1,17 @@
 from dataclasses import dataclass, field
 
 from .points_route import PointsRoute
+from ..data_cube import RouteDensities
+from ..product import DEFAULT_PRODUCT_ID
 
 
 @dataclass
 class MonthlyDataRoute(PointsRoute):
     year: int = 0
     month: int = 0
-    densities: dict[int, float] = field(default_factory=dict)
\ No newline at end of file
+    product: str = DEFAULT_PRODUCT_ID
+    densities: RouteDensities = field(default_factory=RouteDensities)
+
+    @property
+    def key(self) -> tuple[str, int, int, int, str]:
+        return self.city_id, self.bearing, self.year, self.month, self.product
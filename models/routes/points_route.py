@@ -1,8 +1,9 @@
 from dataclasses import dataclass, field
+from typing import Mapping
 
 from ..route import Route
 
 
 @dataclass
 class PointsRoute(Route):
-    points: dict[int, tuple[float, float]] = field(default_factory=dict)
\ No newline at end of file
+    points: Mapping[int, tuple[float, float]] = field(default_factory=dict)
\ No newline at end of file
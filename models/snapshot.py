@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import numpy as np
+
+import config
+from models import DEFAULT_PRODUCT_ID, City
+from models.analysis import Analysis, calculate_route_points
+from models.data_cube import DataCube, RouteDensities, RouteKey
+from models.routes import MonthlyDataRoute
+from models.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 2
+# Format 1 predates products and holds NO2 routes only
+READABLE_FORMATS = (1, SNAPSHOT_FORMAT)
+METADATA_FILE = "metadata.json"
+# Route keys are stored as (city index, bearing, year, month, product index) rows, the indices point into the metadata
+ARRAY_FILES = ("keys", "distances", "values", "attempted")
+
+
+@dataclass
+class SnapshotInfo:
+    path: str
+    cities: int
+    routes: int
+    distances: int
+    created_at: str
+
+
+def save_snapshot(analysis: Analysis, path: str) -> SnapshotInfo:
+    with tracer.span("snapshot.save"):
+        cities = [city for city in analysis.cities.values() if city.routes]
+        city_indices = {city.id: index for index, city in enumerate(cities)}
+        routes = [route for city in cities for route in city.routes]
+        products = sorted({route.product for route in routes})
+        product_indices = {product: index for index, product in enumerate(products)}
+
+        cube = analysis.data_cube
+        distances = cube.distances
+        rows = np.fromiter((route.densities.row for route in routes), dtype=np.int64, count=len(routes))
+        values = np.ascontiguousarray(cube.rows_values(rows), dtype=np.float32)
+        keys = np.array([(city_indices[route.city_id], route.bearing, route.year, route.month,
+                          product_indices[route.product]) for route in routes], dtype=np.int32).reshape(len(routes), 5)
+        # Requested cells are kept apart from the values: a cell fetched as NaN must not be requested again on reload
+        columns = {distance: column for column, distance in enumerate(distances.tolist())}
+        attempted = np.zeros(values.shape, dtype=bool)
+        for row, route in enumerate(routes):
+            attempted[row, [columns[distance] for distance in route.distances if distance in columns]] = True
+
+        created_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        metadata = {
+            'format': SNAPSHOT_FORMAT,
+            'created_at': created_at,
+            'products': [{'id': product, 'collection': config.PRODUCTS[product].collection,
+                          'band': config.PRODUCTS[product].band} for product in products],
+            'cities': [{'id': city.id, 'name': city.name, 'coordinates': list(city.coordinates)} for city in cities],
+            'routes': len(routes),
+            'distances': len(distances)
+        }
+
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        temp_path = tempfile.mkdtemp(dir=parent, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+        try:
+            for name, array in zip(ARRAY_FILES, (keys, distances, values, attempted)):
+                np.save(os.path.join(temp_path, name + '.npy'), array)
+            with open(os.path.join(temp_path, METADATA_FILE), 'w', encoding='utf-8') as file:
+                json.dump(metadata, file, ensure_ascii=False, indent=2)
+            _replace_folder(temp_path, path)
+        except BaseException:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+
+    logger.info("Saved snapshot of %d routes (%d cities, %d distances) to %s.", len(routes), len(cities),
+                len(distances), path)
+    return SnapshotInfo(path=path, cities=len(cities), routes=len(routes), distances=len(distances),
+                        created_at=created_at)
+
+
+def _replace_folder(source: str, target: str):
+    if not os.path.exists(target):
+        os.replace(source, target)
+        return
+    if not os.path.exists(os.path.join(target, METADATA_FILE)):
+        raise FileExistsError(f"Not a session snapshot, refusing to overwrite: {target}")
+    backup = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(target)), suffix='.old')
+    os.rmdir(backup)
+    os.replace(target, backup)
+    os.replace(source, target)
+    shutil.rmtree(backup, ignore_errors=True)
+
+
+def load_snapshot(analysis: Analysis, path: str) -> SnapshotInfo:
+    # Replaces everything loaded in the analysis; values stay memory-mapped (copy-on-write) until the cube grows
+    with tracer.span("snapshot.load"):
+        with open(os.path.join(path, METADATA_FILE), encoding='utf-8') as file:
+            metadata = json.load(file)
+        if metadata.get('format') not in READABLE_FORMATS:
+            raise ValueError(f"Unsupported snapshot format: {metadata.get('format')}")
+        keys, distances, values, attempted = (np.load(os.path.join(path, name + '.npy'), mmap_mode='c')
+                                              for name in ARRAY_FILES)
+
+        cities = [City(id=item['id'], name=item['name'], coordinates=tuple(item['coordinates']), routes=[])
+                  for item in metadata['cities']]
+        products = [item['id'] for item in metadata.get('products', [])]
+        if metadata['format'] == 1:
+            route_keys: list[RouteKey] = [(cities[city_index].id, bearing, year, month, DEFAULT_PRODUCT_ID)
+                                          for city_index, bearing, year, month in keys.tolist()]
+        else:
+            route_keys = [(cities[city_index].id, bearing, year, month, products[product_index])
+                          for city_index, bearing, year, month, product_index in keys.tolist()]
+        distance_list = distances.tolist()
+        cube = DataCube.from_arrays(route_keys, distance_list, values) if route_keys else DataCube()
+
+        points = {}
+        for city in cities:
+            bearings = sorted({key[1] for key in route_keys if key[0] == city.id})
+            points[city.id] = calculate_route_points(city, distance_list, bearings)
+        distances_array = np.asarray(distance_list, dtype=np.int64)
+        cities_by_id = {city.id: city for city in cities}
+        for row, key in enumerate(route_keys):
+            cities_by_id[key[0]].routes.append(MonthlyDataRoute(
+                city_id=key[0], bearing=key[1], year=key[2], month=key[3], product=key[4],
+                distances=distances_array[attempted[row]].tolist(), points=points[key[0]][key[1]],
+                densities=RouteDensities(cube, row)
+            ))
+
+        analysis.replace_loaded(cities_by_id, cube)
+
+    logger.info("Loaded snapshot of %d routes (%d cities, %d distances) from %s.", len(route_keys), len(cities),
+                len(distance_list), path)
+    return SnapshotInfo(path=path, cities=len(cities), routes=len(route_keys), distances=len(distance_list),
+                        created_at=metadata['created_at'])
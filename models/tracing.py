@@ -0,0 +1,185 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Bucket i counts spans lasting [2^i, 2^(i+1)) microseconds
+HISTOGRAM_BUCKETS = 40
+
+
+@dataclass
+class LatencyHistogram:
+    count: int = 0
+    total_ns: int = 0
+    min_ns: int = 0
+    max_ns: int = 0
+    buckets: list[int] = field(default_factory=lambda: [0] * HISTOGRAM_BUCKETS)
+
+    def record(self, duration_ns: int):
+        self.min_ns = duration_ns if self.count == 0 else min(self.min_ns, duration_ns)
+        self.max_ns = max(self.max_ns, duration_ns)
+        self.count += 1
+        self.total_ns += duration_ns
+        self.buckets[min(max(duration_ns // 1000, 1).bit_length() - 1, HISTOGRAM_BUCKETS - 1)] += 1
+
+    def merge(self, other: 'LatencyHistogram'):
+        if other.count == 0:
+            return
+        self.min_ns = other.min_ns if self.count == 0 else min(self.min_ns, other.min_ns)
+        self.max_ns = max(self.max_ns, other.max_ns)
+        self.count += other.count
+        self.total_ns += other.total_ns
+        self.buckets = [own + merged for own, merged in zip(self.buckets, other.buckets)]
+
+    def percentile_ms(self, fraction: float) -> float:
+        target = fraction * self.count
+        cumulative = 0
+        for index, bucket in enumerate(self.buckets):
+            cumulative += bucket
+            if bucket and cumulative >= target:
+                return min(2 ** (index + 1) / 1000, self.max_ns / 1e6)
+        return self.max_ns / 1e6
+
+    def summary(self) -> dict[str, float]:
+        return {
+            'count': self.count,
+            'total_ms': self.total_ns / 1e6,
+            'mean_ms': self.total_ns / 1e6 / self.count if self.count else 0.0,
+            'min_ms': self.min_ns / 1e6,
+            'max_ms': self.max_ns / 1e6,
+            'p50_ms': self.percentile_ms(0.5),
+            'p90_ms': self.percentile_ms(0.9),
+            'p99_ms': self.percentile_ms(0.99)
+        }
+
+
+@dataclass
+class TraceSnapshot:
+    histograms: dict[str, LatencyHistogram]
+    counters: dict[str, float]
+    events: list[dict[str, Any]]
+
+
+class Tracer:
+    def __init__(self, record_events: bool = config.TRACE_RECORD_EVENTS, max_events: int = config.TRACE_MAX_EVENTS):
+        # Histograms and counters are always kept; individual span events only while recording
+        self.recording = record_events
+        self._lock = threading.Lock()
+        self._histograms: dict[str, LatencyHistogram] = {}
+        self._counters: dict[str, float] = {}
+        self._events: deque[dict[str, Any]] = deque(maxlen=max_events)
+        self._thread_names: dict[tuple[int, int], str] = {}
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[None]:
+        started_wall_ns = time.time_ns() if self.recording else 0
+        started_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration_ns = time.perf_counter_ns() - started_ns
+            with self._lock:
+                histogram = self._histograms.get(name)
+                if histogram is None:
+                    histogram = self._histograms[name] = LatencyHistogram()
+                histogram.record(duration_ns)
+                if self.recording:
+                    thread = threading.current_thread()
+                    pid = os.getpid()
+                    self._thread_names[(pid, thread.ident)] = thread.name
+                    self._events.append({
+                        'name': name,
+                        'ph': 'X',
+                        'ts': started_wall_ns / 1000,
+                        'dur': duration_ns / 1000,
+                        'pid': pid,
+                        'tid': thread.ident,
+                        'args': attributes
+                    })
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self) -> TraceSnapshot:
+        with self._lock:
+            return TraceSnapshot(
+                histograms={name: LatencyHistogram(histogram.count, histogram.total_ns, histogram.min_ns,
+                                                   histogram.max_ns, list(histogram.buckets))
+                            for name, histogram in self._histograms.items()},
+                counters=dict(self._counters),
+                events=list(self._events) + self._thread_name_events()
+            )
+
+    def drain(self) -> TraceSnapshot:
+        snapshot = self.snapshot()
+        self.reset()
+        return snapshot
+
+    def merge(self, snapshot: TraceSnapshot):
+        with self._lock:
+            for name, histogram in snapshot.histograms.items():
+                self._histograms.setdefault(name, LatencyHistogram()).merge(histogram)
+            for name, value in snapshot.counters.items():
+                self._counters[name] = self._counters.get(name, 0) + value
+            if self.recording:
+                self._events.extend(snapshot.events)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._events.clear()
+            self._thread_names.clear()
+
+    def _thread_name_events(self) -> list[dict[str, Any]]:
+        return [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                for (pid, tid), name in self._thread_names.items()]
+
+    def summary(self) -> dict[str, Any]:
+        snapshot = self.snapshot()
+        return {
+            'histograms': {name: histogram.summary() for name, histogram in sorted(snapshot.histograms.items())},
+            'counters': dict(sorted(snapshot.counters.items()))
+        }
+
+    def log_summary(self, level: int = logging.INFO):
+        if not logger.isEnabledFor(level):
+            return
+        summary = self.summary()
+        for name, stats in summary['histograms'].items():
+            logger.log(level, "%-24s n=%-6d total=%9.1f ms  mean=%8.2f ms  p90=%8.2f ms  max=%8.2f ms", name,
+                       stats['count'], stats['total_ms'], stats['mean_ms'], stats['p90_ms'], stats['max_ms'])
+        for name, value in summary['counters'].items():
+            logger.log(level, "%-24s %g", name, value)
+
+    def write_json(self, path: str) -> str:
+        from models.export_pipeline import atomic_output
+
+        with atomic_output(path) as temp_path:
+            with open(temp_path, 'w', encoding='utf-8') as output:
+                json.dump(self.summary(), output, ensure_ascii=False, indent=2)
+        logger.info("Trace metrics written to %s.", path)
+        return path
+
+    def write_chrome_trace(self, path: str) -> str:
+        from models.export_pipeline import atomic_output
+
+        snapshot = self.snapshot()
+        with atomic_output(path) as temp_path:
+            with open(temp_path, 'w', encoding='utf-8') as output:
+                json.dump({'traceEvents': snapshot.events, 'displayTimeUnit': 'ms'}, output, ensure_ascii=False)
+        logger.info("Chrome trace with %d events written to %s.", len(snapshot.events), path)
+        return path
+
+
+tracer = Tracer()
@@ -1,63 +1,79 @@
+import logging
 import threading
-import traceback
 
 from PySide6.QtCore import QObject, Signal, Slot
 
+import config
 from models import City
+from models.adaptive_sampler import AdaptiveSampler
 from models.analysis import Analysis
-from models.exporters import CsvExporter
-from models.fetchers import GeeFetcher
+from models.fetcher_session import FetcherSession
+
+logger = logging.getLogger(__name__)
 
 
 class AnalysisWorker(QObject):
     analysis_finished_signal = Signal()
     finished = Signal()
     progress = Signal(int, str)
+    routes_ready = Signal(object, list)
 
-    def __init__(self, analysis_model: Analysis, city: City, bearings: list[int], month: int,
-                 distances: list[int]):
+    def __init__(self, analysis_model: Analysis, city: City, bearings: list[int], month: int | None,
+                 distances: list[int], fetcher_session: FetcherSession, sampler: AdaptiveSampler | None = None,
+                 years: list[int] | None = None, products: list[str] | None = None):
         super().__init__()
         self.analysis_model = analysis_model
         self.bearings = bearings
         self.city = city
         self.distances = distances
-        self.exporter = CsvExporter()
-        self.fetcher = GeeFetcher()
+        self.fetcher_session = fetcher_session
         self.month = month
+        self.products = products
+        self.sampler = sampler
+        self.years = years
 
-        print("AnalysisWorker initialized.")
+        logger.debug("AnalysisWorker initialized.")
 
     @Slot()
     def run(self):
-        print("AnalysisWorker run method started.")
-        print("Current thread:", threading.current_thread().name)
+        logger.debug("AnalysisWorker run method started. Current thread: %s", threading.current_thread().name)
         try:
-            self.progress.emit(10, "Анализ запущен")
-            print("Analysis model run method about to be called.")
-            self.analysis_model.run(
+            self.progress.emit(0, "Анализ запущен")
+            if self.analysis_model.exporter is None:
+                # Imported here so that pandas loads on the worker thread, never before the window is shown
+                from models.exporters import CsvExporter
+                self.analysis_model.exporter = CsvExporter()
+            batches = self.analysis_model.iter_fetch(
                 city=self.city,
                 bearings=self.bearings,
                 distances=self.distances,
                 month=self.month,
-                fetcher=self.fetcher,
-                exporter=self.exporter
+                fetcher=self.fetcher_session.get(),
+                sampler=self.sampler,
+                years=self.years,
+                products=self.products
             )
-            print("Analysis model run method finished.")
-
+            for routes, completed, total in batches:
+                # Routes are stored and shown on the GUI thread; the worker only fetches
+                self.routes_ready.emit(self.city, routes)
+                route = routes[0]
+                if len(self.bearings) > 1:
+                    bearing_text = f"{len(self.bearings)} направлений"
+                else:
+                    bearing_text = config.BEARINGS.get(route.bearing, f"{route.bearing}°")
+                if self.products and len(self.products) > 1:
+                    bearing_text += f", {len(self.products)} показателей"
+                self.progress.emit(completed * 100 // total,
+                                   f"получены данные: {bearing_text}, {route.year} год ({completed}/{total})")
             self.progress.emit(100, "Finished")
-            print(f"Progress update: 100%, Finished (Thread: {threading.current_thread().name})")
-
             self.analysis_finished_signal.emit()
-            print(f"AnalysisWorker finished signal emitted (for UI update). Thread: {threading.current_thread().name}")
+            logger.debug("AnalysisWorker finished signal emitted (for UI update).")
 
         except Exception as e:
             error_message = f"Error in AnalysisWorker: {e}"
-            print(error_message)
-            traceback.print_exc()
+            logger.exception(error_message)
             self.progress.emit(0, error_message)
             self.analysis_finished_signal.emit()
-            print(
-                f"AnalysisWorker finished signal emitted due to error (for UI update). Thread: {threading.current_thread().name}")
         finally:
             self.finished.emit()
-            print("Worker finished signal (for thread cleanup) emitted.")
+            logger.debug("Worker finished signal (for thread cleanup) emitted.")
@@ -0,0 +1,38 @@
+import logging
+import threading
+
+from PySide6.QtCore import QObject, Signal, Slot
+
+from models import Exporter
+from models.analysis import Analysis
+
+logger = logging.getLogger(__name__)
+
+
+class ExportWorker(QObject):
+    export_failed = Signal(str)
+    export_finished = Signal(list)
+    finished = Signal()
+
+    def __init__(self, analysis_model: Analysis, exporter: Exporter | None = None):
+        super().__init__()
+        self.analysis_model = analysis_model
+        self.exporter = exporter
+
+        logger.debug("ExportWorker initialized.")
+
+    @Slot()
+    def run(self):
+        logger.debug("ExportWorker run method started. Current thread: %s", threading.current_thread().name)
+        try:
+            if self.exporter is None:
+                # No analysis has run yet when the data comes from a restored session
+                from models.exporters import CsvExporter
+                self.exporter = self.analysis_model.exporter = CsvExporter()
+            self.export_finished.emit(self.analysis_model.export_all_loaded_data(self.exporter))
+        except Exception as e:
+            logger.exception("Error during export")
+            self.export_failed.emit(str(e))
+        finally:
+            self.finished.emit()
+            logger.debug("ExportWorker finished signal emitted.")
@@ -1,4 +1,4 @@
-import math
+import logging
 import threading
 
 import numpy as np
@@ -6,11 +6,19 @@ from PySide6.QtCore import QCoreApplication, QObject, QThread, Slot, Qt
 
 import config
 from models import City
+from models.adaptive_sampler import AdaptiveSampler
 from models.analysis import Analysis
+from models.rose_grid import RoseGrid
+from models.fetcher_session import FetcherSession, create_fetcher
 from models.routes import MonthlyDataRoute
+from models.snapshot import load_snapshot, save_snapshot
 from presenters.analysis_worker import AnalysisWorker
+from presenters.export_worker import ExportWorker
+from models.tracing import tracer
 from views.main_window import MainWindow
 
+logger = logging.getLogger(__name__)
+
 
 class MainPresenter(QObject):
     def __init__(self, view: MainWindow, model: Analysis):
@@ -21,13 +29,16 @@ class MainPresenter(QObject):
         self.current_bearing: int | None = None
         self.current_city: City | None = None
         self.current_month: int | None = None
+        self.all_months = False
         self.current_selected_data_route: MonthlyDataRoute | None = None
         self._calculated_theta1: float | None = None
         self._calculated_theta2: float | None = None
         self._selected_point1: tuple[float, float] | None = None
         self._selected_point2: tuple[float, float] | None = None
+        self._rose_grid: RoseGrid | None = None
         self.thread: QThread | None = None
-        self.worker: AnalysisWorker | None = None
+        self.worker: AnalysisWorker | ExportWorker | None = None
+        self.fetcher_session = FetcherSession(lambda: create_fetcher("gee"))
 
         self._connect_view_signals()
 
@@ -43,85 +54,182 @@ class MainPresenter(QObject):
         if first_month is not None:
             self.on_month_changed(first_month)
 
-        print(
-            f"MainPresenter initialized in thread: {threading.current_thread().name} (QObject thread: {self.thread}, QApplication thread: {QCoreApplication.instance().thread()})")
+        logger.debug("MainPresenter initialized in thread: %s (QApplication thread: %s)",
+                     threading.current_thread().name, QCoreApplication.instance().thread())
+
+    def warm_up(self):
+        # Called once the window is on screen: Earth Engine and the exporter stack load on background threads
+        self.fetcher_session.warm_up()
+        threading.Thread(target=self._preload_exporter, name="exporter-preload", daemon=True).start()
+
+    @staticmethod
+    def _preload_exporter():
+        with tracer.span("startup.preload_exporter"):
+            from models.exporters import CsvExporter  # noqa: F401
 
     def _connect_view_signals(self):
+        self.view.all_months_toggled_signal.connect(self.on_all_months_toggled)
         self.view.bearing_selected_signal.connect(self.on_bearing_selected)
         self.view.city_selected_signal.connect(self.on_city_selected)
         self.view.data_route_selected_signal.connect(self.on_data_route_selected)
         self.view.export_data_signal.connect(self.export_all_data)
+        self.view.load_session_signal.connect(self.load_session)
         self.view.month_selected_signal.connect(self.on_month_changed)
         self.view.plot_clicked_signal.connect(self.on_plot_clicked)
+        self.view.save_session_signal.connect(self.save_session)
         self.view.start_analysis_signal.connect(self.run_analysis)
-        print("View signals connected.")
+        logger.debug("View signals connected.")
 
     @Slot()
     def on_analysis_finished_in_model(self):
-        print(
-            f"on_analysis_finished_in_model called. Current thread: {threading.current_thread().name} (QObject thread: {self.thread}, QApplication thread: {QCoreApplication.instance().thread()})")
-        self.view.update_data_tree(self.model.cities)
+        logger.debug("on_analysis_finished_in_model called. Current thread: %s", threading.current_thread().name)
+        with tracer.span("ui.update_tree"):
+            self.view.update_data_tree(self.model.cities)
         self.view.set_ui_enabled(True)
         self.view.set_status_message("Анализ завершен! Выберите данные для отображения или начните новый анализ.")
-        print("UI unlocked and data tree updated.")
+        tracer.log_summary(logging.DEBUG)
+
+    @Slot(object, list)
+    def on_routes_ready(self, city: City, routes: list[MonthlyDataRoute]):
+        with tracer.span("ui.add_routes", routes=len(routes)):
+            stored_routes = self.model.upsert_routes(city, routes)
+            self.view.add_routes_to_tree(stored_routes)
+        self._rose_grid = None
+
+        selected = self.current_selected_data_route
+        if selected is None:
+            route = next((route for route in stored_routes if route.densities), None)
+        else:
+            # Merged cells land in the loaded route object, so the selected route is re-plotted by key
+            route = next((route for route in stored_routes if route.key == selected.key), None)
+        if route is not None:
+            self.on_data_route_selected(route)
+        elif selected is not None:
+            # Another year of the selected route's rose arrived; the year shown in the rose is kept
+            self._update_rose(selected, self.view.current_rose_year())
 
     def on_progress_update(self, percent: int, message: str):
         self.view.set_status_message(f"Прогресс: {percent}%, {message}")
-        print(
-            f"Progress update: {percent}%, {message} (Thread: {threading.current_thread().name} / QObject thread: {self.thread}, QApplication thread: {QCoreApplication.instance().thread()})")
+        logger.debug("Progress update: %d%%, %s", percent, message)
 
     def on_thread_finished(self):
-        print(
-            f"Thread finished signal received in MainPresenter. Cleaning up. Current thread: {threading.current_thread().name} (QObject thread: {self.thread}, QApplication thread: {QCoreApplication.instance().thread()})")
+        logger.debug("Thread finished signal received in MainPresenter. Cleaning up.")
         self.thread = None
         self.worker = None
-        print("Thread and worker references reset.")
 
     @Slot(int)
     def on_bearing_selected(self, bearing: int):
         self.current_bearing = bearing
-        print(f"Bearing selected: {bearing}")
+        logger.debug("Bearing selected: %d", bearing)
 
     @Slot(City)
     def on_city_selected(self, city: City):
         self.current_city = city
-        print(f"City selected: {city.name}")
+        logger.debug("City selected: %s", city.name)
 
     @Slot(MonthlyDataRoute)
     def on_data_route_selected(self, route: MonthlyDataRoute):
         self.current_selected_data_route = route
-        print(
-            f"Selected data route in presenter: Bearing={route.bearing}, Month={route.month}, Year={route.year}. Densities: {route.densities}")
+        logger.debug("Selected data route in presenter: Bearing=%d, Month=%d, Year=%d. Densities: %s",
+                     route.bearing, route.month, route.year, route.densities)
         self.view.plot_data(route)
+        self._update_rose(route)
         self._selected_point1 = None
         self._selected_point2 = None
         self._calculated_theta1 = None
         self._calculated_theta2 = None
         self.view.set_status_message("Выберите опорную точку на графике (ЛКМ).")
 
+    def _update_rose(self, route: MonthlyDataRoute, year: int | None = None):
+        # The grid of the selected city, month and product is cached until new routes arrive, so picking another year
+        # of the same rose only swaps the heatmap array
+        grid = self._rose_grid
+        if grid is None or (grid.city_id, grid.month, grid.product) != (route.city_id, route.month, route.product):
+            grid = self._rose_grid = self.model.rose_grid(route.city_id, route.month, route.product)
+        if grid is not None:
+            self.view.plot_rose(grid, year or route.year)
+
     @Slot()
     def export_all_data(self):
         if not self.model.cities:
             self.view.set_status_message("Нет загруженных данных для экспорта.")
             return
+        if self.thread and self.thread.isRunning():
+            self.view.set_status_message("Дождитесь окончания текущей операции перед экспортом.")
+            return
 
         self.view.set_ui_enabled(False)
         self.view.set_status_message("Начинаем экспорт данных...")
 
+        # The export pool and the manifest write run off the GUI thread, as analysis does
+        self.thread = QThread()
+        self.worker = ExportWorker(analysis_model=self.model, exporter=self.model.exporter)
+        self.worker.moveToThread(self.thread)
+
+        self.thread.started.connect(self.worker.run)
+        self.worker.finished.connect(self.thread.quit)
+        self.worker.finished.connect(self.worker.deleteLater)
+        self.thread.finished.connect(self.thread.deleteLater)
+        self.thread.finished.connect(self.on_thread_finished)
+
+        self.worker.export_finished.connect(self.on_export_finished, Qt.QueuedConnection)
+        self.worker.export_failed.connect(self.on_export_failed, Qt.QueuedConnection)
+
+        self.thread.start()
+        logger.debug("Export thread started.")
+
+    @Slot(list)
+    def on_export_finished(self, results: list):
+        self.view.set_ui_enabled(True)
+        self.view.set_status_message(f"Данные успешно экспортированы в папку '{config.EXPORTS_FOLDER}' "
+                                     f"({len(results)} файлов).")
+
+    @Slot(str)
+    def on_export_failed(self, message: str):
+        self.view.set_ui_enabled(True)
+        self.view.set_status_message(f"Ошибка при экспорте данных: {message}")
+
+    @Slot(str)
+    def save_session(self, path: str):
         try:
-            self.model.export_all_loaded_data(self.model.exporter)
-            self.view.set_status_message(f"Данные успешно экспортированы в папку '{config.EXPORTS_FOLDER}'.")
+            info = save_snapshot(self.model, path)
+            self.view.set_status_message(f"Сессия сохранена: {info.routes} маршрутов, {info.cities} городов.")
         except Exception as e:
-            self.view.set_status_message(f"Ошибка при экспорте данных: {e}")
-            print(f"Error during export: {e}")
-        finally:
-            self.view.set_ui_enabled(True)
-            self.view.update_data_tree(self.model.cities)
+            self.view.set_status_message(f"Ошибка при сохранении сессии: {e}")
+            logger.exception("Error while saving session snapshot")
+
+    @Slot(str)
+    def load_session(self, path: str):
+        if self.thread and self.thread.isRunning():
+            self.view.set_status_message("Дождитесь окончания анализа перед открытием сессии.")
+            return
+        try:
+            info = load_snapshot(self.model, path)
+        except Exception as e:
+            self.view.set_status_message(f"Ошибка при открытии сессии: {e}")
+            logger.exception("Error while loading session snapshot")
+            return
+
+        self.current_selected_data_route = None
+        self._rose_grid = None
+        with tracer.span("ui.update_tree"):
+            self.view.reset_data_tree(self.model.cities)
+        first_route = next((route for city in self.model.cities.values() for route in city.routes
+                            if route.densities), None)
+        if first_route is not None:
+            self.on_data_route_selected(first_route)
+        self.view.set_status_message(f"Сессия от {info.created_at} открыта: {info.routes} маршрутов, "
+                                     f"{info.cities} городов.")
+
+    @Slot(bool)
+    def on_all_months_toggled(self, checked: bool):
+        self.all_months = checked
+        logger.debug("All months mode: %s", checked)
 
     @Slot(int)
     def on_month_changed(self, month: int):
         self.current_month = month
-        print(f"Month selected: {month}")
+        logger.debug("Month selected: %d", month)
 
     @Slot(float, float, int)
     def on_plot_clicked(self, clicked_x: float, clicked_y: float, button: int):
@@ -129,14 +237,14 @@ class MainPresenter(QObject):
             self.view.set_status_message("Выберите данные для анализа на графике, чтобы построить модель.")
             return
 
-        valid_data_points = [(d, q) for d, q in self.current_selected_data_route.densities.items() if not math.isnan(q)]
+        distances_array, densities_array = self.current_selected_data_route.densities.valid_arrays()
 
-        if not valid_data_points:
+        if not len(distances_array):
             self.view.set_status_message("В выбранном маршруте нет действительных данных для построения модели.")
             return
 
-        distances_only = [p[0] for p in valid_data_points]
-        densities_only = [p[1] for p in valid_data_points]
+        distances_only = distances_array.tolist()
+        densities_only = densities_array.tolist()
 
         r_min_model = min(distances_only) if min(distances_only) > 0 else 1
         r_max_model = max(distances_only) + 10
@@ -186,8 +294,8 @@ class MainPresenter(QObject):
                     self._calculated_theta1 = (q1 - q2) / denominator
                     self._calculated_theta2 = q1 - (self._calculated_theta1 / r1)
 
-                    print(
-                        f"Рассчитанная Theta1 (θ1): {self._calculated_theta1:.2f}, Theta2 (θ2, Фон): {self._calculated_theta2:.2f}")
+                    logger.debug("Рассчитанная Theta1 (θ1): %.2f, Theta2 (θ2, Фон): %.2f", self._calculated_theta1,
+                                 self._calculated_theta2)
 
                     model_densities_double = []
                     for r_val in model_generation_distances:
@@ -231,7 +339,7 @@ class MainPresenter(QObject):
 
     @Slot()
     def run_analysis(self):
-        print("run_analysis called.")
+        logger.debug("run_analysis called.")
         distance_params = self.view.get_distance_parameters()
         if not self.current_city or self.current_bearing is None or self.current_month is None or not distance_params:
             self.view.set_status_message("Отсутствуют параметры для анализа.")
@@ -241,8 +349,16 @@ class MainPresenter(QObject):
             distance_params['max'] + 1,
             distance_params['step']
         ))
-        print(
-            f"Analysis parameters: City={self.current_city.name}, Bearing={self.current_bearing}, Month={self.current_month}, Distances={distances}")
+        sampler = AdaptiveSampler(initial_step_km=distance_params['step']) if distance_params['adaptive'] else None
+        years = self.view.get_years()
+        bearings = self.view.get_bearings() or [self.current_bearing]
+        products = self.view.get_products()
+        if not products:
+            self.view.set_status_message("Выберите хотя бы один показатель.")
+            return
+        logger.info("Analysis parameters: City=%s, Bearings=%s, Month=%s, Distances=%s, Years=%s, Adaptive=%s, "
+                    "Products=%s", self.current_city.name, bearings, "all" if self.all_months else self.current_month,
+                    distances, years, sampler is not None, products)
 
         self.view.set_ui_enabled(False)
         self.view.set_status_message("Начинаем анализ...")
@@ -252,18 +368,24 @@ class MainPresenter(QObject):
             self.view.set_ui_enabled(True)
             return
 
+        # The first route of the new run is plotted as soon as its batch arrives
+        self.current_selected_data_route = None
+        if len(bearings) > 1:
+            self.view.show_rose_tab()
         self.thread = QThread()
         self.worker = AnalysisWorker(
             analysis_model=self.model,
             city=self.current_city,
-            bearings=[self.current_bearing],
-            month=self.current_month,
-            distances=distances
+            bearings=bearings,
+            month=None if self.all_months else self.current_month,
+            distances=distances,
+            fetcher_session=self.fetcher_session,
+            sampler=sampler,
+            years=years,
+            products=products
         )
         self.worker.moveToThread(self.thread)
-        print("Worker moved to thread.")
-        print(
-            f"Worker's thread affinity after moveToThread: {threading.current_thread().name} (QObject thread: {self.worker.thread()}, QApplication thread: {QCoreApplication.instance().thread()})")
+        logger.debug("Worker moved to thread %s.", self.worker.thread())
 
         self.thread.started.connect(self.worker.run)
         self.worker.finished.connect(self.thread.quit)
@@ -272,9 +394,8 @@ class MainPresenter(QObject):
         self.thread.finished.connect(self.on_thread_finished)
 
         self.worker.progress.connect(self.on_progress_update, Qt.QueuedConnection)
+        self.worker.routes_ready.connect(self.on_routes_ready, Qt.QueuedConnection)
         self.worker.analysis_finished_signal.connect(self.on_analysis_finished_in_model, Qt.QueuedConnection)
 
-        print("Worker/Thread signals connected (inside run_analysis).")
-
         self.thread.start()
-        print("Thread started.")
+        logger.debug("Thread started.")
@@ -0,0 +1,57 @@
+import random
+import time
+from datetime import date
+
+import config
+from models import City
+from models.analysis import Analysis
+from models.fetch_scheduler import FetchScheduler
+from models.fetchers.synthetic_fetcher import SyntheticFetcher
+
+
+class JitteryFetcher(SyntheticFetcher):
+    # Batches finish in a random order, as concurrent Earth Engine requests do
+    def fetch_batch(self, routes):
+        time.sleep(random.uniform(0, 0.02))
+        return super().fetch_batch(routes)
+
+
+def _city() -> City:
+    template = config.CITIES['moscow']
+    return City(id=template.id, name=template.name, coordinates=template.coordinates, routes=[])
+
+
+def test_run_stores_routes_in_submission_order(monkeypatch):
+    monkeypatch.setattr(config, 'FETCH_BATCH_SIZE', 1)
+    analysis = Analysis()
+    analysis.fetch_scheduler = FetchScheduler(max_concurrency=8)
+    city = _city()
+
+    analysis.run(city, [0, 90, 180], 2, [10, 20], JitteryFetcher(), None, years=[2020, 2021, 2022])
+
+    expected = [(city.id, bearing, year, 2, 'no2') for bearing in [0, 90, 180] for year in [2020, 2021, 2022]]
+    assert analysis.data_cube.keys() == expected
+    assert [route.key for route in city.routes] == expected
+
+
+class CountingFetcher(SyntheticFetcher):
+    def __init__(self):
+        super().__init__()
+        self.points = 0
+
+    def fetch_batch(self, routes):
+        self.points += sum(len(route.distances) for route in routes)
+        return super().fetch_batch(routes)
+
+
+def test_rerun_refetches_only_unsettled_months():
+    analysis = Analysis()
+    city = _city()
+    unsettled_year = date.today().year + 1
+    analysis.run(city, [0, 90], 2, [10, 20], SyntheticFetcher(), None, years=[2021, unsettled_year])
+
+    fetcher = CountingFetcher()
+    analysis.run(city, [0, 90], 2, [10, 20], fetcher, None, years=[2021, unsettled_year])
+
+    assert fetcher.points == 4
+    assert len(city.routes) == 4
@@ -0,0 +1,64 @@
+from datetime import date
+
+import pytest
+
+import config
+from models.fetchers.cached_fetcher import CachedFetcher
+from models.fetchers.synthetic_fetcher import SyntheticFetcher
+from models.routes import MonthlyDataRoute
+
+
+class CountingFetcher(SyntheticFetcher):
+    def __init__(self):
+        super().__init__()
+        self.points = 0
+
+    def fetch_batch(self, routes):
+        self.points += sum(len(route.distances) for route in routes)
+        return super().fetch_batch(routes)
+
+
+def _routes(year: int) -> list[MonthlyDataRoute]:
+    lat, lon = config.CITIES['moscow'].coordinates
+    return [MonthlyDataRoute(city_id='moscow', bearing=bearing, year=year, month=1, distances=[10, 20],
+                             points={10: (lat + 0.1, lon + bearing * 0.01), 20: (lat + 0.2, lon + bearing * 0.01)})
+            for bearing in [0, 90]]
+
+
+def test_second_fetch_is_served_from_cache(tmp_path):
+    fetcher = CountingFetcher()
+    cache = CachedFetcher(fetcher, path=str(tmp_path / "samples.sqlite"))
+
+    first = cache.fetch_batch(_routes(2021))
+    second = cache.fetch_batch(_routes(2021))
+
+    assert fetcher.points == 4
+    assert cache.stats() == {'hits': 4, 'misses': 4}
+    assert sorted(record['value'] for record in second) == \
+        pytest.approx(sorted(record['value'] for record in first), rel=1e-6)
+    assert cache._connection.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+
+def test_store_evicts_down_to_headroom(tmp_path):
+    path = str(tmp_path / "samples.sqlite")
+    cache = CachedFetcher(CountingFetcher(), path=path, max_entries=10)
+
+    for year in range(2019, 2024):
+        cache.fetch_batch(_routes(year))
+
+    count = cache._connection.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+    assert count <= 10
+    assert CachedFetcher(CountingFetcher(), path=path)._entries == count
+
+
+def test_unsettled_months_are_not_cached(tmp_path):
+    fetcher = CountingFetcher()
+    cache = CachedFetcher(fetcher, path=str(tmp_path / "samples.sqlite"))
+    year = date.today().year + 1
+
+    cache.fetch_batch(_routes(year))
+    records = cache.fetch_batch(_routes(year))
+
+    assert fetcher.points == 8
+    assert len(records) == 4
+    assert cache._connection.execute("SELECT COUNT(*) FROM samples").fetchone()[0] == 0
@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import config
+from models.fetchers.coalescing_fetcher import CoalescingFetcher
+from models.fetchers.synthetic_fetcher import SyntheticFetcher
+from models.routes import MonthlyDataRoute
+from models.tracing import tracer
+
+
+class CountingFetcher(SyntheticFetcher):
+    def __init__(self):
+        super().__init__()
+        self.batches: list[int] = []
+
+    def fetch_batch(self, routes):
+        self.batches.append(len({point for route in routes for point in route.points.values()}))
+        return super().fetch_batch(routes)
+
+
+def _route(bearing: int, year: int = 2021, month: int = 1) -> MonthlyDataRoute:
+    lat, lon = config.CITIES['moscow'].coordinates
+    distances = [10, 20, 30]
+    return MonthlyDataRoute(city_id='moscow', bearing=bearing, year=year, month=month, distances=distances,
+                            points={distance: (lat + bearing * 0.1 + distance * 0.02, lon) for distance in distances})
+
+
+def test_pixels_are_split_over_requests(monkeypatch):
+    monkeypatch.setattr(config, 'FETCH_MAX_POINTS_PER_REQUEST', 4)
+    fetcher = CountingFetcher()
+    routes = [_route(0, month=1), _route(0, month=2), _route(90, month=1)]
+
+    records = CoalescingFetcher(fetcher).fetch_batch(routes)
+
+    assert fetcher.batches == [4, 2]
+    assert len(records) == 9
+
+
+class GatedFetcher(SyntheticFetcher):
+    # Holds every upstream call until released, so concurrent requests overlap with the one in flight
+    def __init__(self, error: Exception | None = None):
+        super().__init__()
+        self.error = error
+        self.calls: Counter = Counter()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def fetch_batch(self, routes):
+        self.calls.update((route.points[distance], route.year, route.month, route.product)
+                          for route in routes for distance in route.distances)
+        self.started.set()
+        assert self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return super().fetch_batch(routes)
+
+
+def _overlapping_fetches(fetcher: GatedFetcher, waiters: int) -> list:
+    coalescing = CoalescingFetcher(fetcher)
+    requests = [[_route(bearing, month=month) for bearing in [0, 90] for month in [1, 2]]
+                for _ in range(waiters + 1)]
+    pixel_periods = sum(len(route.distances) for route in requests[0])
+    tracer.reset()
+    with ThreadPoolExecutor(max_workers=waiters + 1) as executor:
+        futures = [executor.submit(coalescing.fetch_batch, requests[0])]
+        assert fetcher.started.wait(5)
+        futures += [executor.submit(coalescing.fetch_batch, routes) for routes in requests[1:]]
+        # Waiters count their shared pixels before blocking on the owner's futures
+        deadline = time.monotonic() + 5
+        while tracer.snapshot().counters.get("coalesce.shared", 0) < waiters * pixel_periods:
+            assert time.monotonic() < deadline
+            time.sleep(0.001)
+        fetcher.release.set()
+    assert not coalescing._in_flight
+    return futures
+
+
+def test_concurrent_requests_share_one_upstream_call():
+    fetcher = GatedFetcher()
+
+    futures = _overlapping_fetches(fetcher, waiters=3)
+
+    assert len(fetcher.calls) == 12
+    assert set(fetcher.calls.values()) == {1}
+    results = [sorted((record['bearing'], record['month'], record['distance'], record['value'])
+                      for record in future.result()) for future in futures]
+    assert len(results[0]) == 12
+    assert all(result == results[0] for result in results)
+
+
+def test_upstream_failure_reaches_every_waiter():
+    fetcher = GatedFetcher(RuntimeError("quota exceeded"))
+
+    futures = _overlapping_fetches(fetcher, waiters=3)
+
+    assert set(fetcher.calls.values()) == {1}
+    for future in futures:
+        with pytest.raises(RuntimeError, match="quota exceeded"):
+            future.result()
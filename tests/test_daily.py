@@ -0,0 +1,51 @@
+from datetime import date
+
+import pytest
+
+import batch
+import config
+from models import DailyFetcher
+from models.daily_runner import fetch_daily_series
+from models.daily_store import DailySeriesStore
+from models.fetcher_session import create_fetcher
+from models.fetchers.cached_fetcher import CachedFetcher
+from models.fetchers.local_raster_fetcher import LocalRasterFetcher
+from models.fetchers.synthetic_fetcher import SyntheticFetcher
+
+
+def test_daily_series_are_stored_and_not_fetched_twice(tmp_path):
+    store = DailySeriesStore(str(tmp_path / "daily"))
+    city = config.CITIES['moscow']
+
+    report = fetch_daily_series(store, city, [0], [10, 20], [2021], SyntheticFetcher(), today=date(2022, 6, 1))
+    repeated = fetch_daily_series(store, city, [0], [10, 20], [2021], SyntheticFetcher(), today=date(2022, 6, 1))
+
+    assert report.requests == 12 and report.samples == len(store) > 0
+    assert repeated.requests == 0
+
+
+def test_wrapped_fetchers_keep_daily_support(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = DailySeriesStore(str(tmp_path / "daily"))
+
+    fetcher = create_fetcher("synthetic")
+    report = fetch_daily_series(store, config.CITIES['moscow'], [0], [10], [2021], fetcher, today=date(2022, 1, 1))
+
+    assert report.samples == len(store) > 0
+    assert not isinstance(create_fetcher("local"), DailyFetcher)
+
+
+def test_fetchers_without_daily_samples_are_refused_up_front(tmp_path):
+    store = DailySeriesStore(str(tmp_path / "daily"))
+    fetcher = CachedFetcher(LocalRasterFetcher(str(tmp_path / "rasters")), path=str(tmp_path / "cache.sqlite"))
+
+    assert not isinstance(fetcher, DailyFetcher)
+    with pytest.raises(ValueError):
+        fetch_daily_series(store, config.CITIES['moscow'], [0], [10], [2021], fetcher, today=date(2022, 1, 1))
+    assert store.points == []
+
+
+def test_daily_cli_rejects_local_fetcher():
+    with pytest.raises(SystemExit) as error:
+        batch.parse_args(["--daily", "--fetcher", "local"])
+    assert error.value.code == 2
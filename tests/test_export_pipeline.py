@@ -0,0 +1,68 @@
+import csv
+import gzip
+import os
+import stat
+
+import pytest
+
+import config
+from models import City
+from models.analysis import Analysis
+from models.exporters import CompressedCsvExporter, CsvExporter
+from models.fetchers.synthetic_fetcher import SyntheticFetcher
+
+
+def _loaded_analysis(month: int | None, bearings: tuple[int, ...] = (0, 90)) -> Analysis:
+    template = config.CITIES['moscow']
+    city = City(id=template.id, name=template.name, coordinates=template.coordinates, routes=[])
+    analysis = Analysis()
+    for routes, _, _ in analysis.iter_fetch(city, list(bearings), month, [10, 20], SyntheticFetcher(), years=[2021]):
+        analysis.upsert_routes(city, routes)
+    return analysis
+
+
+@pytest.mark.parametrize('month', [2, None])
+def test_csv_export_with_two_workers(tmp_path, month):
+    analysis = _loaded_analysis(month)
+
+    results = analysis.export_all_loaded_data(CsvExporter(str(tmp_path)), max_workers=2)
+
+    assert len(results) == (1 if month else len(config.MONTHS))
+    for result in results:
+        with open(result.path, encoding='utf-8') as file:
+            rows = list(csv.reader(file, delimiter="\t"))
+        assert rows[0] == ['Год', 'Направление', '10', '20']
+        assert len(rows) == 3
+    assert os.path.exists(tmp_path / "manifest.json")
+
+
+def test_exported_files_follow_umask(tmp_path):
+    umask = os.umask(0o022)
+    os.umask(umask)
+    results = _loaded_analysis(2).export_all_loaded_data(CsvExporter(str(tmp_path)), max_workers=1)
+
+    for path in [results[0].path, tmp_path / "manifest.json"]:
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o666 & ~umask
+
+
+@pytest.mark.parametrize('exporter_class', [CsvExporter, CompressedCsvExporter])
+def test_csv_values_keep_float32_precision(tmp_path, exporter_class):
+    results = _loaded_analysis(2).export_all_loaded_data(exporter_class(str(tmp_path)), max_workers=1)
+
+    with (gzip.open if results[0].path.endswith('.gz') else open)(results[0].path, 'rt', encoding='utf-8') as file:
+        values = [value for row in list(csv.reader(file, delimiter="\t"))[1:] for value in row[2:]]
+    assert values
+    for value in values:
+        assert len(value.replace(',', '').lstrip('0')) <= 6
+
+
+@pytest.mark.parametrize('exporter_class', [CsvExporter, CompressedCsvExporter])
+def test_csv_export_keeps_unnamed_bearings(tmp_path, exporter_class):
+    bearings = [0, 30, 60, 90]
+    results = _loaded_analysis(2, tuple(bearings)).export_all_loaded_data(exporter_class(str(tmp_path)), max_workers=1)
+
+    with (gzip.open if results[0].path.endswith('.gz') else open)(results[0].path, 'rt', encoding='utf-8') as file:
+        rows = list(csv.reader(file, delimiter="\t"))[1:]
+    assert results[0].rows == len(rows)
+    assert {row[1] for row in rows} == {config.BEARINGS[0], '30°', '60°', config.BEARINGS[90]}
+    assert len(rows) == len(bearings) * (1 if exporter_class is CsvExporter else 2)
@@ -0,0 +1,184 @@
+import importlib
+import sys
+import types
+
+import pytest
+
+import config
+from models.routes import MonthlyDataRoute
+
+
+class FakeEarthEngine:
+    # Images are band -> value(lat, lon) maps; a None value is a masked pixel, as in Earth Engine
+    def __init__(self, masked_periods=(), empty_periods=()):
+        self.masked_periods = set(masked_periods)
+        self.empty_periods = set(empty_periods)
+        self.get_info_calls = 0
+
+    @staticmethod
+    def raw_value(year: int, month: int, lat: float) -> float:
+        return year * 100 + month + lat
+
+    def module(self) -> types.ModuleType:
+        fake = self
+        ee = types.ModuleType('ee')
+
+        class Image:
+            def __init__(self, bands):
+                self.bands = bands
+
+            def rename(self, names):
+                names = names if isinstance(names, list) else [names]
+                return Image(dict(zip(names, self.bands.values())))
+
+            def unmask(self, fill):
+                return Image({name: (lambda lat, lon, value=value: fill if value(lat, lon) is None else value(lat, lon))
+                              for name, value in self.bands.items()})
+
+            def sampleRegions(self, collection, scale, geometries):
+                return Sampled(self, collection)
+
+        class Sampled:
+            def __init__(self, image, features):
+                self.image = image
+                self.features = features
+
+            def getInfo(self):
+                fake.get_info_calls += 1
+                results = []
+                for (lon, lat), properties in self.features:
+                    values = {name: value(lat, lon) for name, value in self.image.bands.items()}
+                    # sampleRegions drops a point masked in any band
+                    if any(value is None for value in values.values()):
+                        continue
+                    results.append({'properties': {**properties, **values}})
+                return {'features': results}
+
+        class ImageCollection:
+            def __init__(self, name, band=None, period=None):
+                self.name = name
+                self.band = band
+                self.period = period
+
+            def select(self, band):
+                return ImageCollection(self.name, band, self.period)
+
+            def filterDate(self, start, end):
+                return ImageCollection(self.name, self.band, start)
+
+            def size(self):
+                return Number(0 if (self.name, *self.period) in fake.empty_periods else 1)
+
+            def mean(self):
+                year, month = self.period
+                masked = (self.name, year, month) in fake.masked_periods
+                return Image({self.band: lambda lat, lon: None if masked else fake.raw_value(year, month, lat)})
+
+            @staticmethod
+            def fromImages(images):
+                return Stack(images.items)
+
+        class Stack:
+            def __init__(self, images):
+                self.images = images
+
+            def toBands(self):
+                return Image({f"{index}_{name}": value for index, image in enumerate(self.images)
+                              for name, value in image.bands.items()})
+
+        class Number:
+            def __init__(self, value):
+                self.value = value
+
+            def gt(self, other):
+                return self.value > other
+
+        class List:
+            def __init__(self, items):
+                self.items = items.items if isinstance(items, List) else list(items)
+
+            def get(self, index):
+                return self.items[index]
+
+            def map(self, function):
+                return List([function(item) for item in self.items])
+
+        class Period(tuple):
+            # Dates are only used as month starts, so a (year, month) period stands in for ee.Date
+            def advance(self, delta, unit):
+                return self
+
+        def image(value):
+            return value
+
+        image.cat = lambda images: Image({name: value for part in images for name, value in part.bands.items()})
+        image.constant = lambda value: Image({'constant': lambda lat, lon: value})
+
+        ee.Initialize = lambda project=None: None
+        ee.Authenticate = lambda: None
+        ee.Image = image
+        ee.ImageCollection = ImageCollection
+        ee.List = List
+        ee.Date = types.SimpleNamespace(fromYMD=lambda year, month, day: Period((year, month)))
+        ee.Algorithms = types.SimpleNamespace(If=lambda condition, then, otherwise: then if condition else otherwise)
+        ee.Geometry = types.SimpleNamespace(Point=lambda lon, lat: (lon, lat))
+        ee.Feature = lambda geometry, properties: (geometry, properties)
+        ee.FeatureCollection = lambda features: features
+        return ee
+
+
+@pytest.fixture
+def fake_ee(monkeypatch):
+    fake = FakeEarthEngine(masked_periods=[(config.PRODUCTS['no2'].collection, 2021, 2)],
+                           empty_periods=[(config.PRODUCTS['co'].collection, 2021, 1)])
+    monkeypatch.setitem(sys.modules, 'ee', fake.module())
+    monkeypatch.delitem(sys.modules, 'models.fetchers.gee_fetcher', raising=False)
+    yield fake, importlib.import_module('models.fetchers.gee_fetcher')
+    sys.modules.pop('models.fetchers.gee_fetcher', None)
+
+
+def _routes() -> list[MonthlyDataRoute]:
+    lat, lon = config.CITIES['moscow'].coordinates
+    return [MonthlyDataRoute(city_id='moscow', bearing=bearing, year=2021, month=month, product=product,
+                             distances=[10, 20],
+                             points={distance: (lat + bearing * 0.01 + distance * 0.001, lon) for distance in [10, 20]})
+            for product in ['no2', 'co'] for bearing in [0, 90] for month in [1, 2]]
+
+
+def test_fetch_batch_samples_every_product_period_in_one_request(fake_ee):
+    fake, gee_fetcher = fake_ee
+    routes = _routes()
+
+    records = gee_fetcher.GeeFetcher().fetch_batch(routes)
+
+    assert fake.get_info_calls == 1
+    assert {(record['product'], record['month']) for record in records} == {('no2', 1), ('co', 2)}
+    assert len(records) == 8
+    for record in records:
+        route = next(route for route in routes if (route.bearing, route.month, route.product) ==
+                     (record['bearing'], record['month'], record['product']))
+        expected = fake.raw_value(2021, record['month'], route.points[record['distance']][0]) * \
+            config.PRODUCTS[record['product']].scale
+        assert record['value'] == pytest.approx(expected)
+        assert route.densities.get(record['distance']) == pytest.approx(expected, rel=1e-6)
+
+
+def test_fetch_batch_skips_masked_and_empty_periods(fake_ee):
+    _, gee_fetcher = fake_ee
+    routes = _routes()
+
+    gee_fetcher.GeeFetcher().fetch_batch(routes)
+
+    for route in routes:
+        unavailable = (route.product, route.month) in {('no2', 2), ('co', 1)}
+        assert all((route.densities.get(distance) is None) == unavailable for distance in route.distances)
+
+
+def test_fetch_batch_splits_points_over_requests(fake_ee, monkeypatch):
+    fake, gee_fetcher = fake_ee
+    monkeypatch.setattr(config, 'FETCH_MAX_POINTS_PER_REQUEST', 3)
+
+    records = gee_fetcher.GeeFetcher().fetch_batch(_routes())
+
+    assert fake.get_info_calls == 2
+    assert len(records) == 8
@@ -0,0 +1,18 @@
+from datetime import date
+
+import config
+from models.daily_runner import month_chunks
+from models.periods import is_settled, month_end
+
+
+def test_month_end_rolls_over_the_year():
+    assert month_end(2021, 12) == date(2022, 1, 1)
+    assert month_end(2021, 2) == date(2021, 3, 1)
+
+
+def test_month_settles_after_the_settle_window(monkeypatch):
+    monkeypatch.setattr(config, 'DAILY_SETTLE_DAYS', 14)
+
+    assert not is_settled(2024, 5, today=date(2024, 6, 14))
+    assert is_settled(2024, 5, today=date(2024, 6, 15))
+    assert [complete for _, _, complete in month_chunks([2024], date(2024, 6, 15))] == [True] * 5 + [False]
@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+
+import config
+from models import City
+from models.analysis import Analysis
+from models.fetchers.synthetic_fetcher import SyntheticFetcher
+from models.snapshot import load_snapshot, save_snapshot
+
+
+def _analysis() -> Analysis:
+    template = config.CITIES['moscow']
+    city = City(id=template.id, name=template.name, coordinates=template.coordinates, routes=[])
+    analysis = Analysis()
+    analysis.run(city, [0, 45], 2, [10, 20, 30], SyntheticFetcher(), None, years=[2021], products=['no2', 'co'])
+    # A cell that was requested but came back masked
+    del city.routes[0].densities[20]
+    return analysis
+
+
+def _contents(analysis: Analysis) -> dict:
+    return {route.key: (sorted(route.distances), dict(route.densities))
+            for city in analysis.cities.values() for route in city.routes}
+
+
+def test_round_trip_keeps_keys_values_and_masks(tmp_path):
+    analysis = _analysis()
+    path = str(tmp_path / "session")
+
+    info = save_snapshot(analysis, path)
+    restored = Analysis()
+    load_snapshot(restored, path)
+
+    assert info.routes == 4
+    assert [route.key for route in restored.cities['moscow'].routes] == \
+        [route.key for route in analysis.cities['moscow'].routes]
+    assert _contents(restored) == _contents(analysis)
+    first = restored.cities['moscow'].routes[0]
+    assert 20 in first.distances and 20 not in first.densities
+    assert restored.cities['moscow'].name == config.CITIES['moscow'].name
+
+
+def test_loaded_values_are_copy_on_write(tmp_path):
+    path = str(tmp_path / "session")
+    save_snapshot(_analysis(), path)
+    on_disk = np.load(os.path.join(path, "values.npy")).copy()
+    restored = Analysis()
+    load_snapshot(restored, path)
+
+    restored.cities['moscow'].routes[1].densities[10] = -1.0
+
+    np.testing.assert_array_equal(np.load(os.path.join(path, "values.npy")), on_disk)
+
+
+def test_saving_over_the_loaded_snapshot(tmp_path):
+    path = str(tmp_path / "session")
+    save_snapshot(_analysis(), path)
+    restored = Analysis()
+    load_snapshot(restored, path)
+    restored.cities['moscow'].routes[1].densities[10] = 123.0
+    expected = _contents(restored)
+
+    save_snapshot(restored, path)
+    reloaded = Analysis()
+    load_snapshot(reloaded, path)
+
+    assert _contents(reloaded) == expected
+    assert reloaded.cities['moscow'].routes[1].densities[10] == 123.0
+    assert sorted(os.listdir(tmp_path)) == ["session"]
@@ -1,26 +1,34 @@
+import logging
 import math
+import os
+from datetime import date
 
 from PySide6.QtCore import Signal, Qt
-from PySide6.QtGui import QStandardItem, QStandardItemModel
 from PySide6.QtWidgets import (
-    QComboBox, QFrame, QGridLayout, QGroupBox, QLabel, QMainWindow,
-    QPushButton, QSplitter, QSpinBox, QStatusBar, QTreeView, QVBoxLayout, QWidget
+    QCheckBox, QComboBox, QFileDialog, QFrame, QGridLayout, QGroupBox, QHBoxLayout, QLabel, QLineEdit, QMainWindow,
+    QPushButton, QSplitter, QSpinBox, QStatusBar, QTabWidget, QTreeView, QVBoxLayout, QWidget
 )
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
 
 import config
-from models import City
+from models import DEFAULT_PRODUCT_ID, City
+from models.rose_grid import RoseGrid
 from models.routes import MonthlyDataRoute
+from models.tracing import tracer
+from views.route_tree_model import RouteTreeModel
+
+logger = logging.getLogger(__name__)
 
 
 class MainWindow(QMainWindow):
+    all_months_toggled_signal = Signal(bool)
     bearing_selected_signal = Signal(int)
     city_selected_signal = Signal(City)
     data_route_selected_signal = Signal(MonthlyDataRoute)
     export_data_signal = Signal()
+    load_session_signal = Signal(str)
     month_selected_signal = Signal(int)
     plot_clicked_signal = Signal(float, float, int)
+    save_session_signal = Signal(str)
     start_analysis_signal = Signal()
 
     def __init__(self):
@@ -29,6 +37,11 @@ class MainWindow(QMainWindow):
         self.resize(1200, 700)
         self.setMinimumSize(800, 500)
 
+        self.figure = None
+        self.canvas = None
+        self.route_renderer = None
+        self.rose_canvas = None
+        self.rose_renderer = None
         self.current_plot_ax = None
         self.current_plotted_route: MonthlyDataRoute | None = None
         self._max_actual_density_on_plot: float = 0.0
@@ -46,11 +59,17 @@ class MainWindow(QMainWindow):
     def _init_signals(self):
         self.start_button.clicked.connect(self.start_analysis_signal.emit)
         self.export_button.clicked.connect(self.export_data_signal.emit)
+        self.save_session_button.clicked.connect(self._on_save_session_clicked)
+        self.load_session_button.clicked.connect(self._on_load_session_clicked)
         self.city_combo_box.currentIndexChanged.connect(self._on_city_changed)
         self.bearing_combo_box.currentIndexChanged.connect(self._on_bearing_changed)
+        self.all_bearings_check_box.toggled.connect(self._on_all_bearings_toggled)
         self.month_combo_box.currentIndexChanged.connect(self._on_month_changed)
+        self.all_months_check_box.toggled.connect(self._on_all_months_toggled)
+        self.first_year_spinbox.valueChanged.connect(self.last_year_spinbox.setMinimum)
+        self.last_year_spinbox.valueChanged.connect(self.first_year_spinbox.setMaximum)
         self.data_tree_view.clicked.connect(self._on_data_tree_item_clicked)
-        self.canvas.mpl_connect('button_press_event', self._on_plot_click)
+        self.tree_filter_edit.textChanged.connect(self._on_tree_filter_changed)
 
     def _init_ui(self):
         controls_layout = QVBoxLayout()
@@ -62,6 +81,26 @@ class MainWindow(QMainWindow):
 
         bearing_label = QLabel("Направление:")
         self.bearing_combo_box = QComboBox()
+        self.all_bearings_check_box = QCheckBox("Все направления (роза), шаг:")
+        self.bearing_step_spinbox = QSpinBox()
+        self.bearing_step_spinbox.setRange(1, 90)
+        self.bearing_step_spinbox.setSuffix("°")
+        self.bearing_step_spinbox.setValue(config.ROSE_BEARING_STEP_DEG)
+        self.bearing_step_spinbox.setEnabled(False)
+        rose_layout = QHBoxLayout()
+        rose_layout.addWidget(self.all_bearings_check_box)
+        rose_layout.addWidget(self.bearing_step_spinbox)
+
+        # All checked products are sampled together, in the same requests
+        self.products_group_box = QGroupBox("Показатели")
+        products_layout = QGridLayout()
+        self.products_group_box.setLayout(products_layout)
+        self.product_check_boxes: dict[str, QCheckBox] = {}
+        for index, product in enumerate(config.PRODUCTS.values()):
+            check_box = QCheckBox(product.name)
+            check_box.setChecked(product.id == DEFAULT_PRODUCT_ID)
+            products_layout.addWidget(check_box, index // 3, index % 3)
+            self.product_check_boxes[product.id] = check_box
 
         self.distances_group_box = QGroupBox("Дистанции (км)")
         distances_layout = QGridLayout()
@@ -82,8 +121,31 @@ class MainWindow(QMainWindow):
         distances_layout.addWidget(max_dist_label, 1, 0)
         distances_layout.addWidget(self.max_dist_spinbox, 1, 1)
 
+        self.adaptive_check_box = QCheckBox("Адаптивный шаг (уточнять у города)")
+        self.adaptive_check_box.setToolTip("Начать с заданного шага и дробить его до "
+                                           f"{config.ADAPTIVE_MIN_STEP_KM} км там, где профиль меняется быстро")
+        distances_layout.addWidget(self.adaptive_check_box, 2, 0, 1, 2)
+
+        self.years_group_box = QGroupBox("Годы")
+        years_layout = QGridLayout()
+        self.years_group_box.setLayout(years_layout)
+
+        last_available_year = date.today().year
+        self.first_year_spinbox = QSpinBox()
+        self.first_year_spinbox.setRange(config.FIRST_AVAILABLE_YEAR, last_available_year)
+        self.first_year_spinbox.setValue(min(config.YEARS_TO_ANALYZE))
+        self.last_year_spinbox = QSpinBox()
+        self.last_year_spinbox.setRange(config.FIRST_AVAILABLE_YEAR, last_available_year)
+        self.last_year_spinbox.setValue(max(config.YEARS_TO_ANALYZE))
+
+        years_layout.addWidget(QLabel("С:"), 0, 0)
+        years_layout.addWidget(self.first_year_spinbox, 0, 1)
+        years_layout.addWidget(QLabel("По:"), 1, 0)
+        years_layout.addWidget(self.last_year_spinbox, 1, 1)
+
         month_label = QLabel("Месяц:")
         self.month_combo_box = QComboBox()
+        self.all_months_check_box = QCheckBox("Все месяцы (одним запросом)")
 
         self.start_button = QPushButton("Начать анализ")
         self.start_button.setMinimumHeight(40)
@@ -92,22 +154,40 @@ class MainWindow(QMainWindow):
         self.export_button.setMinimumHeight(40)
         self.export_button.setEnabled(False)
 
+        self.save_session_button = QPushButton("Сохранить сессию")
+        self.save_session_button.setEnabled(False)
+        self.load_session_button = QPushButton("Открыть сессию")
+        session_layout = QHBoxLayout()
+        session_layout.addWidget(self.save_session_button)
+        session_layout.addWidget(self.load_session_button)
+
+        self.tree_filter_edit = QLineEdit()
+        self.tree_filter_edit.setPlaceholderText("Фильтр: город, направление, месяц, год, показатель")
+        self.tree_filter_edit.setClearButtonEnabled(True)
+
         self.data_tree_view = QTreeView()
-        self.tree_model = QStandardItemModel()
+        self.tree_model = RouteTreeModel()
         self.data_tree_view.setModel(self.tree_model)
         self.data_tree_view.setHeaderHidden(True)
+        self.data_tree_view.setUniformRowHeights(True)
 
         controls_layout.addWidget(city_label)
         controls_layout.addWidget(self.city_combo_box)
         controls_layout.addWidget(bearing_label)
         controls_layout.addWidget(self.bearing_combo_box)
+        controls_layout.addLayout(rose_layout)
         controls_layout.addWidget(month_label)
         controls_layout.addWidget(self.month_combo_box)
+        controls_layout.addWidget(self.all_months_check_box)
+        controls_layout.addWidget(self.products_group_box)
         controls_layout.addWidget(self.distances_group_box)
+        controls_layout.addWidget(self.years_group_box)
         controls_layout.addSpacing(20)
         controls_layout.addWidget(self.start_button)
         controls_layout.addWidget(self.export_button)
+        controls_layout.addLayout(session_layout)
         controls_layout.addWidget(QLabel("Загруженные данные:"))
+        controls_layout.addWidget(self.tree_filter_edit)
         controls_layout.addWidget(self.data_tree_view)
         controls_layout.addStretch()
 
@@ -118,9 +198,9 @@ class MainWindow(QMainWindow):
         self.plot_area_layout = QVBoxLayout()
         self.plot_area_layout.setContentsMargins(5, 5, 5, 5)
 
-        self.figure = Figure()
-        self.canvas = FigureCanvas(self.figure)
-        self.plot_area_layout.addWidget(self.canvas)
+        self.plot_placeholder = QLabel("Загрузка графика...")
+        self.plot_placeholder.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.plot_area_layout.addWidget(self.plot_placeholder)
 
         self.plot_area_widget = QFrame()
         self.plot_area_widget.setLayout(self.plot_area_layout)
@@ -136,7 +216,47 @@ class MainWindow(QMainWindow):
         self.statusBar = QStatusBar()
         self.setStatusBar(self.statusBar)
 
+    def init_plot(self):
+        # matplotlib is the heaviest import of the window, so the canvas replaces a placeholder after the first paint
+        if self.canvas is not None:
+            return
+        with tracer.span("startup.init_plot"):
+            from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+            from matplotlib.figure import Figure
+            from views.route_plot_renderer import RoutePlotRenderer
+
+            from views.rose_heatmap_renderer import RoseHeatmapRenderer
+
+            self.figure = Figure()
+            self.canvas = FigureCanvas(self.figure)
+            self.route_renderer = RoutePlotRenderer(self.figure, self.canvas) if config.PLOT_REUSE_ARTISTS else None
+            self.canvas.mpl_connect('button_press_event', self._on_plot_click)
+
+            self.rose_canvas = FigureCanvas(Figure())
+            self.rose_renderer = RoseHeatmapRenderer(self.rose_canvas.figure, self.rose_canvas)
+            self.rose_year_combo_box = QComboBox()
+            self.rose_year_combo_box.currentIndexChanged.connect(self._on_rose_year_changed)
+            rose_year_layout = QHBoxLayout()
+            rose_year_layout.addWidget(QLabel("Год:"))
+            rose_year_layout.addWidget(self.rose_year_combo_box)
+            rose_year_layout.addStretch()
+            rose_layout = QVBoxLayout()
+            rose_layout.addLayout(rose_year_layout)
+            rose_layout.addWidget(self.rose_canvas)
+            self.rose_tab = QWidget()
+            self.rose_tab.setLayout(rose_layout)
+
+            self.plot_tabs = QTabWidget()
+            self.plot_tabs.addTab(self.canvas, "Профиль")
+            self.plot_tabs.addTab(self.rose_tab, "Роза направлений")
+            self.plot_area_layout.replaceWidget(self.plot_placeholder, self.plot_tabs)
+            self.plot_placeholder.deleteLater()
+
     def clear_model_elements(self):
+        if self.route_renderer:
+            self.route_renderer.clear_model()
+            return
+
         elements_to_remove = [
             self._plot_model_line1,
             self._plot_model_line2,
@@ -149,7 +269,8 @@ class MainWindow(QMainWindow):
                 try:
                     element.remove()
                 except NotImplementedError:
-                    print(f"Warning: Could not remove element {element}. It might already be removed or not supported.")
+                    logger.warning("Could not remove element %s. It might already be removed or not supported.",
+                                   element)
 
         self._plot_model_line1 = None
         self._plot_model_line2 = None
@@ -157,9 +278,8 @@ class MainWindow(QMainWindow):
         self._plot_point2_marker = None
 
         if self.current_plot_ax:
-            if self.current_plotted_route and self.current_plotted_route.densities:
-                densities_from_route = [q for q in self.current_plotted_route.densities.values() if not math.isnan(q)]
-                self._update_ylim_auto(densities_from_route)
+            if self.current_plotted_route:
+                self._update_ylim_auto(self.current_plotted_route.densities.valid_arrays()[1].tolist())
             else:
                 self._update_ylim_auto([])
 
@@ -169,9 +289,25 @@ class MainWindow(QMainWindow):
     def get_distance_parameters(self) -> dict:
         return {
             'step': self.step_spinbox.value(),
-            'max': self.max_dist_spinbox.value()
+            'max': self.max_dist_spinbox.value(),
+            'adaptive': self.adaptive_check_box.isChecked()
         }
 
+    def get_years(self) -> list[int]:
+        return list(range(self.first_year_spinbox.value(), self.last_year_spinbox.value() + 1))
+
+    def get_products(self) -> list[str]:
+        return [product for product, check_box in self.product_check_boxes.items() if check_box.isChecked()]
+
+    def get_bearings(self) -> list[int] | None:
+        if not self.all_bearings_check_box.isChecked():
+            return None
+        return list(range(0, 360, self.bearing_step_spinbox.value()))
+
+    def _on_all_bearings_toggled(self, checked: bool):
+        self.bearing_combo_box.setEnabled(not checked)
+        self.bearing_step_spinbox.setEnabled(checked)
+
     def _on_bearing_changed(self):
         bearing_data = self.bearing_combo_box.currentData()
         if bearing_data is not None:
@@ -182,14 +318,40 @@ class MainWindow(QMainWindow):
         if city_data:
             self.city_selected_signal.emit(city_data)
 
+    def _on_save_session_clicked(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Сохранить сессию",
+                                              os.path.join(config.SNAPSHOTS_FOLDER, "session.zsnap"),
+                                              "Снимок сессии (*.zsnap)")
+        if path:
+            self.save_session_signal.emit(path if path.endswith(".zsnap") else path + ".zsnap")
+
+    def _on_load_session_clicked(self):
+        # A snapshot is a folder of arrays, so it is opened with the folder dialog
+        path = QFileDialog.getExistingDirectory(self, "Открыть сессию", config.SNAPSHOTS_FOLDER)
+        if path:
+            self.load_session_signal.emit(path)
+
     def _on_data_tree_item_clicked(self, index):
-        item = self.tree_model.itemFromIndex(index)
-        if item:
-            data_obj = item.data()
-            if isinstance(data_obj, MonthlyDataRoute):
-                print(
-                    f"Выбран маршрут: Bearing={data_obj.bearing}, Month={data_obj.month}, Year={data_obj.year}. Densities: {data_obj.densities}")
-                self.data_route_selected_signal.emit(data_obj)
+        data_obj = index.data(Qt.ItemDataRole.UserRole)
+        if isinstance(data_obj, MonthlyDataRoute):
+            logger.debug("Выбран маршрут: Bearing=%d, Month=%d, Year=%d", data_obj.bearing, data_obj.month,
+                         data_obj.year)
+            self.data_route_selected_signal.emit(data_obj)
+
+    def _on_tree_filter_changed(self, text: str):
+        self.tree_model.set_filter(text)
+        if text.strip():
+            self.data_tree_view.expandAll()
+        else:
+            self._expand_tree_cities()
+
+    def _expand_tree_cities(self):
+        for row in range(self.tree_model.rowCount()):
+            self.data_tree_view.expand(self.tree_model.index(row, 0))
+
+    def _on_all_months_toggled(self, checked: bool):
+        self.month_combo_box.setEnabled(not checked)
+        self.all_months_toggled_signal.emit(checked)
 
     def _on_month_changed(self, index: int):
         month_data = self.month_combo_box.itemData(index)
@@ -201,10 +363,10 @@ class MainWindow(QMainWindow):
             x_clicked = event.xdata
             y_clicked = event.ydata
             button = event.button
-            print(f"Клик на графике: x={x_clicked:.2f}, y={y_clicked:.2f}, кнопка={button}")
+            logger.debug("Клик на графике: x=%.2f, y=%.2f, кнопка=%s", x_clicked, y_clicked, button)
             self.plot_clicked_signal.emit(x_clicked, y_clicked, button)
         else:
-            print("Клик вне области графика.")
+            logger.debug("Клик вне области графика.")
             if event.button == 3:
                 self.plot_clicked_signal.emit(0.0, 0.0, event.button)
 
@@ -244,10 +406,7 @@ class MainWindow(QMainWindow):
         if self.current_plot_ax is None or self.current_plotted_route is None:
             return
 
-        all_densities_to_consider = []
-        for val in self.current_plotted_route.densities.values():
-            if not math.isnan(val):
-                all_densities_to_consider.append(val)
+        all_densities_to_consider = self.current_plotted_route.densities.valid_arrays()[1].tolist()
 
         for val in model_densities_clipped:
             if not math.isnan(val):
@@ -284,8 +443,53 @@ class MainWindow(QMainWindow):
 
         self.current_plot_ax.set_ylim(y_min_padded, y_max_padded)
 
+    @staticmethod
+    def _route_title(data_route: MonthlyDataRoute) -> str:
+        # Restored sessions may hold cities that are no longer configured
+        city = config.CITIES.get(data_route.city_id)
+        return (f"{config.PRODUCTS[data_route.product].label} для {city.name if city else data_route.city_id}, "
+                f"{config.BEARINGS.get(data_route.bearing, data_route.bearing)}°, "
+                f"{config.MONTHS[data_route.month]} ({data_route.year})")
+
+    @staticmethod
+    def _rose_title(grid: RoseGrid, year: int) -> str:
+        city = config.CITIES.get(grid.city_id)
+        return (f"{config.PRODUCTS[grid.product].label} по направлениям для {city.name if city else grid.city_id}, "
+                f"{config.MONTHS[grid.month]} ({year})")
+
+    def _on_rose_year_changed(self, index: int):
+        year = self.rose_year_combo_box.itemData(index)
+        if year is not None and self.rose_renderer.grid is not None:
+            with tracer.span("plot.rose_year"):
+                self.rose_renderer.show_year(year, self._rose_title(self.rose_renderer.grid, year))
+
+    @tracer.span("plot.rose")
+    def plot_rose(self, grid: RoseGrid, year: int):
+        self.init_plot()
+        self.rose_renderer.show_grid(grid, year, self._rose_title(grid, year))
+        self.rose_year_combo_box.blockSignals(True)
+        self.rose_year_combo_box.clear()
+        for grid_year in grid.years:
+            self.rose_year_combo_box.addItem(str(grid_year), userData=grid_year)
+        self.rose_year_combo_box.setCurrentIndex(grid.year_index(year) or 0)
+        self.rose_year_combo_box.blockSignals(False)
+
+    def current_rose_year(self) -> int | None:
+        return self.rose_year_combo_box.currentData() if self.rose_canvas is not None else None
+
+    def show_rose_tab(self):
+        self.init_plot()
+        self.plot_tabs.setCurrentWidget(self.rose_tab)
+
+    @tracer.span("plot.route")
     def plot_data(self, data_route: MonthlyDataRoute):
+        self.init_plot()
         self.current_plotted_route = data_route
+        if self.route_renderer:
+            self.current_plot_ax = self.route_renderer.ax
+            self.route_renderer.plot_route(data_route, self._route_title(data_route))
+            return
+
         self.figure.clear()
         self.current_plot_ax = self.figure.add_subplot(111)
 
@@ -294,17 +498,9 @@ class MainWindow(QMainWindow):
         self._plot_point1_marker = None
         self._plot_point2_marker = None
 
-        distances = []
-        densities = []
+        distances, densities = data_route.densities.valid_arrays()
 
-        sorted_densities = sorted(data_route.densities.items())
-
-        for dist, density in sorted_densities:
-            if not math.isnan(density):
-                distances.append(dist)
-                densities.append(density)
-
-        if not distances:
+        if not len(distances):
             self.current_plot_ax.text(0.5, 0.5, "Нет данных для отображения",
                                       horizontalalignment='center', verticalalignment='center',
                                       transform=self.current_plot_ax.transAxes, fontsize=14, color='gray')
@@ -314,23 +510,31 @@ class MainWindow(QMainWindow):
             return
 
         self.current_plot_ax.plot(distances, densities, marker='o', linestyle='-', label='Полученные данные')
-        self.current_plot_ax.set_title(
-            f"Плотность NO2 для {config.CITIES[data_route.city_id].name}, {config.BEARINGS[data_route.bearing]}°, {config.MONTHS[data_route.month]} ({data_route.year})")
+        self.current_plot_ax.set_title(self._route_title(data_route))
         self.current_plot_ax.set_xlabel("Расстояние от центра (км)")
-        self.current_plot_ax.set_ylabel(r"Плотность NO2 ($\mu$моль/м$^2$)")
+        self.current_plot_ax.set_ylabel(config.PRODUCTS[data_route.product].axis_label)
         self.current_plot_ax.grid(True)
         self.current_plot_ax.legend()
 
-        self._max_actual_density_on_plot = max(densities)
+        self._max_actual_density_on_plot = float(densities.max())
 
-        self._update_ylim_auto(densities)
+        self._update_ylim_auto(densities.tolist())
 
         self.canvas.draw()
 
+    @tracer.span("plot.model")
     def plot_double_point_model(self, point1_coords: tuple[float, float], point2_coords: tuple[float, float],
                                 model_distances: list[float], model_densities: list[float], theta2_value: float):
         if self.current_plot_ax is None: return
 
+        if self.route_renderer:
+            self.route_renderer.show_model(
+                [point1_coords, point2_coords], model_distances, model_densities,
+                {'color': 'purple', 'linestyle': '-'},
+                f'Модель (Q = $\\Theta_1$/r + $\\Theta_2$, Фон $\\Theta_2$={theta2_value:.2f})'
+            )
+            return
+
         self.clear_model_elements()
 
         self._plot_point1_marker, = self.current_plot_ax.plot(
@@ -342,7 +546,7 @@ class MainWindow(QMainWindow):
             label=f'Опорная точка 2: ({point2_coords[0]:.0f}км, {point2_coords[1]:.2f})'
         )
 
-        dynamic_clip_limit = self._max_actual_density_on_plot + 50
+        dynamic_clip_limit = self._max_actual_density_on_plot * (1 + config.MODEL_CLIP_HEADROOM)
         clipped_model_densities = [min(val, dynamic_clip_limit) for val in model_densities]
 
         self._plot_model_line2, = self.current_plot_ax.plot(
@@ -354,10 +558,16 @@ class MainWindow(QMainWindow):
         self.current_plot_ax.legend()
         self.canvas.draw()
 
+    @tracer.span("plot.model")
     def plot_single_point_model(self, point1_coords: tuple[float, float], model_distances: list[float],
                                 model_densities: list[float]):
         if self.current_plot_ax is None: return
 
+        if self.route_renderer:
+            self.route_renderer.show_model([point1_coords], model_distances, model_densities,
+                                           {'color': 'red', 'linestyle': '--'}, 'Модель (Q = $\\Theta_1$/r)')
+            return
+
         self.clear_model_elements()
 
         self._plot_point1_marker, = self.current_plot_ax.plot(
@@ -365,7 +575,7 @@ class MainWindow(QMainWindow):
             label=f'Опорная точка 1: ({point1_coords[0]:.0f}км, {point1_coords[1]:.2f})'
         )
 
-        dynamic_clip_limit = self._max_actual_density_on_plot + 50
+        dynamic_clip_limit = self._max_actual_density_on_plot * (1 + config.MODEL_CLIP_HEADROOM)
         clipped_model_densities = [min(val, dynamic_clip_limit) for val in model_densities]
 
         self._plot_model_line1, = self.current_plot_ax.plot(
@@ -392,62 +602,34 @@ class MainWindow(QMainWindow):
 
     def set_ui_enabled(self, enabled: bool):
         self.city_combo_box.setEnabled(enabled)
-        self.bearing_combo_box.setEnabled(enabled)
-        self.month_combo_box.setEnabled(enabled)
+        self.bearing_combo_box.setEnabled(enabled and not self.all_bearings_check_box.isChecked())
+        self.all_bearings_check_box.setEnabled(enabled)
+        self.bearing_step_spinbox.setEnabled(enabled and self.all_bearings_check_box.isChecked())
+        self.month_combo_box.setEnabled(enabled and not self.all_months_check_box.isChecked())
+        self.all_months_check_box.setEnabled(enabled)
         self.step_spinbox.setEnabled(enabled)
         self.max_dist_spinbox.setEnabled(enabled)
+        self.adaptive_check_box.setEnabled(enabled)
+        for check_box in self.product_check_boxes.values():
+            check_box.setEnabled(enabled)
+        self.first_year_spinbox.setEnabled(enabled)
+        self.last_year_spinbox.setEnabled(enabled)
         self.start_button.setEnabled(enabled)
-        self.data_tree_view.setEnabled(enabled)
+        self.load_session_button.setEnabled(enabled)
+        self.export_button.setEnabled(enabled and self.tree_model.route_count() > 0)
+        self.save_session_button.setEnabled(enabled and self.tree_model.route_count() > 0)
+
+    def add_routes_to_tree(self, routes: list[MonthlyDataRoute]):
+        self.tree_model.add_routes(routes)
+        self._expand_tree_cities()
 
     def update_data_tree(self, cities_data: dict[str, City]):
+        for city_obj in cities_data.values():
+            self.tree_model.add_routes(route for route in city_obj.routes if isinstance(route, MonthlyDataRoute))
+        self._expand_tree_cities()
+        self.export_button.setEnabled(self.tree_model.route_count() > 0)
+        self.save_session_button.setEnabled(self.tree_model.route_count() > 0)
+
+    def reset_data_tree(self, cities_data: dict[str, City]):
         self.tree_model.clear()
-        self.tree_model.setHorizontalHeaderLabels(['Загруженные данные'])
-        root_node = self.tree_model.invisibleRootItem()
-
-        has_any_valid_routes = False
-
-        for city_id, city_obj in cities_data.items():
-            has_valid_routes_for_city = False
-            for route_r in city_obj.routes:
-                if isinstance(route_r, MonthlyDataRoute) and route_r.densities:
-                    if any(not math.isnan(val) for val in route_r.densities.values()):
-                        has_valid_routes_for_city = True
-                        has_any_valid_routes = True
-                        break
-            if not has_valid_routes_for_city:
-                continue
-
-            city_item = QStandardItem(city_obj.name)
-            city_item.setEditable(False)
-            city_item.setSelectable(False)
-            root_node.appendRow(city_item)
-
-            routes_by_bearing_month: dict[tuple[int, int], list[MonthlyDataRoute]] = {}
-            for route_r in city_obj.routes:
-                if isinstance(route_r, MonthlyDataRoute) and route_r.densities:
-                    if any(not math.isnan(val) for val in route_r.densities.values()):
-                        key = (route_r.bearing, route_r.month)
-                        if key not in routes_by_bearing_month:
-                            routes_by_bearing_month[key] = []
-                        routes_by_bearing_month[key].append(route_r)
-
-            for (bearing, month_num), monthly_routes in routes_by_bearing_month.items():
-                bearing_name = config.BEARINGS.get(bearing, f"{bearing}°")
-                month_name = config.MONTHS.get(month_num, f"Месяц {month_num}")
-                route_item_text = f"{bearing_name}, {month_name}"
-                route_item = QStandardItem(route_item_text)
-                route_item.setEditable(False)
-                route_item.setSelectable(False)
-                city_item.appendRow(route_item)
-
-                monthly_routes.sort(key=lambda r: r.year)
-
-                for route_obj in monthly_routes:
-                    year_item_text = f"Данные за {route_obj.year} год"
-                    year_item = QStandardItem(year_item_text)
-                    year_item.setEditable(False)
-                    year_item.setData(route_obj)
-                    route_item.appendRow(year_item)
-
-        self.data_tree_view.expandAll()
-        self.export_button.setEnabled(has_any_valid_routes)
+        self.update_data_tree(cities_data)
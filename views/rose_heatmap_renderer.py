@@ -0,0 +1,81 @@
+import numpy as np
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+
+import config
+from models.rose_grid import RoseGrid
+
+SINGLE_BEARING_WIDTH_DEG = 45
+
+
+def bearing_edges(bearings: np.ndarray) -> np.ndarray:
+    # Cell borders lie halfway between neighbouring bearings, around the full circle
+    if len(bearings) == 1:
+        return np.radians(bearings[0] + np.array([-0.5, 0.5]) * SINGLE_BEARING_WIDTH_DEG)
+    wrapped = np.concatenate([[bearings[-1] - 360], bearings, [bearings[0] + 360]]).astype(np.float64)
+    return np.radians((wrapped[:-1] + wrapped[1:]) / 2)
+
+
+def distance_edges(distances: np.ndarray) -> np.ndarray:
+    if len(distances) == 1:
+        return np.array([max(distances[0] - 0.5, 0), distances[0] + 0.5], dtype=np.float64)
+    values = distances.astype(np.float64)
+    middles = (values[:-1] + values[1:]) / 2
+    first = max(values[0] - (middles[0] - values[0]), 0)
+    last = values[-1] + (values[-1] - middles[-1])
+    return np.concatenate([[first], middles, [last]])
+
+
+class RoseHeatmapRenderer:
+    def __init__(self, figure: Figure, canvas: FigureCanvas):
+        self.figure = figure
+        self.canvas = canvas
+        self.ax = figure.add_subplot(111, projection='polar')
+        self.ax.set_theta_zero_location('N')
+        self.ax.set_theta_direction(-1)
+        self.empty_text = self.ax.text(0.5, 0.5, "Нет данных для отображения",
+                                       horizontalalignment='center', verticalalignment='center',
+                                       transform=self.ax.transAxes, fontsize=14, color='gray')
+
+        # One mesh per grid geometry: switching years only swaps its array
+        self.mesh = None
+        self.colorbar = None
+        self.grid: RoseGrid | None = None
+        self._geometry: tuple[tuple[int, ...], tuple[int, ...]] | None = None
+
+    def _ensure_mesh(self, grid: RoseGrid):
+        geometry = tuple(grid.bearings.tolist()), tuple(grid.distances.tolist())
+        if geometry == self._geometry:
+            return
+        if self.mesh is not None:
+            self.mesh.remove()
+        theta, radius = np.meshgrid(bearing_edges(grid.bearings), distance_edges(grid.distances), indexing='ij')
+        self.mesh = self.ax.pcolormesh(theta, radius, np.ma.masked_invalid(grid.values[0]), shading='flat',
+                                       cmap='viridis')
+        self.ax.set_ylim(0, radius.max())
+        if self.colorbar is None:
+            self.colorbar = self.figure.colorbar(self.mesh, ax=self.ax, pad=0.1)
+        else:
+            self.colorbar.update_normal(self.mesh)
+        self._geometry = geometry
+
+    def show_grid(self, grid: RoseGrid, year: int, title: str):
+        self.grid = grid
+        self._ensure_mesh(grid)
+        self.colorbar.set_label(config.PRODUCTS[grid.product].axis_label)
+        # A shared colour scale keeps the years of one rose comparable
+        value_range = grid.value_range()
+        if value_range is not None:
+            self.mesh.set_clim(*value_range)
+        self.show_year(year, title)
+
+    def show_year(self, year: int, title: str):
+        index = self.grid.year_index(year) if self.grid is not None else None
+        has_data = index is not None and not np.isnan(self.grid.values[index]).all()
+        self.empty_text.set_visible(not has_data)
+        if self.mesh is not None:
+            self.mesh.set_visible(has_data)
+            if has_data:
+                self.mesh.set_array(np.ma.masked_invalid(self.grid.values[index]))
+        self.ax.set_title(title if has_data else "", pad=20)
+        self.canvas.draw_idle()
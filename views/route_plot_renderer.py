@@ -0,0 +1,157 @@
+import math
+
+import numpy as np
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+
+import config
+from models import DEFAULT_PRODUCT_ID
+from models.routes import MonthlyDataRoute
+
+PADDING_FACTOR = 0.1
+POINT_MARKER_COLORS = ('green', 'blue')
+
+
+def padded_ylim(min_val: float, max_val: float) -> tuple[float, float]:
+    y_range = max_val - min_val
+    if y_range == 0:
+        if min_val == 0:
+            return -0.1, 0.1
+        y_min_padded = min_val * (1 - PADDING_FACTOR)
+        y_max_padded = min_val * (1 + PADDING_FACTOR)
+        if min_val > 0 and y_min_padded < 0:
+            y_min_padded = 0
+        return y_min_padded, y_max_padded
+
+    y_min_padded = min_val - y_range * PADDING_FACTOR
+    y_max_padded = max_val + y_range * PADDING_FACTOR
+    if y_min_padded < 0 and min_val >= 0:
+        y_min_padded = 0
+    return y_min_padded, y_max_padded
+
+
+class RoutePlotRenderer:
+    def __init__(self, figure: Figure, canvas: FigureCanvas):
+        self.figure = figure
+        self.canvas = canvas
+        self.ax = figure.add_subplot(111)
+        self.ax.set_xlabel("Расстояние от центра (км)")
+        self.ax.set_ylabel(config.PRODUCTS[DEFAULT_PRODUCT_ID].axis_label)
+        self.ax.grid(True)
+
+        self.data_line, = self.ax.plot([], [], marker='o', linestyle='-', label='Полученные данные')
+        self.ax.legend(handles=[self.data_line], loc='upper left')
+        self.empty_text = self.ax.text(0.5, 0.5, "Нет данных для отображения",
+                                       horizontalalignment='center', verticalalignment='center',
+                                       transform=self.ax.transAxes, fontsize=14, color='gray', visible=False)
+
+        # Model overlays are animated: they are skipped by full redraws and blitted over the cached background
+        self.model_line, = self.ax.plot([], [], animated=True, visible=False)
+        self.point_markers = [
+            self.ax.plot([], [], marker='X', color=color, markersize=10, linestyle='None', animated=True,
+                         visible=False)[0]
+            for color in POINT_MARKER_COLORS
+        ]
+        self.model_label = self.ax.text(0.98, 0.98, "", transform=self.ax.transAxes, horizontalalignment='right',
+                                        verticalalignment='top', animated=True, visible=False,
+                                        bbox={'facecolor': 'white', 'alpha': 0.8, 'edgecolor': 'lightgray'})
+
+        self._background = None
+        self._data_range: tuple[float, float] | None = None
+        self.max_actual_density = 0.0
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _overlays(self) -> list:
+        return [self.model_line, *self.point_markers, self.model_label]
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_overlays()
+
+    def _draw_overlays(self):
+        for artist in self._overlays():
+            if artist.get_visible():
+                self.ax.draw_artist(artist)
+
+    def _blit(self):
+        if self._background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_overlays()
+        self.canvas.blit(self.ax.bbox)
+
+    def _apply_ylim(self, ylim: tuple[float, float]):
+        if np.allclose(self.ax.get_ylim(), ylim):
+            self._blit()
+        else:
+            self.ax.set_ylim(*ylim)
+            self.canvas.draw_idle()
+
+    def _data_ylim(self) -> tuple[float, float]:
+        if self._data_range is None:
+            return 0, 1
+        return padded_ylim(*self._data_range)
+
+    def plot_route(self, route: MonthlyDataRoute, title: str):
+        for artist in self._overlays():
+            artist.set_visible(False)
+        self.ax.set_ylabel(config.PRODUCTS[route.product].axis_label)
+
+        distances, densities = route.densities.valid_arrays()
+        self.data_line.set_data(distances, densities)
+        has_data = len(distances) > 0
+        self.empty_text.set_visible(not has_data)
+        self.data_line.set_visible(has_data)
+        self.ax.set_title(title if has_data else "")
+
+        if has_data:
+            stats = route.densities.stats()
+            self._data_range = stats.minimum, stats.maximum
+            self.max_actual_density = stats.maximum
+            x_padding = max((distances[-1] - distances[0]) * 0.05, 1)
+            self.ax.set_xlim(distances[0] - x_padding, distances[-1] + x_padding)
+        else:
+            self._data_range = None
+            self.max_actual_density = 0.0
+
+        self.ax.set_ylim(*self._data_ylim())
+        self.canvas.draw_idle()
+
+    def show_model(self, points: list[tuple[float, float]], model_distances: list[float],
+                   model_densities: list[float], line_style: dict, label: str):
+        dynamic_clip_limit = self.max_actual_density + abs(self.max_actual_density) * config.MODEL_CLIP_HEADROOM
+        clipped_model_densities = np.minimum(np.asarray(model_densities, dtype=np.float64), dynamic_clip_limit)
+
+        self.model_line.set_data(model_distances, clipped_model_densities)
+        self.model_line.set(**line_style)
+        self.model_line.set_visible(True)
+
+        label_lines = []
+        for index, marker in enumerate(self.point_markers):
+            if index < len(points):
+                marker.set_data([points[index][0]], [points[index][1]])
+                marker.set_visible(True)
+                label_lines.append(f"Опорная точка {index + 1}: ({points[index][0]:.0f}км, {points[index][1]:.2f})")
+            else:
+                marker.set_visible(False)
+        label_lines.append(label)
+        self.model_label.set_text("\n".join(label_lines))
+        self.model_label.set_visible(True)
+
+        candidates = clipped_model_densities[~np.isnan(clipped_model_densities)].tolist()
+        candidates += [point[1] for point in points if not math.isnan(point[1])]
+        if self._data_range is not None:
+            candidates += list(self._data_range)
+        if not candidates:
+            self._apply_ylim((0, 1))
+            return
+
+        y_min_padded, y_max_padded = padded_ylim(min(candidates), max(candidates))
+        actual_max_plot_limit = dynamic_clip_limit + dynamic_clip_limit * PADDING_FACTOR * 0.1
+        self._apply_ylim((y_min_padded, max(y_max_padded, actual_max_plot_limit)))
+
+    def clear_model(self):
+        for artist in self._overlays():
+            artist.set_visible(False)
+        self._apply_ylim(self._data_ylim())
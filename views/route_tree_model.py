@@ -0,0 +1,211 @@
+import bisect
+from typing import Any, Iterable
+
+from PySide6.QtCore import QAbstractItemModel, QModelIndex, QPersistentModelIndex, Qt
+
+import config
+from models.data_cube import RouteKey
+from models.routes import MonthlyDataRoute
+
+# Product groups follow the order of config.PRODUCTS, so NO2 stays on top
+PRODUCT_ORDER = {product: index for index, product in enumerate(config.PRODUCTS)}
+
+
+class _TreeNode:
+    __slots__ = ('parent', 'children', 'text', 'sort_key', 'route', 'row', 'fetched')
+
+    def __init__(self, parent: '_TreeNode | None', text: str, sort_key: Any = None,
+                 route: MonthlyDataRoute | None = None):
+        self.parent = parent
+        self.children: list[_TreeNode] = []
+        self.text = text
+        self.sort_key = sort_key
+        self.route = route
+        self.row = 0
+        self.fetched = False
+
+
+class RouteTreeModel(QAbstractItemModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._root = _TreeNode(None, "")
+        self._root.fetched = True
+        self._nodes: dict[tuple, _TreeNode] = {}
+        self._routes: dict[RouteKey, MonthlyDataRoute] = {}
+        self._search_text: dict[RouteKey, str] = {}
+        self._filter_terms: list[str] = []
+        self._fetching: _TreeNode | None = None
+
+    def route_count(self) -> int:
+        return len(self._routes)
+
+    def _node(self, index: QModelIndex | QPersistentModelIndex) -> _TreeNode:
+        return index.internalPointer() if index.isValid() else self._root
+
+    def _index_of(self, node: _TreeNode) -> QModelIndex:
+        if node is self._root:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node)
+
+    def index(self, row: int, column: int, parent: QModelIndex = QModelIndex()) -> QModelIndex:
+        parent_node = self._node(parent)
+        if column != 0 or row < 0 or row >= self.rowCount(parent):
+            return QModelIndex()
+        return self.createIndex(row, 0, parent_node.children[row])
+
+    def parent(self, index: QModelIndex = QModelIndex()) -> QModelIndex:
+        if not index.isValid():
+            return QModelIndex()
+        parent_node = index.internalPointer().parent
+        if parent_node is None or parent_node is self._root:
+            return QModelIndex()
+        return self._index_of(parent_node)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.column() > 0:
+            return 0
+        node = self._node(parent)
+        return len(node.children) if node.fetched else 0
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 1
+
+    def hasChildren(self, parent: QModelIndex = QModelIndex()) -> bool:
+        return bool(self._node(parent).children)
+
+    def canFetchMore(self, parent: QModelIndex) -> bool:
+        node = self._node(parent)
+        return not node.fetched and node is not self._fetching and bool(node.children)
+
+    def fetchMore(self, parent: QModelIndex):
+        node = self._node(parent)
+        if not self.canFetchMore(parent):
+            return
+        # Views may re-enter fetchMore from rowsAboutToBeInserted while this node is still being populated
+        self._fetching = node
+        self.beginInsertRows(parent, 0, len(node.children) - 1)
+        node.fetched = True
+        self._fetching = None
+        self.endInsertRows()
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role == Qt.ItemDataRole.DisplayRole:
+            return node.text
+        if role == Qt.ItemDataRole.UserRole:
+            return node.route
+        if role == Qt.ItemDataRole.ToolTipRole and node.route is not None:
+            stats = node.route.densities.stats()
+            return (f"Точек: {stats.count}, мин: {stats.minimum:.2f}, макс: {stats.maximum:.2f}, "
+                    f"среднее: {stats.mean:.2f}")
+        return None
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlag:
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        if index.internalPointer().route is None:
+            return Qt.ItemFlag.ItemIsEnabled
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return 'Загруженные данные'
+        return None
+
+    @staticmethod
+    def _describe(route: MonthlyDataRoute) -> str:
+        city = config.CITIES.get(route.city_id)
+        parts = [
+            city.name if city else route.city_id,
+            route.city_id,
+            config.BEARINGS.get(route.bearing, ""),
+            f"{route.bearing}°",
+            config.MONTHS.get(route.month, ""),
+            str(route.year),
+            config.PRODUCTS[route.product].name
+        ]
+        return " ".join(parts).lower()
+
+    def _matches(self, key: RouteKey) -> bool:
+        search_text = self._search_text[key]
+        return all(term in search_text for term in self._filter_terms)
+
+    def _ensure_child(self, parent: _TreeNode, node_key: tuple, text: str, sort_key: Any = None,
+                      route: MonthlyDataRoute | None = None, notify: bool = True) -> _TreeNode:
+        node = self._nodes.get(node_key)
+        if node is not None:
+            return node
+
+        node = _TreeNode(parent, text, sort_key, route)
+        if sort_key is None:
+            position = len(parent.children)
+        else:
+            position = bisect.bisect_right(parent.children, sort_key, key=lambda child: child.sort_key)
+
+        if notify and parent.fetched:
+            self.beginInsertRows(self._index_of(parent), position, position)
+        parent.children.insert(position, node)
+        for row in range(position, len(parent.children)):
+            parent.children[row].row = row
+        if notify and parent.fetched:
+            self.endInsertRows()
+
+        self._nodes[node_key] = node
+        return node
+
+    def _insert_route(self, route: MonthlyDataRoute, notify: bool = True):
+        city = config.CITIES.get(route.city_id)
+        city_node = self._ensure_child(self._root, ('city', route.city_id), city.name if city else route.city_id,
+                                       notify=notify)
+        group_text = (f"{config.PRODUCTS[route.product].name}, "
+                      f"{config.BEARINGS.get(route.bearing, f'{route.bearing}°')}, "
+                      f"{config.MONTHS.get(route.month, f'Месяц {route.month}')}")
+        group_sort_key = PRODUCT_ORDER.get(route.product, len(PRODUCT_ORDER)), route.bearing, route.month
+        group_node = self._ensure_child(city_node, ('group', route.city_id, route.product, route.bearing, route.month),
+                                        group_text, sort_key=group_sort_key, notify=notify)
+        self._ensure_child(group_node, ('route', route.key), f"Данные за {route.year} год", sort_key=route.year,
+                           route=route, notify=notify)
+
+    def add_route(self, route: MonthlyDataRoute):
+        if not route.densities:
+            return
+        key = route.key
+        if self._routes.get(key) is route:
+            return
+        self._routes[key] = route
+        if key not in self._search_text:
+            self._search_text[key] = self._describe(route)
+        if not self._matches(key):
+            return
+
+        node = self._nodes.get(('route', key))
+        if node is None:
+            self._insert_route(route)
+        else:
+            node.route = route
+            index = self._index_of(node)
+            self.dataChanged.emit(index, index)
+
+    def add_routes(self, routes: Iterable[MonthlyDataRoute]):
+        for route in routes:
+            self.add_route(route)
+
+    def clear(self):
+        self.beginResetModel()
+        self._root.children = []
+        self._nodes = {}
+        self._routes = {}
+        self._search_text = {}
+        self.endResetModel()
+
+    def set_filter(self, text: str):
+        self._filter_terms = text.lower().split()
+        self.beginResetModel()
+        self._root.children = []
+        self._nodes = {}
+        for key, route in self._routes.items():
+            if self._matches(key):
+                self._insert_route(route, notify=False)
+        self.endResetModel()